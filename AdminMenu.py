@@ -1,4 +1,5 @@
 import tkinter as tk
+import assets
 
 def center_window(window, width=650, height=500):
     screen_width = window.winfo_screenwidth()
@@ -81,7 +82,7 @@ def AdminMenu():
     
     # Try to set icon
     try:
-        root.iconphoto(False, tk.PhotoImage(file="icon.png"))
+        root.iconphoto(False, assets.icon(root))
     except:
         pass
     
@@ -172,6 +173,10 @@ def AdminMenu():
     back_btn.bind("<Enter>", on_enter)
     back_btn.bind("<Leave>", on_leave)
     
+    # Put stock back on the shelf as rentals end
+    import return_scheduler
+    return_scheduler.start(root)
+    
     root.mainloop()
 
 # If you want to test the AdminMenu directly
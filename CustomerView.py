@@ -1,6 +1,8 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
 import database_schema as db
+from tree_pager import TreePager
+import assets
 
 def center_window(window, width=650, height=500):
     screen_width = window.winfo_screenwidth()
@@ -27,23 +29,30 @@ def CustomerView(parent_window=None):
             btn.bind("<Enter>", on_enter)
             btn.bind("<Leave>", on_leave)
     
-    def load_customer_data():
-        # Clear existing data
-        for item in tree.get_children():
-            tree.delete(item)
-        
-        # Load customers
-        customers = db.load_customers()
+    def load_customer_data(customers=None):
+        # Without a list, page through the customers by surname as the user
+        # scrolls; callers can pass a list to show every one of them
+        if customers is None:
+            pager.reset()
+            return
         
-        # Sort by last name
+        pager.clear()
         customers.sort(key=lambda x: x.surname.lower())
-        
-        # Add customer data with tags
         for customer in customers:
-            # Insert with customer ID as tag
-            tree.insert("", "end", 
-                       values=(customer.firstname, customer.surname, customer.phone),
-                       tags=(str(customer.customer_id),))
+            insert_customer_row(customer)
+    
+    def fetch_customer_page(after, limit):
+        return db.load_customers_page(after=after, limit=limit)
+    
+    def insert_customer_row(customer, index="end"):
+        # Insert with customer ID as iid and tag
+        tree.insert("", index, iid=str(customer.customer_id),
+                   values=(customer.firstname, customer.surname, customer.phone),
+                   tags=(str(customer.customer_id),))
+    
+    def on_customer_change(op, name, key, record):
+        # Show changes from any terminal as they happen
+        pager.apply_change(op, key, record)
     
     def on_item_select(event):
         selected = tree.selection()
@@ -75,8 +84,7 @@ def CustomerView(parent_window=None):
         surname = item['values'][1]
         
         # Check if customer has any rentals
-        rentals = db.load_rentals()
-        customer_rentals = [r for r in rentals if r.customer_id == customer_id]
+        customer_rentals = db.find_rentals(customer_id=customer_id)
         
         if customer_rentals:
             rental_count = len(customer_rentals)
@@ -98,15 +106,18 @@ def CustomerView(parent_window=None):
             if not confirm:
                 return
         
-        # Delete from database
-        customers = db.load_customers()
-        customers = [c for c in customers if c.customer_id != customer_id]
-        db.save_customers(customers)
+        # Delete customer and cancel their rentals together, so the stock
+        # they had out goes back on the shelf
+        def work(tx):
+            tx.delete("customers", customer_id)
+            for rental in customer_rentals:
+                db.cancel_in(tx, rental.rental_id)
         
-        # Also delete customer's rentals if they exist
-        if customer_rentals:
-            rentals = [r for r in rentals if r.customer_id != customer_id]
-            db.save_rentals(rentals)
+        try:
+            db.run_transaction(work)
+        except db.ConflictError:
+            messagebox.showerror("Error", "Stock is being changed in another terminal - please try again.")
+            return
         
         # Update treeview
         tree.delete(selected[0])
@@ -134,21 +145,14 @@ def CustomerView(parent_window=None):
         customer_id = int(item['tags'][0])
         
         # Find customer details
-        customers = db.load_customers()
-        rentals = db.load_rentals()
-        
-        customer = None
-        for c in customers:
-            if c.customer_id == customer_id:
-                customer = c
-                break
+        customer = db.get_customer(customer_id)
         
         if not customer:
             messagebox.showerror("Error", "Customer not found!")
             return
         
-        # Find customer's rentals
-        customer_rentals = [r for r in rentals if r.customer_id == customer_id]
+        # Find customer's rentals, including archived ones
+        customer_rentals = db.customer_history(customer_id)
         
         # Build details string
         details = f"CUSTOMER DETAILS\n\n"
@@ -160,7 +164,6 @@ def CustomerView(parent_window=None):
         
         # Add rental history
         if customer_rentals:
-            customer_rentals.sort(key=lambda x: x.start_date, reverse=True)
             for i, rental in enumerate(customer_rentals[:10], 1):  # Show last 10 rentals
                 # Format dates
                 if hasattr(rental.start_date, 'strftime'):
@@ -183,13 +186,14 @@ def CustomerView(parent_window=None):
         # Clear current selection
         tree.selection_remove(tree.selection())
         
-        # CRITICAL: RELOAD ALL DATA FIRST
-        load_customer_data()
-        
-        # If no search criteria, show ALL items
+        # If no search criteria, go back to paging through everything
         if not firstname_filter and not surname_filter and not phone_filter:
+            load_customer_data()
             return
         
+        # CRITICAL: RELOAD ALL DATA FIRST
+        load_customer_data(db.load_customers())
+        
         # Hide non-matching items
         for child in tree.get_children():
             item = tree.item(child)
@@ -225,6 +229,8 @@ def CustomerView(parent_window=None):
                 tree.detach(child) 
     
     def sort_treeview(col, reverse):
+        # Every row has to be loaded to sort on another column
+        pager.load_all()
         data = [(tree.set(child, col), child) for child in tree.get_children()]
         
         # Sort alphabetically
@@ -250,7 +256,7 @@ def CustomerView(parent_window=None):
     
     # Set icon
     try:
-        root.iconphoto(False, tk.PhotoImage(file="icon.png"))
+        root.iconphoto(False, assets.icon(root))
     except:
         pass
     
@@ -352,7 +358,8 @@ def CustomerView(parent_window=None):
     
     # Add scrollbar
     scrollbar = ttk.Scrollbar(tree_frame, orient="vertical", command=tree.yview)
-    tree.configure(yscrollcommand=scrollbar.set)
+    pager = TreePager(tree, scrollbar, fetch_customer_page, insert_customer_row,
+                      sort_key=db.page_sort_key("customers", "name"))
     
     tree.pack(side="left", fill="both", expand=True)
     scrollbar.pack(side="right", fill="y")
@@ -378,6 +385,7 @@ def CustomerView(parent_window=None):
     
     # Load initial data
     load_customer_data()
+    db.watch_changes(root, on_customer_change, ["customers"])
     
     if not parent_window:
         root.mainloop()
@@ -403,7 +411,7 @@ def SearchWindow(parent_window, apply_callback):
     center_window(search_root, 650, 500)
     
     try:
-        search_root.iconphoto(False, tk.PhotoImage(file="icon.png"))
+        search_root.iconphoto(False, assets.icon(search_root))
     except:
         pass
     
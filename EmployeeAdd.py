@@ -1,12 +1,9 @@
 import tkinter as tk
 from tkinter import messagebox
 import random
-import pickle
-import hashlib
-import os
-
-# User data file
-PASS_HASHED = "passHash.pkl"
+import assets
+import auth_service
+import user_directory
 
 # List of random nouns for password generation
 RANDOM_NOUNS = [
@@ -18,22 +15,6 @@ RANDOM_NOUNS = [
     "phoenix", "dragon", "unicorn", "griffin", "pegasus", "mermaid", "centaur"
 ]
 
-def hash_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
-
-def load_users():
-    if os.path.exists(PASS_HASHED):
-        try:
-            with open(PASS_HASHED, 'rb') as f:
-                return pickle.load(f)
-        except:
-            return {}
-    return {}
-
-def save_users(users):
-    with open(PASS_HASHED, 'wb') as f:
-        pickle.dump(users, f)
-
 def center_window(window, width=650, height=500):
     screen_width = window.winfo_screenwidth()
     screen_height = window.winfo_screenheight()
@@ -97,17 +78,14 @@ def EmployeeAdd(parent_window=None):
         username = generate_username()
         password = generate_password()
         
-        # Check if username already exists
-        users = load_users()
-        
         # Ensure username is unique (should be rare but just in case)
-        while username in users:
+        while user_directory.user_exists(username):
             username = generate_username()
         
         # Create credentials popup
-        show_credentials_popup(firstname, surname, username, password, users)
+        show_credentials_popup(firstname, surname, username, password)
     
-    def show_credentials_popup(firstname, surname, username, password, users):
+    def show_credentials_popup(firstname, surname, username, password):
         # Create popup window
         popup = tk.Toplevel(root)
         popup.title("Employee Credentials")
@@ -123,7 +101,7 @@ def EmployeeAdd(parent_window=None):
         
         # Set icon
         try:
-            popup.iconphoto(False, tk.PhotoImage(file="icon.png"))
+            popup.iconphoto(False, assets.icon(popup))
         except:
             pass
         
@@ -175,24 +153,34 @@ def EmployeeAdd(parent_window=None):
         
         # OK Button
         def save_and_close():
-            # Save employee to database
-            users[username] = {
-                "password_hash": hash_password(password),
-                "role": "employee",
-                "firstname": firstname,
-                "surname": surname
-            }
-            
-            save_users(users)
-            
+            if ok_button["state"] == "disabled":
+                return
+            # Save employee to database - hashing is slow, so it runs off the Tk thread
+            ok_button.config(state="disabled")
+            auth_service.submit(root, lambda: user_directory.add_user(
+                                    username, password, "employee",
+                                    firstname=firstname, surname=surname),
+                                (), saved, save_failed)
+        
+        def saved(added):
             # Close popup
             popup.destroy()
             
+            if not added:
+                # Another terminal took the username while the popup was open
+                messagebox.showerror("Error", f"Username '{username}' was just taken. Please add the employee again.")
+                return
+            
             # Clear form and focus on first name for next entry
             firstname_entry.delete(0, tk.END)
             surname_entry.delete(0, tk.END)
             firstname_entry.focus_set()
         
+        def save_failed(error):
+            # Leave the popup open so the details can be saved again
+            ok_button.config(state="normal")
+            messagebox.showerror("Error", f"Failed to save employee: {error}")
+        
         ok_button = tk.Button(popup, text="OK", 
                              font=("Helvetica", 12, "bold"),
                              bg="#8acbcb",
@@ -231,7 +219,7 @@ def EmployeeAdd(parent_window=None):
     
     # Set icon
     try:
-        root.iconphoto(False, tk.PhotoImage(file="icon.png"))
+        root.iconphoto(False, assets.icon(root))
     except:
         pass
     
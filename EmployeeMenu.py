@@ -1,4 +1,5 @@
 import tkinter as tk
+import assets
 
 def center_window(window, width=650, height=500):
     screen_width = window.winfo_screenwidth()
@@ -38,7 +39,7 @@ def EmployeeMenu():
     
     # Try to set icon
     try:
-        root.iconphoto(False, tk.PhotoImage(file="icon.png"))
+        root.iconphoto(False, assets.icon(root))
     except:
         pass
     
@@ -126,6 +127,10 @@ def EmployeeMenu():
     # Make sure window is fully visible
     root.update_idletasks()
     
+    # Put stock back on the shelf as rentals end
+    import return_scheduler
+    return_scheduler.start(root)
+    
     root.mainloop()
 
 # If you want to test the EmployeeMenu directly
@@ -1,27 +1,11 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
-import hashlib
-import pickle
-import os
+import assets
+import auth_service
+import user_directory
 
-# User data file
-PASS_HASHED = "passHash.pkl"
-
-def hash_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
-
-def load_users():
-    if os.path.exists(PASS_HASHED):
-        try:
-            with open(PASS_HASHED, 'rb') as f:
-                return pickle.load(f)
-        except:
-            return {}
-    return {}
-
-def save_users(users):
-    with open(PASS_HASHED, 'wb') as f:
-        pickle.dump(users, f)
+# Sort options and the user record field each one orders by
+SORT_FIELDS = {"First Name": "firstname", "Surname": "surname", "Username": "username"}
 
 def center_window(window, width=650, height=500):
     screen_width = window.winfo_screenwidth()
@@ -35,7 +19,7 @@ def center_window(window, width=650, height=500):
 def EmployeeView(parent_window=None):
     
     # Variables for sorting
-    sort_by_options = ["First Name", "Surname", "Username"]
+    sort_by_options = list(SORT_FIELDS)
     current_sort = tk.StringVar(value="First Name")
     sort_order = tk.BooleanVar(value=False)  # False = ascending, True = descending
     
@@ -55,40 +39,19 @@ def EmployeeView(parent_window=None):
             btn.bind("<Leave>", on_leave)
     
     def load_employee_data():
-
-        users = load_users()
         
         # Clear existing data
         for item in tree.get_children():
             tree.delete(item)
         
-        # Collect employee data
-        employees = []
-        for username, data in users.items():
-            if data.get("role") == "employee":
-                employees.append({
-                    "firstname": data.get("firstname", ""),
-                    "surname": data.get("surname", ""),
-                    "username": username,
-                    "password": "••••••••"  # Hide password for security
-                })
-        
-        # Sort employees
-        sort_key = current_sort.get()
-        reverse_order = sort_order.get()
+        # Employees come from the directory's role index, already sorted
+        sort_field = SORT_FIELDS[current_sort.get()]
+        employees = user_directory.users_with_role("employee", sort_field, sort_order.get())
         
-        if sort_key == "First Name":
-            employees.sort(key=lambda x: x["firstname"].lower(), reverse=reverse_order)
-        elif sort_key == "Surname":
-            employees.sort(key=lambda x: x["surname"].lower(), reverse=reverse_order)
-        elif sort_key == "Username":
-            employees.sort(key=lambda x: x["username"].lower(), reverse=reverse_order)
-        elif sort_key == "Password":
-            employees.sort(key=lambda x: x["password"], reverse=reverse_order)
-        
-        # Add sorted data to treeview
-        for emp in employees:
-            tree.insert("", "end", values=(emp["firstname"], emp["surname"], emp["username"], emp["password"]))
+        # Add sorted data to treeview (password hidden for security)
+        for username, data in employees:
+            tree.insert("", "end", values=(data.get("firstname", ""), data.get("surname", ""),
+                                           username, "••••••••"))
     
     def on_item_select(event):
 
@@ -120,10 +83,7 @@ def EmployeeView(parent_window=None):
         )
         
         if confirm:
-            users = load_users()
-            if username in users:
-                del users[username]
-                save_users(users)
+            if user_directory.delete_user(username):
                 messagebox.showinfo("Success", f"Employee {firstname} {surname} deleted successfully.")
                 load_employee_data()
                 delete_btn.config(state="disabled")
@@ -202,7 +162,7 @@ def EmployeeView(parent_window=None):
     
     # Set icon
     try:
-        root.iconphoto(False, tk.PhotoImage(file="icon.png"))
+        root.iconphoto(False, assets.icon(root))
     except:
         pass
     
@@ -377,7 +337,7 @@ def SearchWindow(parent_window, apply_callback):
     
     # Set icon
     try:
-        search_root.iconphoto(False, tk.PhotoImage(file="icon.png"))
+        search_root.iconphoto(False, assets.icon(search_root))
     except:
         pass
     
@@ -535,8 +495,7 @@ def ChangeCredentialsWindow(parent_window, username, firstname, surname, reload_
             return
         
         # Check if new username already exists
-        users = load_users()
-        if new_user1 in users:
+        if user_directory.user_exists(new_user1):
             messagebox.showerror("Error", f"Username '{new_user1}' already exists. Please choose a different username.")
             new_user_entry1.delete(0, tk.END)
             new_user_entry2.delete(0, tk.END)
@@ -550,16 +509,11 @@ def ChangeCredentialsWindow(parent_window, username, firstname, surname, reload_
         )
         
         if confirm:
-            # Get employee data
-            employee_data = users[username_container["value"]]
-            
-            # Create new entry with new username
-            users[new_user1] = employee_data
-            
-            # Delete old entry
-            del users[username_container["value"]]
-            
-            save_users(users)
+            # Moves the account, unless someone else took the name meanwhile
+            if not user_directory.rename_user(username_container["value"], new_user1):
+                messagebox.showerror("Error", f"Could not change username to '{new_user1}'. "
+                                              "It may have just been taken, or the employee was deleted.")
+                return
             
             messagebox.showinfo("Success", f"Username changed successfully to '{new_user1}'.")
             
@@ -599,22 +553,29 @@ def ChangeCredentialsWindow(parent_window, username, firstname, surname, reload_
         )
         
         if confirm:
-            users = load_users()
+            # Hashing is slow, so it runs off the Tk thread
+            change_pass_btn.config(state="disabled")
+            auth_service.submit(cred_root, user_directory.set_password,
+                                (username_container["value"], new_pass1), password_changed,
+                                password_change_failed)
+    
+    def password_changed(changed):
+        change_pass_btn.config(state="normal")
+        if changed:
+            messagebox.showinfo("Success", f"Password changed successfully for '{username_container['value']}'.")
             
-            if username_container["value"] in users:
-                users[username_container["value"]]["password_hash"] = hash_password(new_pass1)
-                save_users(users)
-                
-                messagebox.showinfo("Success", f"Password changed successfully for '{username_container['value']}'.")
-                
-                # Clear fields
-                new_pass_entry1.delete(0, tk.END)
-                new_pass_entry2.delete(0, tk.END)
-                
-                # Reload data in main window
-                reload_callback()
-            else:
-                messagebox.showerror("Error", "Employee not found in database.")
+            # Clear fields
+            new_pass_entry1.delete(0, tk.END)
+            new_pass_entry2.delete(0, tk.END)
+            
+            # Reload data in main window
+            reload_callback()
+        else:
+            messagebox.showerror("Error", "Employee not found in database.")
+    
+    def password_change_failed(error):
+        change_pass_btn.config(state="normal")
+        messagebox.showerror("Error", f"Failed to change password: {error}")
     
     # Create credentials window
     cred_root = tk.Toplevel(parent_window)
@@ -625,7 +586,7 @@ def ChangeCredentialsWindow(parent_window, username, firstname, surname, reload_
     
     # Set icon
     try:
-        cred_root.iconphoto(False, tk.PhotoImage(file="icon.png"))
+        cred_root.iconphoto(False, assets.icon(cred_root))
     except:
         pass
     
@@ -1,70 +1,8 @@
 import tkinter as tk
 from tkinter import messagebox
-from PIL import Image, ImageTk
-import pickle
-import hashlib
-import os
-
-# User data file
-PASS_HASHED = "passHash.pkl"
-
-def hash_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
-
-def load_users():
-    if os.path.exists(PASS_HASHED):
-        try:
-            with open(PASS_HASHED, 'rb') as f:
-                return pickle.load(f)
-        except:
-            return {}
-    return {}
-
-def create_default_accounts():
-    users = load_users()
-    updated = False
-    
-    # Always ensure admin account exists
-    if "admin" not in users:
-        users["admin"] = {
-            "password_hash": hash_password("admin123"),
-            "role": "admin"
-        }
-        updated = True
-        print("Admin account created/updated")
-    
-    # Always ensure employee account exists
-    if "employee" not in users:
-        users["employee"] = {
-            "password_hash": hash_password("emp123"),
-            "role": "employee"
-        }
-        updated = True
-        print("Employee account created/updated")
-    
-    # Save if any updates were made
-    if updated:
-        with open(PASS_HASHED, 'wb') as f:
-            pickle.dump(users, f)
-        print("Default accounts:")
-        print("- Admin: admin / admin123")
-        print("- Employee: employee / emp123")
-    else:
-        print("Default accounts already exist")
-
-def authenticate_user(username, password):
-    users = load_users()
-    
-    if username not in users:
-        return False, "Invalid username or password"
-    
-    stored_hash = users[username]["password_hash"]
-    input_hash = hash_password(password)
-    
-    if stored_hash == input_hash:
-        return True, users[username]["role"]
-    else:
-        return False, "Invalid username or password"
+import assets
+import auth_service
+from user_directory import create_default_accounts, authenticate_user, load_users
 
 def center_window(window, width=650, height=500):
     screen_width = window.winfo_screenwidth()
@@ -85,7 +23,7 @@ def Login():
     
     # Set icon
     try:
-        root.iconphoto(False, tk.PhotoImage(file="icon.png"))
+        root.iconphoto(False, assets.icon(root))
     except:
         pass
     
@@ -104,11 +42,9 @@ def Login():
     image_frame = tk.Frame(main_frame, bg="#152e41")
     image_frame.pack(pady=(20, 10))
     
-    # Load and display image
+    # Load and display image (resized once, then read from the cache)
     try:
-        img = Image.open("logo.png")
-        img = img.resize((180, 180), Image.Resampling.LANCZOS)
-        photo = ImageTk.PhotoImage(img)
+        photo = assets.logo(root)
         
         image_label = tk.Label(image_frame, image=photo, bg="#152e41")
         image_label.image = photo
@@ -182,9 +118,12 @@ def Login():
         # Debug: Show what's being checked
         print(f"Attempting login with: {username}")
         
-        # Authenticate user
-        success, result = authenticate_user(username, password)
-        
+        # Authenticate user - hashing is slow, so it runs off the Tk thread
+        login_button.config(state="disabled", text="CHECKING...")
+        auth_service.submit(root, authenticate_user, (username, password),
+                            lambda outcome: finish_login(username, *outcome), login_failed)
+    
+    def finish_login(username, success, result):
         if success:
             print(f"Login successful - Username: {username}, Role: {result}")
             root.destroy()
@@ -201,8 +140,13 @@ def Login():
             else:
                 error_label.config(text="Unknown role - contact administrator")
         else:
+            login_button.config(state="normal", text="LOGIN")
             error_label.config(text=result)
     
+    def login_failed(error):
+        login_button.config(state="normal", text="LOGIN")
+        error_label.config(text=f"Could not check the password: {error}")
+    
     login_button = tk.Button(login_frame, text="LOGIN", font=("Helvetica", 14, "bold"), 
                             command=submit_login, bg="#8acbcb", fg="white", width=25, height=2)
     login_button.pack(pady=20)
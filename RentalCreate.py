@@ -4,6 +4,7 @@ from tkinter import ttk, messagebox
 from datetime import datetime, timedelta
 from tkcalendar import DateEntry
 import database_schema as db
+import assets
 
 def center_window(window, width=650, height=500):
     screen_width = window.winfo_screenwidth()
@@ -115,7 +116,7 @@ class RentalCreate:
         
         # Set icon
         try:
-            self.root.iconphoto(False, tk.PhotoImage(file="icon.png"))
+            self.root.iconphoto(False, assets.icon(self.root))
         except:
             pass
         
@@ -381,13 +382,11 @@ class RentalCreate:
         
         # Item dropdown
         self.items = db.load_items()
-        item_names = [f"{item.name} - £{item.price:.2f} ({item.quantity} available)" 
-                     for item in self.items]
         
         self.item_var = tk.StringVar()
         self.item_dropdown = ttk.Combobox(item_frame,
                                          textvariable=self.item_var,
-                                         values=item_names,
+                                         values=self.item_names(),
                                          state="readonly",
                                          width=30)
         self.item_dropdown.pack(side="left", padx=(0, 10))
@@ -444,6 +443,31 @@ class RentalCreate:
                                    command=self.remove_item)
         self.remove_btn.pack()
     
+    def chosen_dates(self):
+        start_date = self.start_date_entry.get_date()
+        end_date = self.end_date_entry.get_date()
+        return start_date, max(start_date, end_date)
+    
+    def free_units(self, items):
+        # {item_id: units free on every day of the chosen dates}
+        try:
+            start_date, end_date = self.chosen_dates()
+        except ValueError:
+            start_date = end_date = datetime.now().date()
+        return db.item_availability(items, start_date, end_date)
+    
+    def item_names(self):
+        free = self.free_units(self.items)
+        return [f"{item.name} - £{item.price:.2f} ({max(free[item.item_id], 0)} available)"
+                for item in self.items]
+    
+    def refresh_item_names(self):
+        # Availability depends on the dates, so relabel when they change
+        selected_index = self.item_dropdown.current()
+        self.item_dropdown['values'] = self.item_names()
+        if selected_index != -1:
+            self.item_dropdown.current(selected_index)
+    
     def on_start_date_selected(self, event=None):
         try:
             start_date = self.start_date_entry.get_date()
@@ -454,8 +478,9 @@ class RentalCreate:
             # Set minimum date to start date
             self.end_date_entry.config(mindate=start_date)
             
-            # Update total in case days changed
+            # Update total and availability in case days changed
             self.update_total()
+            self.refresh_item_names()
         except Exception as e:
             print(f"Error setting end date: {e}")
     
@@ -469,8 +494,9 @@ class RentalCreate:
                 messagebox.showwarning("Invalid Date", "End date cannot be before start date!")
                 self.end_date_entry.set_date(start_date)
             
-            # Update total in case days changed
+            # Update total and availability in case days changed
             self.update_total()
+            self.refresh_item_names()
         except Exception as e:
             print(f"Error validating end date: {e}")
     
@@ -557,10 +583,13 @@ class RentalCreate:
         selected_item = self.items[selected_index]
         quantity = int(self.quantity_var.get())
         
-        # Check availability
-        if quantity > selected_item.quantity:
+        # Check availability for the chosen dates, counting what's already added
+        available = db.get_item(selected_item.item_id)
+        free = self.free_units([available])[selected_item.item_id] if available else 0
+        free -= self.selected_items.get(selected_item.item_id, 0)
+        if quantity > free:
             messagebox.showerror("Insufficient Stock", 
-                               f"Only {selected_item.quantity} {selected_item.name} available.")
+                               f"Only {max(free, 0)} more {selected_item.name} available for those dates.")
             return
         
         # Add to selected items
@@ -728,52 +757,25 @@ class RentalCreate:
         end_date = self.end_date_entry.get_date()
         days = (end_date - start_date).days + 1
         
-        # Check if customer exists, if not create new
-        customers = db.load_customers()
-        customer_id = None
+        # Customer, stock and rental are committed together from the current
+        # stored quantities, retrying if another terminal books at the same time
+        try:
+            rental = db.create_rental_record(firstname, lastname, phone, self.employee,
+                                             start_date, end_date, self.selected_items)
+        except ValueError as e:
+            self.show_error(str(e))
+            return
+        except db.ConflictError:
+            self.show_error("Stock is being changed in another terminal - please try again.")
+            return
+        rental_id = rental.rental_id
+        total = rental.total_price
         
-        for customer in customers:
-            if (customer.firstname.lower() == firstname.lower() and 
-                customer.surname.lower() == lastname.lower() and 
-                customer.phone == phone):
-                customer_id = customer.customer_id
-                break
-        
-        if customer_id is None:
-            # Create new customer
-            customer_id = db.get_next_customer_id()
-            new_customer = db.Customer(customer_id, firstname, lastname, phone)
-            customers.append(new_customer)
-            db.save_customers(customers)
-        
-        # Calculate total and update item quantities
-        total = 0.0
         item_details = []
-        
-        for item_id, quantity in self.selected_items.items():
-            for item in self.items:
-                if item.item_id == item_id:
-                    item_total = item.price * quantity * days
-                    total += item_total
-                    item_details.append(f"- {item.name} x{quantity}: £{item_total:.2f}")
-                    
-                    # Update item quantity
-                    item.quantity -= quantity
-                    break
-        
-        # Save updated items
-        db.save_items(self.items)
-
-        # Create rental with creation date
-        rental_id = db.get_next_rental_id()
-        rental = db.Rental(rental_id, customer_id, self.employee, 
-                        start_date, end_date, self.selected_items, total,
-                        datetime.now())  # Add creation date
-        
-        # Save rental
-        rentals = db.load_rentals()
-        rentals.append(rental)
-        db.save_rentals(rentals)
+        for item_id, quantity in rental.items.items():
+            item = db.get_item(item_id)
+            if item:
+                item_details.append(f"- {item.name} x{quantity}: £{item.price * quantity * days:.2f}")
         
         # Show success message
         success_msg = f"Rental Created Successfully!\n\n"
@@ -820,9 +822,7 @@ class RentalCreate:
         
         # Reload items (quantities may have changed)
         self.items = db.load_items()
-        item_names = [f"{item.name} - £{item.price:.2f} ({item.quantity} available)" 
-                     for item in self.items]
-        self.item_dropdown['values'] = item_names
+        self.item_dropdown['values'] = self.item_names()
         
         # Reset dropdown selection
         self.item_dropdown.set('')
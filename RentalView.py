@@ -3,6 +3,8 @@ from tkinter import ttk, messagebox
 from datetime import datetime
 import database_schema as db
 import RentalCreate
+from tree_pager import TreePager
+import assets
 
 def center_window(window, width=650, height=500):
     screen_width = window.winfo_screenwidth()
@@ -29,32 +31,37 @@ def RentalView(parent_window=None):
             btn.bind("<Enter>", on_enter)
             btn.bind("<Leave>", on_leave)
     
-    def load_rental_data():
-        # Clear existing data
-        for item in tree.get_children():
-            tree.delete(item)
+    def load_rental_data(rentals=None):
+        # Without a list, page through every rental (newest first) as the
+        # user scrolls; callers can pass an already filtered list instead
+        if rentals is None:
+            pager.reset()
+            return
         
-        # Load rentals
-        rentals = db.load_rentals()
-        customers = db.load_customers()
+        pager.clear()
+        for rental in rentals:
+            insert_rental_row(rental)
+    
+    def fetch_rental_page(after, limit):
+        return db.load_rentals_page(after=after, limit=limit, descending=True)
+    
+    def insert_rental_row(rental, index="end"):
+        customer = db.get_customer(rental.customer_id)
+        if customer:
+            customer_name = f"{customer.surname}, {customer.firstname}"
+        else:
+            customer_name = f"Customer ID: {rental.customer_id}"
         
-        # Create customer lookup dictionary
-        customer_dict = {c.customer_id: c for c in customers}
+        date_range = f"{rental.start_date.strftime('%d/%m/%y')} - {rental.end_date.strftime('%d/%m/%y')}"
         
-        # Add rental data with tags
-        for rental in rentals:
-            customer = customer_dict.get(rental.customer_id)
-            if customer:
-                customer_name = f"{customer.surname}, {customer.firstname}"
-            else:
-                customer_name = f"Customer ID: {rental.customer_id}"
-            
-            date_range = f"{rental.start_date.strftime('%d/%m/%y')} - {rental.end_date.strftime('%d/%m/%y')}"
-            
-            # Insert with rental ID as tag
-            tree.insert("", "end", 
-                       values=(date_range, customer_name, f"£{rental.total_price:.2f}", rental.employee),
-                       tags=(str(rental.rental_id),))
+        # Insert with rental ID as iid and tag
+        tree.insert("", index, iid=str(rental.rental_id),
+                   values=(date_range, customer_name, f"£{rental.total_price:.2f}", rental.employee),
+                   tags=(str(rental.rental_id),))
+    
+    def on_rental_change(op, name, key, record):
+        # Show bookings, edits and deletes from any terminal as they happen
+        pager.apply_change(op, key, record)
     
     def on_item_select(event):
         selected = tree.selection()
@@ -93,10 +100,8 @@ def RentalView(parent_window=None):
         )
         
         if confirm:
-            # Delete from database
-            rentals = db.load_rentals()
-            rentals = [r for r in rentals if r.rental_id != rental_id]
-            db.save_rentals(rentals)
+            # Delete from database, putting the stock back if it's still out
+            db.cancel_rental(rental_id)
             
             # Update treeview
             tree.delete(selected[0])
@@ -122,26 +127,15 @@ def RentalView(parent_window=None):
         rental_id = int(item['tags'][0])
         
         # Find rental details
-        rentals = db.load_rentals()
-        customers = db.load_customers()
+        rental = db.get_rental(rental_id)
         items_db = db.load_items()
         
-        rental = None
-        for r in rentals:
-            if r.rental_id == rental_id:
-                rental = r
-                break
-        
         if not rental:
             messagebox.showerror("Error", "rental not found!")
             return
         
         # Find customer
-        customer = None
-        for c in customers:
-            if c.customer_id == rental.customer_id:
-                customer = c
-                break
+        customer = db.get_customer(rental.customer_id)
         
         if not customer:
             messagebox.showerror("Error", "Customer not found!")
@@ -170,26 +164,14 @@ def RentalView(parent_window=None):
         rental_id = int(item['tags'][0])
         
         # Find rental details
-        rentals = db.load_rentals()
-        customers = db.load_customers()
-        items_db = db.load_items()
-        
-        rental = None
-        for r in rentals:
-            if r.rental_id == rental_id:
-                rental = r
-                break
+        rental = db.get_rental(rental_id)
         
         if not rental:
             messagebox.showerror("Error", "rental not found!")
             return
         
         # Find customer
-        customer = None
-        for c in customers:
-            if c.customer_id == rental.customer_id:
-                customer = c
-                break
+        customer = db.get_customer(rental.customer_id)
         
         # Build details string
         details = f"RENTAL DETAILS\n\n"
@@ -220,73 +202,53 @@ def RentalView(parent_window=None):
         # Add items
         if hasattr(rental, 'items') and rental.items:
             for item_id, quantity in rental.items.items():
-                for item in items_db:
-                    if item.item_id == item_id:
-                        item_total = item.price * quantity
-                        details += f"- {item.name} x{quantity}: £{item_total:.2f} (£{item.price:.2f} each)\n"
-                        break
+                item = db.get_item(item_id)
+                if item:
+                    item_total = item.price * quantity
+                    details += f"- {item.name} x{quantity}: £{item_total:.2f} (£{item.price:.2f} each)\n"
         else:
             details += "- No items found for this rental\n"
         
         messagebox.showinfo("rental Details", details)
     
+    def parse_date_filter(date_filter):
+        # "dd/mm/yy" or "dd/mm/yy - dd/mm/yy" -> (first, last) dates, or None
+        parts = [part.strip() for part in date_filter.split("-")]
+        if len(parts) not in (1, 2):
+            return None
+        try:
+            dates = [datetime.strptime(part, "%d/%m/%y").date() for part in parts]
+        except ValueError:
+            return None
+        return dates[0], dates[-1]
+    
     def apply_search_filter(firstname_filter, lastname_filter, date_filter, employee_filter):
         # Clear current selection
         tree.selection_remove(tree.selection())
         
-        # CRITICAL: RELOAD ALL DATA FIRST to reset the view
-        load_rental_data()
+        date_range = parse_date_filter(date_filter) if date_filter else None
+        if date_range:
+            # Rentals running on that date (or range), from the date index
+            rentals = db.rentals_overlapping(*date_range)
+            if firstname_filter or lastname_filter or employee_filter:
+                matching = {r.rental_id for r in
+                            db.search_rentals(firstname_filter, lastname_filter, employee_filter)}
+                rentals = [r for r in rentals if r.rental_id in matching]
+            load_rental_data(rentals)
+            return
+        
+        # Name and employee filters are pushed down to the database
+        rentals = db.search_rentals(firstname_filter, lastname_filter, employee_filter)
+        load_rental_data(rentals)
         
-        # If no search criteria, show ALL items (already loaded)
-        if not firstname_filter and not lastname_filter and not date_filter and not employee_filter:
+        if not date_filter:
             return
         
-        # Hide non-matching items
+        # Partial dates fall back to matching the displayed date text
+        date_str = date_filter.strip().lower()
         for child in tree.get_children():
-            item = tree.item(child)
-            item_values = item['values']
-            
-            # Skip items without proper values
-            if len(item_values) < 2:
-                tree.detach(child)
-                continue
-            
-            customer_info = str(item_values[1]).lower()
-            date_range = str(item_values[0]).lower()
-            employee_info = str(item_values[3]).lower() if len(item_values) > 3 else ""
-            
-            match = True
-            
-            # Check customer name (format: "Last, First")
-            if firstname_filter:
-                # Extract first name from "Last, First" format
-                parts = customer_info.split(',')
-                if len(parts) > 1:
-                    customer_firstname = parts[1].strip()
-                    if firstname_filter.lower() not in customer_firstname:
-                        match = False
-                else:
-                    match = False
-            
-            if lastname_filter:
-                # Extract last name from "Last, First" format
-                parts = customer_info.split(',')
-                if len(parts) > 0:
-                    customer_lastname = parts[0].strip()
-                    if lastname_filter.lower() not in customer_lastname:
-                        match = False
-                else:
-                    match = False
-            
-            if date_filter:
-                date_str = date_filter.strip().lower()
-                if date_str and date_str not in date_range:
-                    match = False
-            
-            if employee_filter and employee_filter.lower() not in employee_info:
-                match = False
-            
-            if not match:
+            date_range = str(tree.item(child)['values'][0]).lower()
+            if date_str and date_str not in date_range:
                 tree.detach(child)
     
     def go_back():
@@ -303,7 +265,7 @@ def RentalView(parent_window=None):
     
     # Set icon
     try:
-        root.iconphoto(False, tk.PhotoImage(file="icon.png"))
+        root.iconphoto(False, assets.icon(root))
     except:
         pass
     
@@ -416,7 +378,8 @@ def RentalView(parent_window=None):
     
     # Add scrollbar
     scrollbar = ttk.Scrollbar(tree_frame, orient="vertical", command=tree.yview)
-    tree.configure(yscrollcommand=scrollbar.set)
+    pager = TreePager(tree, scrollbar, fetch_rental_page, insert_rental_row,
+                      sort_key=db.page_sort_key("rentals", "date"), descending=True)
     
     tree.pack(side="left", fill="both", expand=True)
     scrollbar.pack(side="right", fill="y")
@@ -445,6 +408,7 @@ def RentalView(parent_window=None):
     
     # Load initial data
     load_rental_data()
+    db.watch_changes(root, on_rental_change, ["rentals"])
     
     if not parent_window:
         root.mainloop()
@@ -471,7 +435,7 @@ def SearchWindow(parent_window, apply_callback):
     center_window(search_root, 650, 500)
     
     try:
-        search_root.iconphoto(False, tk.PhotoImage(file="icon.png"))
+        search_root.iconphoto(False, assets.icon(search_root))
     except:
         pass
     
@@ -541,7 +505,7 @@ def SearchWindow(parent_window, apply_callback):
     lastname_entry.grid(row=3, column=0, pady=(0, 10), ipady=4)
     
     # Date
-    date_label = tk.Label(criteria_frame, text="DATE (dd/mm/yy)", **label_style)
+    date_label = tk.Label(criteria_frame, text="DATE (dd/mm/yy or dd/mm/yy - dd/mm/yy)", **label_style)
     date_label.grid(row=4, column=0, sticky="w", pady=(0, 2))
     
     date_entry = tk.Entry(criteria_frame, **entry_style)
@@ -617,7 +581,7 @@ class EditRentalWindow:
         
         # Set icon
         try:
-            self.root.iconphoto(False, tk.PhotoImage(file="icon.png"))
+            self.root.iconphoto(False, assets.icon(self.root))
         except:
             pass
         
@@ -862,19 +826,10 @@ class EditRentalWindow:
         item_frame.pack(fill="x", pady=(0, 10))
         
         # Item dropdown - include available quantities
-        item_names = []
-        for item in self.all_items:
-            # Adjust available quantity if item is already in rental
-            adjusted_qty = item.quantity
-            if item.item_id in self.original_rental.items:
-                adjusted_qty += self.original_rental.items[item.item_id]
-            
-            item_names.append(f"{item.name} - £{item.price:.2f} ({adjusted_qty} available)")
-        
         self.item_var = tk.StringVar()
         self.item_dropdown = ttk.Combobox(item_frame,
                                          textvariable=self.item_var,
-                                         values=item_names,
+                                         values=self.item_names(),
                                          state="readonly",
                                          width=30)
         self.item_dropdown.pack(side="left", padx=(0, 10))
@@ -939,11 +894,34 @@ class EditRentalWindow:
                                    command=self.remove_item)
         self.remove_btn.pack()
     
+    def free_units(self, items):
+        # {item_id: units free on every day of the chosen dates}, leaving
+        # out this rental's own booking
+        try:
+            start_date = self.start_date_entry.get_date()
+            end_date = max(start_date, self.end_date_entry.get_date())
+        except ValueError:
+            start_date, end_date = self.rental.start_date, self.rental.end_date
+        return db.item_availability(items, start_date, end_date, self.rental.rental_id)
+    
+    def item_names(self):
+        free = self.free_units(self.all_items)
+        return [f"{item.name} - £{item.price:.2f} ({max(free[item.item_id], 0)} available)"
+                for item in self.all_items]
+    
+    def refresh_item_names(self):
+        # Availability depends on the dates, so relabel when they change
+        selected_index = self.item_dropdown.current()
+        self.item_dropdown['values'] = self.item_names()
+        if selected_index != -1:
+            self.item_dropdown.current(selected_index)
+    
     def on_start_date_selected(self, event=None):
         try:
             start_date = self.start_date_entry.get_date()
             self.end_date_entry.config(mindate=start_date)
             self.update_total()
+            self.refresh_item_names()
         except Exception as e:
             print(f"Error setting end date: {e}")
     
@@ -957,6 +935,7 @@ class EditRentalWindow:
                 self.end_date_entry.set_date(start_date)
             
             self.update_total()
+            self.refresh_item_names()
         except Exception as e:
             print(f"Error validating end date: {e}")
     
@@ -970,15 +949,14 @@ class EditRentalWindow:
         selected_item = self.all_items[selected_index]
         quantity = int(self.quantity_var.get())
         
-        # Calculate available quantity (original + what was in rental)
-        available_qty = selected_item.quantity
-        if selected_item.item_id in self.original_rental.items:
-            available_qty += self.original_rental.items[selected_item.item_id]
-        
-        # Check availability
-        if quantity > available_qty:
+        # Check availability for the chosen dates, counting what's already
+        # in this rental
+        available = db.get_item(selected_item.item_id)
+        free = self.free_units([available])[selected_item.item_id] if available else 0
+        free -= self.selected_items.get(selected_item.item_id, 0)
+        if quantity > free:
             messagebox.showerror("Insufficient Stock", 
-                               f"Only {available_qty} {selected_item.name} available.")
+                               f"Only {max(free, 0)} more {selected_item.name} available for those dates.")
             return
         
         # Add to selected items
@@ -1073,69 +1051,18 @@ class EditRentalWindow:
             messagebox.showerror("Error", f"Invalid date: {str(e)}")
             return
         
-        # Calculate total
-        total = 0.0
-        days = (end_date - start_date).days + 1
-        
-        # First, return original items to stock
-        for item_id, quantity in self.original_rental.items.items():
-            for item in self.all_items:
-                if item.item_id == item_id:
-                    item.quantity += quantity
-                    break
-        
-        # Now deduct new items from stock and calculate total
-        for item_id, quantity in self.selected_items.items():
-            for item in self.all_items:
-                if item.item_id == item_id:
-                    # Check if enough stock
-                    if quantity > item.quantity:
-                        messagebox.showerror("Insufficient Stock", 
-                                           f"Not enough {item.name} in stock!")
-                        # Restore original items
-                        for orig_id, orig_qty in self.original_rental.items.items():
-                            for orig_item in self.all_items:
-                                if orig_item.item_id == orig_id:
-                                    orig_item.quantity -= orig_qty
-                                    break
-                        return
-                    
-                    item_total = item.price * quantity * days
-                    total += item_total
-                    item.quantity -= quantity
-                    break
-        
-        # Update customer info if changed
-        customers = db.load_customers()
-        customer_updated = False
-        for customer in customers:
-            if customer.customer_id == self.customer.customer_id:
-                if (customer.firstname != firstname or 
-                    customer.surname != lastname or 
-                    customer.phone != phone):
-                    customer.firstname = firstname
-                    customer.surname = lastname
-                    customer.phone = phone
-                    customer_updated = True
-                break
-        
-        if customer_updated:
-            db.save_customers(customers)
-        
-        # Update rental
-        rentals = db.load_rentals()
-        for rental in rentals:
-            if rental.rental_id == self.rental.rental_id:
-                rental.customer_id = self.customer.customer_id
-                rental.start_date = start_date
-                rental.end_date = end_date
-                rental.items = self.selected_items.copy()
-                rental.total_price = total
-                break
-        
-        # Save all changes
-        db.save_items(self.all_items)
-        db.save_rentals(rentals)
+        # Stock, customer and rental are updated together from the current
+        # stored values, retrying if another terminal changes them first
+        try:
+            db.update_rental_record(self.rental.rental_id, self.customer.customer_id,
+                                    firstname, lastname, phone, start_date, end_date,
+                                    self.selected_items)
+        except ValueError as e:
+            messagebox.showerror("Insufficient Stock", str(e))
+            return
+        except db.ConflictError:
+            messagebox.showerror("Error", "This rental is being changed in another terminal - please try again.")
+            return
         
         messagebox.showinfo("Success", "Rental updated successfully!")
         self.root.destroy()
@@ -1,7 +1,10 @@
+import threading
 import tkinter as tk
-from tkinter import ttk, messagebox
+from tkinter import ttk, messagebox, filedialog
 from datetime import datetime, date
 import database_schema as db
+import bulk_export
+import assets
 
 def center_window(window, width=650, height=500):
     screen_width = window.winfo_screenwidth()
@@ -27,31 +30,8 @@ def Revenue(parent_window=None):
         back_btn.bind("<Leave>", on_leave)
     
     def calculate_today_revenue():
-        rentals = db.load_rentals()
-        today = date.today()
-        
-        # Initialize counters
-        today_revenue = 0.0
-        today_rentals = 0
-        
-        for rental in rentals:
-            # Get creation date (with fallback for old records)
-            if hasattr(rental, 'creation_date') and rental.creation_date:
-                creation_date = rental.creation_date
-            else:
-                # Fallback: use start_date for old records
-                creation_date = rental.start_date
-            
-            # Handle both datetime and date objects
-            if hasattr(creation_date, 'date'):
-                creation_date = creation_date.date()
-            
-            # Check if rental was created today
-            if creation_date == today:
-                today_revenue += rental.total_price
-                today_rentals += 1
-        
-        return today_revenue, today_rentals
+        # Vectorised sum over the columnar rental table
+        return db.rental_columns().daily_revenue(date.today())
     
     def update_statistics():
         try:
@@ -65,6 +45,40 @@ def Revenue(parent_window=None):
             total_revenue_label.config(text="£0.00")
             total_rentals_label.config(text="0")
     
+    def export_rentals():
+        path = filedialog.asksaveasfilename(
+            parent=root,
+            title="Export Rentals",
+            defaultextension=".csv",
+            initialfile=f"rentals_{date.today().isoformat()}.csv",
+            filetypes=[("CSV", "*.csv"), ("JSON Lines", "*.jsonl")])
+        if not path:
+            return
+        
+        # Large exports take a while, so write in the background and keep
+        # the window responsive
+        export_btn.config(state="disabled", text="EXPORTING...")
+        result = []
+        
+        def run():
+            try:
+                result.append(bulk_export.export_rentals(path))
+            except Exception as e:
+                result.append(e)
+        
+        def check_done():
+            if not result:
+                root.after(200, check_done)
+                return
+            export_btn.config(state="normal", text="EXPORT")
+            if isinstance(result[0], Exception):
+                messagebox.showerror("Error", f"Export failed: {result[0]}", parent=root)
+            else:
+                messagebox.showinfo("Export", f"Exported {result[0]} rentals to\n{path}", parent=root)
+        
+        threading.Thread(target=run, daemon=True).start()
+        root.after(200, check_done)
+    
     def go_back():
         root.destroy()
         if parent_window:
@@ -79,7 +93,7 @@ def Revenue(parent_window=None):
     
     # Set icon
     try:
-        root.iconphoto(False, tk.PhotoImage(file="icon.png"))
+        root.iconphoto(False, assets.icon(root))
     except:
         pass
     
@@ -173,7 +187,18 @@ def Revenue(parent_window=None):
                           width=15,
                           height=1,
                           command=update_statistics)
-    update_btn.pack()
+    update_btn.pack(side="left", padx=5)
+    
+    # Export button - every rental to CSV or JSON Lines
+    export_btn = tk.Button(update_frame, text="EXPORT",
+                          font=("Helvetica", 11, "bold"),
+                          bg="#8acbcb",
+                          fg="white",
+                          activebackground="#7db6b6",
+                          width=15,
+                          height=1,
+                          command=export_rentals)
+    export_btn.pack(side="left", padx=5)
     
     # Set hover colors
     back_btn.normal_color = "#8acbcb"
@@ -186,16 +211,41 @@ def Revenue(parent_window=None):
     setup_hover_effects()
     update_btn.bind("<Enter>", lambda e: update_btn.config(bg="#7db6b6"))
     update_btn.bind("<Leave>", lambda e: update_btn.config(bg="#8acbcb"))
+    export_btn.bind("<Enter>", lambda e: export_btn.config(bg="#7db6b6"))
+    export_btn.bind("<Leave>", lambda e: export_btn.config(bg="#8acbcb"))
     
     # Calculate and display initial statistics
     update_statistics()
     
-    # Auto-refresh every 30 seconds
-    def auto_refresh():
+    # Update as soon as a rental is booked, changed or deleted in any
+    # terminal - the columnar table is already kept in step, so a batch of
+    # changes only needs one recalculation
+    pending_update = []
+    
+    def on_rental_change(op, name, key, record):
+        if not pending_update:
+            pending_update.append(root.after_idle(run_pending_update))
+    
+    def run_pending_update():
+        pending_update.clear()
         update_statistics()
-        root.after(30000, auto_refresh)  # 30 seconds
     
-    root.after(30000, auto_refresh)
+    db.watch_changes(root, on_rental_change, ["rentals"])
+    
+    # Today's figures start again at midnight whether or not anything
+    # changes, so keep checking the date every 30 seconds too
+    shown_day = [today]
+    
+    def check_date():
+        if not root.winfo_exists():
+            return
+        if date.today() != shown_day[0]:
+            shown_day[0] = date.today()
+            date_label.config(text=f"Today: {shown_day[0].strftime('%A, %d %B %Y')}")
+            update_statistics()
+        root.after(30000, check_date)  # 30 seconds
+    
+    root.after(30000, check_date)
     
     if not parent_window:
         root.mainloop()
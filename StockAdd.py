@@ -2,6 +2,7 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
 import database_schema as db
+import assets
 
 def center_window(window, width=650, height=500):
     screen_width = window.winfo_screenwidth()
@@ -30,7 +31,7 @@ class StockAdd:
         
         # Set icon
         try:
-            self.root.iconphoto(False, tk.PhotoImage(file="icon.png"))
+            self.root.iconphoto(False, assets.icon(self.root))
         except:
             pass
         
@@ -98,7 +99,7 @@ class StockAdd:
         self.items = db.load_items()
         # Sort items by name
         self.items.sort(key=lambda x: x.name.lower())
-        item_names = [f"{item.name} ({item.quantity} available)" for item in self.items]
+        item_names = self.item_labels(self.items)
         
         self.item_var = tk.StringVar()
         self.item_dropdown = ttk.Combobox(stock_frame,
@@ -198,6 +199,12 @@ class StockAdd:
             self.item_dropdown.current(0)
             self.on_item_selected()
     
+    def item_labels(self, items):
+        # Shows the units free today - Item.quantity also has bookings for
+        # later dates taken off
+        free = db.available_today(items)
+        return [f"{item.name} ({free[item.item_id]} available)" for item in items]
+    
     def on_item_selected(self, event=None):
         selected_index = self.item_dropdown.current()
         if selected_index != -1 and selected_index < len(self.items):
@@ -227,23 +234,27 @@ class StockAdd:
             return
         
         # Find and update item
-        for item in self.items:
+        for index, item in enumerate(self.items):
             if item.item_id == self.current_item_id:
-                old_quantity = item.quantity
-                
-                # Calculate new quantity, but don't go below zero
-                new_quantity = old_quantity + amount
-                if new_quantity < 0:
-                    new_quantity = 0
-                
-                item.quantity = new_quantity
+                old_available = db.available_today([item])[item.item_id]
                 
-                # Save to database
-                db.save_items(self.items)
+                # Add to the stored quantity (not this screen's copy), so
+                # changes from other terminals aren't overwritten. Stock
+                # that bookings need can't be removed.
+                try:
+                    item = db.adjust_item_quantity(item.item_id, amount)
+                except ValueError as e:
+                    self.show_error(str(e))
+                    return
+                if item is None:
+                    self.show_error("Selected item not found!")
+                    return
+                self.items[index] = item
+                new_available = db.available_today([item])[item.item_id]
                 
                 # Update dropdown display
                 selected_index = self.item_dropdown.current()
-                new_display = f"{item.name} ({item.quantity} available)"
+                new_display = self.item_labels([item])[0]
                 
                 # Update the item names list
                 item_names = list(self.item_dropdown['values'])
@@ -260,8 +271,8 @@ class StockAdd:
                 
                 messagebox.showinfo("Success", 
                                   f"{action} {abs(amount)} to/from {item.name}\n"
-                                  f"Old quantity: {old_quantity}\n"
-                                  f"New quantity: {item.quantity}")
+                                  f"Available before: {old_available}\n"
+                                  f"Available now: {new_available}")
                 
                 # Reset amount entry
                 self.amount_var.set("1")
@@ -284,14 +295,7 @@ class StockAdd:
             return
         
         # Check if item is used in any rentals
-        rentals = db.load_rentals()
-        item_in_use = False
-        for rental in rentals:
-            if selected_item.item_id in rental.items:
-                item_in_use = True
-                break
-        
-        if item_in_use:
+        if db.item_has_rentals(selected_item.item_id):
             messagebox.showerror("Cannot Delete", 
                 f"Cannot delete '{selected_item.name}' because it is currently rented or has rental history.\n"
                 f"Consider reducing quantity to 0 instead.")
@@ -309,11 +313,10 @@ class StockAdd:
             self.items = [item for item in self.items if item.item_id != self.current_item_id]
             
             # Save to database
-            db.save_items(self.items)
+            db.delete_item(self.current_item_id)
             
             # Update dropdown
-            item_names = [f"{item.name} ({item.quantity} available)" for item in self.items]
-            self.item_dropdown['values'] = item_names
+            self.item_dropdown['values'] = self.item_labels(self.items)
             
             if self.items:
                 self.item_dropdown.current(0)
@@ -333,15 +336,14 @@ class StockAdd:
         self.items.sort(key=lambda x: x.name.lower())
         
         # Update dropdown
-        item_names = [f"{item.name} ({item.quantity} available)" for item in self.items]
-        self.item_dropdown['values'] = item_names
+        self.item_dropdown['values'] = self.item_labels(self.items)
         
         # Find and select the new item
         for i, item in enumerate(self.items):
             if item.item_id == new_item.item_id:
                 self.item_dropdown.current(i)
                 self.current_item_id = item.item_id
-                self.item_var.set(f"{item.name} ({item.quantity} available)")
+                self.item_var.set(self.item_labels([item])[0])
                 break
     
     def show_error(self, message):
@@ -367,7 +369,7 @@ class AddItemWindow:
         
         # Set icon
         try:
-            self.window.iconphoto(False, tk.PhotoImage(file="icon.png"))
+            self.window.iconphoto(False, assets.icon(self.window))
         except:
             pass
         
@@ -576,8 +578,7 @@ class AddItemWindow:
         new_item = db.Item(item_id, item_name, item_type, amount, price)
         
         # Save to database
-        existing_items.append(new_item)
-        db.save_items(existing_items)
+        db.add_item(new_item)
         
         # Show success message
         messagebox.showinfo("Success", 
@@ -1,6 +1,8 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
 import database_schema as db
+from tree_pager import TreePager
+import assets
 
 def center_window(window, width=650, height=500):
     screen_width = window.winfo_screenwidth()
@@ -27,23 +29,31 @@ def StockView(parent_window=None):
             btn.bind("<Enter>", on_enter)
             btn.bind("<Leave>", on_leave)
     
-    def load_stock_data():
-        # Clear existing data
-        for item in tree.get_children():
-            tree.delete(item)
-        
-        # Load items
-        items = db.load_items()
+    def load_stock_data(items=None):
+        # Without a list, page through the items by name as the user
+        # scrolls; callers can pass a list to show every one of them
+        if items is None:
+            pager.reset()
+            return
         
-        # Sort by name (you can change this to other columns)
+        pager.clear()
         items.sort(key=lambda x: x.name.lower())
-        
-        # Add item data with tags
         for item in items:
-            # Insert with item ID as tag
-            tree.insert("", "end", 
-                       values=(item.name, item.type, f"£{item.price:.2f}", item.quantity),
-                       tags=(str(item.item_id),))
+            insert_item_row(item)
+    
+    def fetch_item_page(after, limit):
+        return db.load_items_page(after=after, limit=limit)
+    
+    def insert_item_row(item, index="end"):
+        # Insert with item ID as iid and tag
+        tree.insert("", index, iid=str(item.item_id),
+                   values=(item.name, item.type, f"£{item.price:.2f}",
+                           db.available_today([item])[item.item_id]),
+                   tags=(str(item.item_id),))
+    
+    def on_stock_change(op, name, key, record):
+        # Show stock taken or added in any terminal as it happens
+        pager.apply_change(op, key, record)
     
     def on_item_select(event):
         selected = tree.selection()
@@ -79,23 +89,14 @@ def StockView(parent_window=None):
         
         if confirm:
             # Check if item is used in any rentals
-            rentals = db.load_rentals()
-            item_in_use = False
-            for rental in rentals:
-                if item_id in rental.items:
-                    item_in_use = True
-                    break
-            
-            if item_in_use:
+            if db.item_has_rentals(item_id):
                 messagebox.showerror("Cannot Delete", 
                     f"Cannot delete '{item_name}' because it is currently rented or has rental history.\n"
                     f"Consider reducing quantity to 0 instead.")
                 return
             
             # Delete from database
-            items = db.load_items()
-            items = [i for i in items if i.item_id != item_id]
-            db.save_items(items)
+            db.delete_item(item_id)
             
             # Update treeview
             tree.delete(selected[0])
@@ -110,13 +111,14 @@ def StockView(parent_window=None):
         # Clear current selection
         tree.selection_remove(tree.selection())
         
-        # CRITICAL: RELOAD ALL DATA FIRST
-        load_stock_data()
-        
-        # If no search criteria, show ALL items
+        # If no search criteria, go back to paging through everything
         if not name_filter and not type_filter and not price_min_filter and not price_max_filter:
+            load_stock_data()
             return
         
+        # CRITICAL: RELOAD ALL DATA FIRST
+        load_stock_data(db.load_items())
+        
         # Hide non-matching items
         for child in tree.get_children():
             item = tree.item(child)
@@ -167,6 +169,8 @@ def StockView(parent_window=None):
                 tree.detach(child)
     
     def sort_treeview(col, reverse):
+        # Every row has to be loaded to sort on another column
+        pager.load_all()
         data = [(tree.set(child, col), child) for child in tree.get_children()]
         
         # Determine if it's a price column (contains £)
@@ -200,7 +204,7 @@ def StockView(parent_window=None):
     
     # Set icon
     try:
-        root.iconphoto(False, tk.PhotoImage(file="icon.png"))
+        root.iconphoto(False, assets.icon(root))
     except:
         pass
     
@@ -282,7 +286,7 @@ def StockView(parent_window=None):
                  command=lambda: sort_treeview(1, False))
     tree.heading("Price", text="Price", 
                  command=lambda: sort_treeview(2, False))
-    tree.heading("Quantity", text="Quantity", 
+    tree.heading("Quantity", text="Available", 
                  command=lambda: sort_treeview(3, False))
     
     # Define columns
@@ -293,7 +297,8 @@ def StockView(parent_window=None):
     
     # Add scrollbar
     scrollbar = ttk.Scrollbar(tree_frame, orient="vertical", command=tree.yview)
-    tree.configure(yscrollcommand=scrollbar.set)
+    pager = TreePager(tree, scrollbar, fetch_item_page, insert_item_row,
+                      sort_key=db.page_sort_key("items", "name"))
     
     tree.pack(side="left", fill="both", expand=True)
     scrollbar.pack(side="right", fill="y")
@@ -316,6 +321,7 @@ def StockView(parent_window=None):
     
     # Load initial data
     load_stock_data()
+    db.watch_changes(root, on_stock_change, ["items"])
     
     if not parent_window:
         root.mainloop()
@@ -357,7 +363,7 @@ def SearchWindow(parent_window, apply_callback):
     center_window(search_root, 650, 500)
     
     try:
-        search_root.iconphoto(False, tk.PhotoImage(file="icon.png"))
+        search_root.iconphoto(False, assets.icon(search_root))
     except:
         pass
     
@@ -0,0 +1,60 @@
+import os
+import tkinter as tk
+
+LOGO_FILE = "Logo.png"
+ICON_FILE = "icon.png"
+LOGO_SIZE = (180, 180)
+ICON_SIZE = (64, 64)
+
+# Resized copies are generated here once and reused while they are newer
+# than the original
+CACHE_DIR = "asset_cache"
+
+def cached_copy(source, size):
+    """Path of a PNG of source resized to size, creating it if it is
+    missing or older than source. PIL is only imported to create it, and
+    without PIL the original is used."""
+    width, height = size
+    name, _ = os.path.splitext(os.path.basename(source))
+    cached = os.path.join(CACHE_DIR, f"{name.lower()}_{width}x{height}.png")
+    try:
+        if os.path.getmtime(cached) >= os.path.getmtime(source):
+            return cached
+    except OSError:
+        pass
+
+    try:
+        from PIL import Image
+    except ImportError:
+        # Tk can show the original as it is, just not resized
+        return source
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with Image.open(source) as img:
+        resized = img.resize(size, Image.Resampling.LANCZOS)
+    # Write then rename, so another terminal never reads half a file
+    temp_file = cached + ".tmp"
+    resized.save(temp_file, "PNG")
+    os.replace(temp_file, cached)
+    return cached
+
+def photo(widget, source, size):
+    # An image belongs to the interpreter that created it, so the loaded
+    # PhotoImages are kept on its root window, by (file, size), and go
+    # when the window does
+    root = widget._root()
+    if not hasattr(root, "asset_images"):
+        root.asset_images = {}
+    key = (source, size)
+    image = root.asset_images.get(key)
+    if image is None:
+        image = tk.PhotoImage(master=root, file=cached_copy(source, size))
+        root.asset_images[key] = image
+    return image
+
+def logo(widget):
+    """The login logo at LOGO_SIZE, as a PhotoImage for widget's window."""
+    return photo(widget, LOGO_FILE, LOGO_SIZE)
+
+def icon(widget):
+    """The window icon, loaded once per Tk interpreter."""
+    return photo(widget, ICON_FILE, ICON_SIZE)
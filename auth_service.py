@@ -0,0 +1,123 @@
+import hashlib
+import hmac
+import os
+import queue
+import threading
+import tkinter as tk
+
+# Password hashes are stored as "pbkdf2_sha256$<iterations>$<salt hex>$<hash hex>".
+# Older accounts have a bare SHA-256 hex digest; those still log in and are
+# re-hashed with the current settings when they do.
+ALGORITHM = "pbkdf2_sha256"
+
+# Cost of a hash. Pick it with benchmarks/password_hashing.py so a login
+# takes around a quarter of a second on the shop's slowest terminal; hashes
+# made with fewer iterations are upgraded on the next login.
+ITERATIONS = 200000
+SALT_SIZE = 16
+
+# How often (ms) Tk checks whether a background job has finished
+POLL_INTERVAL = 20
+
+def derive(password, salt, iterations):
+    return hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iterations)
+
+def hash_password(password, iterations=None):
+    """A new salted hash of password, in the stored format. Slow on
+    purpose - call it through submit() from the Tk thread."""
+    iterations = iterations or ITERATIONS
+    salt = os.urandom(SALT_SIZE)
+    return f"{ALGORITHM}${iterations}${salt.hex()}${derive(password, salt, iterations).hex()}"
+
+def legacy_hash(password):
+    # The original unsalted SHA-256 scheme
+    return hashlib.sha256(password.encode()).hexdigest()
+
+def verify_password(password, stored):
+    """True if password matches stored, in either format."""
+    if not stored:
+        return False
+    if "$" not in stored:
+        return hmac.compare_digest(legacy_hash(password), stored)
+    try:
+        algorithm, iterations, salt, expected = stored.split("$")
+        if algorithm != ALGORITHM:
+            return False
+        actual = derive(password, bytes.fromhex(salt), int(iterations))
+    except ValueError:
+        return False
+    return hmac.compare_digest(actual.hex(), expected)
+
+def needs_rehash(stored):
+    """True for legacy hashes and hashes made with fewer than ITERATIONS."""
+    try:
+        algorithm, iterations, _, _ = stored.split("$")
+        return algorithm != ALGORITHM or int(iterations) < ITERATIONS
+    except ValueError:
+        return True
+
+class Job:
+    def __init__(self, func, args):
+        self.func = func
+        self.args = args
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+    def run(self):
+        try:
+            self.result = self.func(*self.args)
+        except Exception as e:
+            self.error = e
+        self.done.set()
+
+class AuthService:
+    """Runs password hashing on one worker thread and reports back on the Tk
+    thread, so windows keep drawing while a hash is worked out."""
+
+    def __init__(self):
+        self.jobs = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.work, name="auth-service", daemon=True)
+                self.thread.start()
+
+    def work(self):
+        while True:
+            self.jobs.get().run()
+
+    def submit(self, widget, func, args, callback, on_error=None):
+        # callback(result), or on_error(exception) if func raised, is called
+        # on the Tk thread once the job has run
+        job = Job(func, args)
+        self.start()
+        self.jobs.put(job)
+
+        def check():
+            if not job.done.is_set():
+                try:
+                    widget.after(POLL_INTERVAL, check)
+                except tk.TclError:
+                    # The window was closed - nobody is waiting for it
+                    pass
+                return
+            if job.error is not None:
+                if on_error is None:
+                    print(f"Error in background job: {job.error}")
+                else:
+                    on_error(job.error)
+                return
+            callback(job.result)
+
+        widget.after(POLL_INTERVAL, check)
+        return job
+
+# One worker for the whole program, so jobs run one at a time in order
+service = AuthService()
+
+def submit(widget, func, args, callback, on_error=None):
+    return service.submit(widget, func, args, callback, on_error)
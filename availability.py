@@ -0,0 +1,217 @@
+import threading
+from array import array
+from datetime import date
+from itertools import accumulate
+from interval_index import LAST_DAY, day_number
+
+class ItemCalendar:
+    """Units of one item booked on each day, as an array('H') of day counts
+    starting at day number base."""
+
+    def __init__(self, base=None, booked=None):
+        self.base = base
+        self.booked = booked if booked is not None else array('H')
+
+    def cover(self, first, last):
+        # Grow the array so days first..last are inside it
+        if self.base is None:
+            self.base = first
+        if first < self.base:
+            self.booked = array('H', bytes(2 * (self.base - first))) + self.booked
+            self.base = first
+        missing = last - self.base + 1 - len(self.booked)
+        if missing > 0:
+            self.booked.extend(array('H', bytes(2 * missing)))
+
+    def add(self, start, end, units):
+        # units may be negative to take a booking out
+        self.cover(start, end)
+        booked = self.booked
+        for index in range(start - self.base, end - self.base + 1):
+            booked[index] += units
+
+    def remove(self, start, end, units):
+        self.add(start, end, -units)
+
+    def peak(self, first, last, excluded=None):
+        """Most units booked on any one day from first to last (day numbers),
+        leaving out the (start, end, units) booking excluded."""
+        if self.base is None:
+            return 0
+        low = max(first, self.base) - self.base
+        high = min(last - self.base, len(self.booked) - 1)
+        if low > high:
+            return 0
+        booked = self.booked
+        if excluded is None or excluded[0] - self.base > high or excluded[1] - self.base < low:
+            return max(booked[low:high + 1])
+        # The excluded booking has the same units on every day it covers
+        start = max(excluded[0] - self.base, low)
+        end = min(excluded[1] - self.base, high)
+        return max(max(booked[low:start], default=0),
+                   max(booked[start:end + 1]) - excluded[2],
+                   max(booked[end + 1:high + 1], default=0))
+
+    def days(self, first, last):
+        """Units booked on each day from first to last, as a list."""
+        return [self.booked[day - self.base] if self.base is not None and
+                0 <= day - self.base < len(self.booked) else 0
+                for day in range(first, last + 1)]
+
+    def booked_days(self):
+        # {day: units} for every day with something booked
+        return {self.base + index: units for index, units in enumerate(self.booked) if units}
+
+class OccupancyCalendar:
+    """Units booked per item per day, for working out how many are free
+    over a date range."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stale = True
+        self.clear()
+
+    def clear(self):
+        self.calendars = {}
+        # rental_id -> (start day, end day, {item_id: units}), to take a
+        # rental out again on update
+        self.booking_of = {}
+        # rental_ids with a stock_returns entry, and item_id -> units held
+        # by the rentals without one
+        self.returned = set()
+        self.held = {}
+
+    def hold(self, items, sign):
+        for item_id, units in items.items():
+            self.held[item_id] = self.held.get(item_id, 0) + sign * units
+
+    def add(self, rental):
+        start = day_number(rental.start_date)
+        end = day_number(rental.end_date)
+        items = dict(rental.items)
+        for item_id, units in items.items():
+            calendar = self.calendars.get(item_id)
+            if calendar is None:
+                calendar = self.calendars[item_id] = ItemCalendar()
+            calendar.add(start, end, units)
+        self.booking_of[rental.rental_id] = (start, end, items)
+        if rental.rental_id not in self.returned:
+            self.hold(items, 1)
+
+    def remove(self, rental_id):
+        booking = self.booking_of.pop(rental_id, None)
+        if booking is None:
+            return
+        start, end, items = booking
+        for item_id, units in items.items():
+            self.calendars[item_id].remove(start, end, units)
+        if rental_id not in self.returned:
+            self.hold(items, -1)
+
+    def rebuild(self, rentals, returns):
+        """Build the calendar from scratch."""
+        with self.lock:
+            self.clear()
+            self.returned = {entry.rental_id for entry in returns}
+            bookings = {}
+            for rental in rentals:
+                start = day_number(rental.start_date)
+                end = day_number(rental.end_date)
+                items = dict(rental.items)
+                for item_id, units in items.items():
+                    bookings.setdefault(item_id, []).append((start, end, units))
+                self.booking_of[rental.rental_id] = (start, end, items)
+                if rental.rental_id not in self.returned:
+                    self.hold(items, 1)
+
+            # One pass of +units/-units changes per item, summed into the
+            # day counts, rather than adding to every day of every booking
+            for item_id, item_bookings in bookings.items():
+                base = min(start for start, _, _ in item_bookings)
+                size = max(end for _, end, _ in item_bookings) - base + 1
+                changes = [0] * (size + 1)
+                for start, end, units in item_bookings:
+                    changes[start - base] += units
+                    changes[end - base + 1] -= units
+                booked = array('H', accumulate(changes[:size]))
+                self.calendars[item_id] = ItemCalendar(base, booked)
+            self.stale = False
+
+    def on_change(self, op, name, key, record):
+        if op == "reset":
+            if name in (None, "rentals", "stock_returns"):
+                self.stale = True
+            return
+        if name not in ("rentals", "stock_returns") or self.stale:
+            return
+        with self.lock:
+            if name == "rentals":
+                self.remove(key)
+                if op != "delete":
+                    self.add(record)
+                return
+            # A return (or cancellation) gives the rental's units back to
+            # Item.quantity; deleting the entry takes them out again
+            booking = self.booking_of.get(key)
+            if op == "delete":
+                if key in self.returned:
+                    self.returned.discard(key)
+                    if booking is not None:
+                        self.hold(booking[2], 1)
+            elif key not in self.returned:
+                self.returned.add(key)
+                if booking is not None:
+                    self.hold(booking[2], -1)
+
+    def free_units(self, item_id, quantity, first, last, exclude=None, today=None):
+        """Units of an item free on every day from first to last (dates),
+        given its current Item.quantity. Days before today are ignored.
+        exclude leaves one rental out, for checking an edit to it."""
+        today = day_number(today or date.today())
+        first = today if first is None else max(day_number(first), today)
+        last = LAST_DAY if last is None else day_number(last)
+        with self.lock:
+            # Booking takes units off the quantity until the rental is
+            # returned, so those units still count as stock
+            stock = quantity + self.held.get(item_id, 0)
+            calendar = self.calendars.get(item_id)
+            if calendar is None:
+                return stock
+            excluded = None
+            if exclude in self.booking_of:
+                start, end, items = self.booking_of[exclude]
+                if item_id in items:
+                    excluded = (start, end, items[item_id])
+            return stock - calendar.peak(first, last, excluded)
+
+    def booked(self, item_id, first, last):
+        """Units of an item booked on each day from first to last (dates)."""
+        with self.lock:
+            calendar = self.calendars.get(item_id, ItemCalendar())
+            return calendar.days(day_number(first), day_number(last))
+
+    def check(self, rentals, returns):
+        """Compare the calendar with a fresh build from rentals and the
+        stock_returns ledger and return a list of problems (empty when
+        they agree)."""
+        expected = OccupancyCalendar()
+        expected.rebuild(rentals, returns)
+        problems = []
+        with self.lock:
+            for item_id in set(self.calendars) | set(expected.calendars) | set(self.held):
+                actual = self.calendars.get(item_id, ItemCalendar())
+                wanted = expected.calendars.get(item_id, ItemCalendar())
+                actual_days = actual.booked_days()
+                wanted_days = wanted.booked_days()
+                wrong = sorted(day for day in set(actual_days) | set(wanted_days)
+                               if actual_days.get(day) != wanted_days.get(day))
+                if wrong:
+                    problems.append(f"item {item_id}: wrong units booked on {len(wrong)} days "
+                                    f"from {date.fromordinal(wrong[0])}")
+                held = self.held.get(item_id, 0)
+                if held != expected.held.get(item_id, 0):
+                    problems.append(f"item {item_id}: {held} units held by unreturned rentals, "
+                                    f"expected {expected.held.get(item_id, 0)}")
+            if set(self.booking_of) != set(expected.booking_of):
+                problems.append("rentals in the calendar don't match the rentals on file")
+        return problems
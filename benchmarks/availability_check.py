@@ -0,0 +1,100 @@
+# Date-aware availability check latency.
+#
+# Fills an OccupancyCalendar with generated rentals spread over a few years
+# (mostly short, a few running for months) and times the check a booking
+# makes: the units free for several items over a date range. Results are
+# compared with a brute-force day-by-day count over every rental, and the
+# calendar after a run of edits with a rebuild from scratch.
+#
+#   python benchmarks/availability_check.py --rentals 100000
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from availability import OccupancyCalendar
+from database_schema import Rental
+
+FIRST_DATE = date(2023, 1, 1)
+DAYS = 4 * 365
+
+def make_rentals(count, items, seed=1):
+    rng = random.Random(seed)
+    rentals = []
+    for rental_id in range(1, count + 1):
+        start = FIRST_DATE + timedelta(days=rng.randrange(DAYS))
+        length = rng.randrange(90, 400) if rng.random() < 0.001 else rng.randrange(1, 8)
+        booked = {item_id: rng.randint(1, 3) for item_id in rng.sample(range(1, items + 1), 3)}
+        rentals.append(Rental(rental_id, 1, "bench", start, start + timedelta(days=length - 1),
+                              booked, 0.0))
+    return rentals
+
+def brute_force_peak(rentals, item_id, first, last):
+    peak = 0
+    day = first
+    while day <= last:
+        booked = sum(r.items.get(item_id, 0) for r in rentals if r.start_date <= day <= r.end_date)
+        peak = max(peak, booked)
+        day += timedelta(days=1)
+    return peak
+
+def main():
+    parser = argparse.ArgumentParser(description="Availability check benchmark")
+    parser.add_argument("--rentals", type=int, default=100000)
+    parser.add_argument("--items", type=int, default=40)
+    parser.add_argument("--checks", type=int, default=2000)
+    args = parser.parse_args()
+
+    rentals = make_rentals(args.rentals, args.items)
+    index = OccupancyCalendar()
+    started = time.perf_counter()
+    index.rebuild(rentals, [])
+    print(f"Built from {args.rentals} rentals in {time.perf_counter() - started:.2f}s")
+
+    rng = random.Random(2)
+    queries = []
+    for _ in range(args.checks):
+        first = FIRST_DATE + timedelta(days=rng.randrange(DAYS))
+        last = first + timedelta(days=rng.randrange(0, 7))
+        queries.append((rng.sample(range(1, args.items + 1), 3), first, last))
+
+    times = []
+    for item_ids, first, last in queries:
+        started = time.perf_counter()
+        for item_id in item_ids:
+            index.free_units(item_id, 0, first, last, today=FIRST_DATE)
+        times.append(time.perf_counter() - started)
+    times.sort()
+    print(f"3-item check over 1-7 days: median {statistics.median(times) * 1e6:.0f}us, "
+          f"p99 {times[int(len(times) * 0.99)] * 1e6:.0f}us")
+
+    # Spot-check against a scan of every rental. Nothing has been
+    # returned, so the free units are all units less the peak.
+    for item_ids, first, last in queries[:5]:
+        for item_id in item_ids:
+            units = sum(r.items.get(item_id, 0) for r in rentals)
+            expected = units - brute_force_peak(rentals, item_id, first, last)
+            actual = index.free_units(item_id, 0, first, last, today=FIRST_DATE)
+            assert actual == expected, (item_id, first, last, actual, expected)
+    print("Spot checks match a full scan")
+
+    # Incremental updates: move some rentals, cancel others, then check
+    # against a fresh build
+    started = time.perf_counter()
+    for rental in rentals[:1000]:
+        rental.start_date += timedelta(days=3)
+        rental.end_date += timedelta(days=3)
+        index.on_change("update", "rentals", rental.rental_id, rental)
+    for rental in rentals[1000:2000]:
+        index.on_change("delete", "rentals", rental.rental_id, None)
+    elapsed = time.perf_counter() - started
+    print(f"2000 incremental updates in {elapsed * 1000:.0f}ms")
+    problems = index.check(rentals[:1000] + rentals[2000:], [])
+    print("Calendar matches a rebuild" if not problems else "\n".join(problems))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# Bulk CSV import throughput and memory.
+#
+# Writes a generated customers file and a rentals file of the given size
+# into a fresh data directory, imports both with bulk_import and reports
+# rows per second and the peak memory of the process.
+#
+#   python benchmarks/bulk_import_rows.py --rows 100000
+#   SPOTLIGHT_BACKEND=sqlite python benchmarks/bulk_import_rows.py --rows 100000
+import argparse
+import csv
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def write_customers(path, rows):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["firstname", "surname", "phone"])
+        for n in range(rows):
+            writer.writerow([f"First{n}", f"Surname{n % 5000}", f"555-{n:07d}"])
+
+def write_rentals(path, rows, customers):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["firstname", "surname", "phone", "employee", "start_date",
+                         "end_date", "items", "total_price"])
+        for n in range(rows):
+            c = n % customers
+            day = 1 + n % 28
+            writer.writerow([f"First{c}", f"Surname{c % 5000}", f"555-{c:07d}", "bench",
+                             f"2025-03-{day:02d}", f"2025-03-{min(day + 2, 28):02d}",
+                             "Microphone:2;3:1", ""])
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import benchmark")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix="spotlight-import-")
+    for name in ("customers.pkl", "items.pkl", "rentals.pkl"):
+        shutil.copy(os.path.join(REPO_DIR, name), data_dir)
+    os.chdir(data_dir)
+    sys.path.insert(0, REPO_DIR)
+    import bulk_import
+
+    customers = max(args.rows // 10, 1)
+    write_customers("customers.csv", customers)
+    write_rentals("rentals.csv", args.rows, customers)
+
+    extra = ["--dry-run"] if args.dry_run else []
+    for kind in ("customers", "rentals"):
+        started = time.perf_counter()
+        bulk_import.main([kind, f"{kind}.csv"] + extra)
+        print(f"  {kind}: {time.perf_counter() - started:.1f}s")
+
+    # ru_maxrss is in KB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        peak //= 1024
+    print(f"Peak memory: {peak / 1024:.0f} MB")
+    shutil.rmtree(data_dir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# Picks auth_service.ITERATIONS for a target login time.
+#
+# A login costs one PBKDF2 hash (plus one more the first time a legacy
+# SHA-256 account logs in, to upgrade it). This times the hash at a range
+# of iteration counts on this machine and suggests the largest count that
+# stays under the target; run it on the slowest terminal in the shop.
+# Also checks that the Tk thread isn't blocked: while a login is checked
+# by the auth service, the longest gap between event-loop ticks should be
+# about POLL_INTERVAL, not the hash time.
+#
+#   python benchmarks/password_hashing.py --target-ms 250
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import auth_service
+
+COUNTS = [50000, 100000, 200000, 300000, 400000, 600000, 800000, 1200000]
+
+def time_hash(iterations, runs):
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        auth_service.hash_password("correct horse battery staple", iterations)
+        times.append(time.perf_counter() - started)
+    return statistics.median(times)
+
+def event_loop_gap(iterations):
+    # Longest gap between ticks of a 5ms after() loop while a hash runs on
+    # the auth service - needs a display
+    import tkinter as tk
+    try:
+        root = tk.Tk()
+    except tk.TclError:
+        return None
+    root.withdraw()
+    ticks = []
+    done = []
+
+    def tick():
+        ticks.append(time.perf_counter())
+        if not done:
+            root.after(5, tick)
+
+    def finished(result):
+        done.append(result)
+        root.after(50, root.quit)
+
+    tick()
+    auth_service.submit(root, auth_service.hash_password, ("password", iterations), finished)
+    root.mainloop()
+    root.destroy()
+    return max(b - a for a, b in zip(ticks, ticks[1:]))
+
+def main():
+    parser = argparse.ArgumentParser(description="Password hashing cost benchmark")
+    parser.add_argument("--target-ms", type=float, default=250)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"Current setting: {auth_service.ITERATIONS} iterations")
+    print(f"{'iterations':>12} {'ms/hash':>10}")
+    suggested = None
+    for iterations in COUNTS:
+        ms = time_hash(iterations, args.runs) * 1000
+        print(f"{iterations:>12} {ms:>10.1f}")
+        if ms <= args.target_ms:
+            suggested = iterations
+
+    if suggested is None:
+        print(f"Even {COUNTS[0]} iterations is over {args.target_ms:.0f}ms on this machine")
+    else:
+        print(f"Largest count under {args.target_ms:.0f}ms: {suggested} "
+              f"(set ITERATIONS in auth_service.py)")
+
+    gap = event_loop_gap(auth_service.ITERATIONS)
+    if gap is None:
+        print("No display - skipped the event loop check")
+    else:
+        print(f"Longest Tk event loop gap during a login: {gap * 1000:.1f}ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# Start-up cost of importing the database layer.
+#
+# Importing database_schema used to open the data files, upgrade them and
+# write the sample data; now that happens in bootstrap(), on first use.
+# This times, in fresh processes:
+#   - the Main.py -> Login -> AdminMenu import chain,
+#   - importing database_schema and the screens that use it,
+#   - the same followed by bootstrap(), i.e. what every import used to cost,
+#   - the Tk-thread time of the menus' return_scheduler.start and its first
+#     check (a stand-in window runs the scheduled callbacks once),
+# each against a copy of the data files and against an empty directory.
+#
+#   python benchmarks/startup_import.py --runs 20
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCREENS = "import database_schema, StockView, CustomerView, Revenue"
+
+# Runs the first round of callbacks a menu schedules, on this thread
+WINDOW = """
+import return_scheduler
+class Window:
+    def __init__(self):
+        self.pending = []
+    def after_idle(self, func):
+        self.pending.append(func)
+    def after(self, ms, func):
+        self.pending.append(func)
+    def winfo_exists(self):
+        return True
+window = Window()
+"""
+
+FIRST_CHECK = "return_scheduler.start(window); window.pending.pop(0)()"
+
+# (label, untimed setup, timed code)
+CASES = [
+    ("Main -> Login -> AdminMenu", "", "import Main, Login, AdminMenu"),
+    ("import database layer + screens", "", SCREENS),
+    ("  ... + bootstrap (old import cost)", "", SCREENS + "; database_schema.bootstrap()"),
+    ("menu: return scheduler start", WINDOW, FIRST_CHECK),
+]
+
+TIMER = """
+import sys, time
+sys.path.insert(0, {repo!r})
+{setup}
+started = time.perf_counter()
+{code}
+print(time.perf_counter() - started)
+"""
+
+def time_once(setup, code, data_dir, with_data):
+    # A fresh directory per run, so bootstrap always does its full work
+    run_dir = tempfile.mkdtemp(dir=data_dir)
+    if with_data:
+        for name in ("customers.pkl", "items.pkl", "rentals.pkl", "passHash.pkl"):
+            shutil.copy(os.path.join(REPO_DIR, name), run_dir)
+    script = TIMER.format(repo=REPO_DIR, setup=setup, code=code)
+    result = subprocess.run([sys.executable, "-c", script], cwd=run_dir,
+                            capture_output=True, text=True)
+    shutil.rmtree(run_dir)
+    if result.returncode != 0:
+        return None
+    return float(result.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description="Import/start-up time benchmark")
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix="spotlight-startup-")
+    try:
+        for with_data in (True, False):
+            print("With existing data files:" if with_data else "Empty data directory:")
+            for label, setup, code in CASES:
+                times = [time_once(setup, code, data_dir, with_data) for _ in range(args.runs)]
+                if None in times:
+                    print(f"  {label:38} skipped (import failed - missing dependency?)")
+                    continue
+                print(f"  {label:38} median {statistics.median(times) * 1000:7.1f} ms")
+    finally:
+        shutil.rmtree(data_dir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+# Time until the login window is ready, cold and warm.
+#
+# Each run is a fresh process in a copy of the data files. Login() is
+# called with mainloop patched out, so the time is from interpreter start
+# to the window being built and drawn once. "cold" deletes the resized
+# logo/icon cache first, "warm" reuses it. Also times, without a window
+# (so these run without a display too): importing Login, finding the logo
+# through the cache, and the old way of getting it (import PIL, open,
+# LANCZOS resize).
+#
+#   python benchmarks/startup_login.py --runs 10
+#   python benchmarks/startup_login.py --profile    # cProfile of one warm start
+#
+# The window timings need a display; PIL is only needed to build the cache.
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LOGIN = """
+import sys, time
+started = time.perf_counter()
+sys.path.insert(0, {repo!r})
+import tkinter as tk
+def ready(root):
+    root.update()
+    print(time.perf_counter() - started)
+    root.destroy()
+tk.Tk.mainloop = ready
+{profile}
+"""
+
+IMPORT_LOGIN = """
+import sys, time
+started = time.perf_counter()
+sys.path.insert(0, {repo!r})
+import Login
+print(time.perf_counter() - started)
+"""
+
+CACHED_LOGO = """
+import sys, time
+started = time.perf_counter()
+sys.path.insert(0, {repo!r})
+import assets
+assets.cached_copy(assets.LOGO_FILE, assets.LOGO_SIZE)
+print(time.perf_counter() - started)
+"""
+
+OLD_LOGO = """
+import sys, time
+started = time.perf_counter()
+from PIL import Image
+img = Image.open({logo!r}).resize((180, 180), Image.Resampling.LANCZOS)
+print(time.perf_counter() - started)
+"""
+
+def run(code, cwd):
+    result = subprocess.run([sys.executable, "-c", code], cwd=cwd, capture_output=True, text=True)
+    if result.returncode != 0:
+        print(result.stderr.strip().splitlines()[-1])
+        return None
+    return result.stdout
+
+def login_code(profile=False):
+    if profile:
+        body = ("import cProfile, pstats, Login\n"
+                "cProfile.run('Login.Login()', 'login.prof')\n"
+                "pstats.Stats('login.prof').sort_stats('cumulative').print_stats(15)")
+    else:
+        body = "import Login\nLogin.Login()"
+    return LOGIN.format(repo=REPO_DIR, profile=body)
+
+def main():
+    parser = argparse.ArgumentParser(description="Login window start-up benchmark")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--profile", action="store_true")
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix="spotlight-login-")
+    for name in ("customers.pkl", "items.pkl", "rentals.pkl", "passHash.pkl", "Logo.png", "icon.png"):
+        shutil.copy(os.path.join(REPO_DIR, name), data_dir)
+    try:
+        if args.profile:
+            run(login_code(), data_dir)
+            print(run(login_code(profile=True), data_dir))
+            return
+
+        for label, clear_cache in (("cold (no logo/icon cache)", True), ("warm (cached)", False)):
+            times = []
+            for _ in range(args.runs):
+                if clear_cache:
+                    shutil.rmtree(os.path.join(data_dir, "asset_cache"), ignore_errors=True)
+                output = run(login_code(), data_dir)
+                if output is None:
+                    print(f"{label}: skipped")
+                    break
+                times.append(float(output.splitlines()[-1]))
+            if times:
+                print(f"{label:28} median {statistics.median(times) * 1000:7.1f} ms")
+
+        headless = [
+            ("import Login", IMPORT_LOGIN.format(repo=REPO_DIR)),
+            ("logo from cache (warm)", CACHED_LOGO.format(repo=REPO_DIR)),
+            ("old logo load (PIL resize)", OLD_LOGO.format(logo=os.path.join(data_dir, "Logo.png"))),
+        ]
+        for label, code in headless:
+            times = []
+            for _ in range(args.runs):
+                output = run(code, data_dir)
+                if output is None:
+                    break
+                times.append(float(output.splitlines()[-1]))
+            if times:
+                print(f"{label:28} median {statistics.median(times) * 1000:7.1f} ms")
+    finally:
+        shutil.rmtree(data_dir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# Automatic stock return backlog.
+#
+# Books the given number of rentals that have already ended (plus a few
+# still running) into a fresh data directory, taking their stock off as a
+# booking would, then times the return scheduler's two jobs: the check it
+# makes every minute (the top of the heap), and db.return_stock putting
+# the whole backlog back in one transaction. Checks the quantities end up
+# where they started and that nothing is returned twice.
+#
+#   python benchmarks/stock_returns.py --rentals 5000
+#   SPOTLIGHT_BACKEND=sqlite python benchmarks/stock_returns.py --rentals 5000
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def main():
+    parser = argparse.ArgumentParser(description="Stock return backlog benchmark")
+    parser.add_argument("--rentals", type=int, default=5000)
+    parser.add_argument("--running", type=int, default=500)
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix="spotlight-returns-")
+    for name in ("customers.pkl", "items.pkl", "rentals.pkl"):
+        shutil.copy(os.path.join(REPO_DIR, name), data_dir)
+    os.chdir(data_dir)
+    sys.path.insert(0, REPO_DIR)
+    import database_schema as db
+    from interval_index import day_number
+
+    if os.environ.get("SPOTLIGHT_BACKEND") == "sqlite":
+        db.migrate_to_sqlite()
+    # Anything already overdue in the sample data goes back first
+    db.return_stock()
+    before = {item.item_id: item.quantity for item in db.load_items()}
+
+    rng = random.Random(1)
+    today = date.today()
+    item_ids = sorted(before)
+    taken = {}
+    ids = db.reserve_ids("rentals", args.rentals + args.running)
+    with db.transaction() as tx:
+        for n, rental_id in enumerate(ids):
+            if n < args.rentals:
+                start = today - timedelta(days=rng.randrange(2, 60))
+                end = min(start + timedelta(days=rng.randrange(0, 5)), today - timedelta(days=1))
+            else:
+                start = today + timedelta(days=rng.randrange(0, 30))
+                end = start + timedelta(days=rng.randrange(0, 5))
+            booked = {item_id: rng.randint(1, 3) for item_id in rng.sample(item_ids, 2)}
+            for item_id, units in booked.items():
+                taken[item_id] = taken.get(item_id, 0) + units
+            tx.put("rentals", db.Rental(rental_id, 1, "bench", start, end, booked, 0.0,
+                                        datetime.now()))
+        for item_id, units in taken.items():
+            item = db.get_item(item_id)
+            item.quantity -= units
+            tx.put("items", item)
+    db.flush()
+    print(f"Booked {args.rentals} ended and {args.running} running rentals "
+          f"on the {db.backend()} backend")
+
+    # Time a rebuild, as after a reset or at start-up
+    db.return_schedule.stale = True
+    started = time.perf_counter()
+    schedule = db.stock_return_schedule()
+    print(f"Schedule built in {(time.perf_counter() - started) * 1000:.0f}ms")
+
+    checks = 10000
+    started = time.perf_counter()
+    for _ in range(checks):
+        due = schedule.next_due() < day_number(today)
+    print(f"Check for due returns: {(time.perf_counter() - started) / checks * 1e6:.2f}us")
+    assert due
+
+    started = time.perf_counter()
+    returned = db.return_stock()
+    db.flush()
+    print(f"Returned {len(returned)} rentals in one transaction in "
+          f"{time.perf_counter() - started:.2f}s")
+    assert len(returned) == args.rentals
+
+    # Only the running rentals' stock is still out
+    running = {}
+    for rental in db.load_rentals():
+        if db.as_date(rental.end_date) >= today:
+            for item_id, units in rental.items.items():
+                running[item_id] = running.get(item_id, 0) + units
+    for item in db.load_items():
+        assert item.quantity == before[item.item_id] - running.get(item.item_id, 0), item.item_id
+    assert db.return_stock() == []
+    print(f"Quantities match; {schedule.outstanding()} rentals still out")
+    shutil.rmtree(data_dir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+# Multi-process stress test for concurrent bookings.
+#
+# Starts N processes that share one data directory and each book rentals as
+# fast as they can through create_rental_record, then checks that every
+# booking that was reported as created is stored, no rental ID was handed
+# out twice, and the stock taken matches the bookings exactly. Every
+# process also books for a few shared customers that start out new, which
+# must each be added only once.
+#
+#   python benchmarks/stress_rentals.py --processes 8 --rentals 50
+#   SPOTLIGHT_BACKEND=sqlite python benchmarks/stress_rentals.py
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Stock added to every item before the run so bookings don't run out
+EXTRA_STOCK = 100000
+
+def open_database(data_dir):
+    os.chdir(data_dir)
+    sys.path.insert(0, REPO_DIR)
+    import database_schema
+    return database_schema
+
+def book_rentals(data_dir, worker, count, results):
+    db = open_database(data_dir)
+    item_ids = [item.item_id for item in db.load_items()]
+    rng = random.Random(worker)
+    booked = []
+    conflicts = 0
+    for n in range(count):
+        selected = {item_id: rng.randint(1, 3) for item_id in rng.sample(item_ids, 2)}
+        start = date(2026, 1, 1) + timedelta(days=rng.randrange(60))
+        if n % 4 == 0:
+            customer = ("Shared", f"Customer{n % 3}", "555-9999")
+        else:
+            customer = (f"Worker{worker}", f"Stress{n % 5}", f"555-{worker:04d}")
+        try:
+            rental = db.create_rental_record(*customer, f"worker{worker}", start,
+                                             start + timedelta(days=2), selected)
+        except db.ConflictError:
+            conflicts += 1
+            continue
+        booked.append((rental.rental_id, selected))
+    db.flush()
+    results.put((worker, booked, conflicts))
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent booking stress test")
+    parser.add_argument("--processes", type=int, default=8)
+    parser.add_argument("--rentals", type=int, default=50, help="bookings per process")
+    parser.add_argument("--keep", action="store_true", help="keep the data directory")
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix="spotlight-stress-")
+    for name in ("customers.pkl", "items.pkl", "rentals.pkl"):
+        shutil.copy(os.path.join(REPO_DIR, name), data_dir)
+
+    context = multiprocessing.get_context("spawn")
+
+    # Set up from a separate process so this one starts with a clean import
+    setup = context.Process(target=prepare, args=(data_dir,))
+    setup.start()
+    setup.join()
+
+    results = context.Queue()
+    workers = [context.Process(target=book_rentals, args=(data_dir, worker, args.rentals, results))
+               for worker in range(args.processes)]
+    started = time.perf_counter()
+    for process in workers:
+        process.start()
+    outcomes = [results.get() for _ in workers]
+    for process in workers:
+        process.join()
+    elapsed = time.perf_counter() - started
+
+    db = open_database(data_dir)
+    stored = {rental.rental_id: rental for rental in db.load_rentals()}
+    booked = [entry for _, entries, _ in outcomes for entry in entries]
+    conflicts = sum(conflicts for _, _, conflicts in outcomes)
+
+    problems = []
+    booked_ids = [rental_id for rental_id, _ in booked]
+    if len(booked_ids) != len(set(booked_ids)):
+        problems.append("the same rental ID was handed out twice")
+    lost = [rental_id for rental_id in booked_ids if rental_id not in stored]
+    if lost:
+        problems.append(f"{len(lost)} bookings lost: {lost[:10]}")
+
+    customers = {}
+    for customer in db.load_customers():
+        key = (customer.firstname.lower(), customer.surname.lower(), customer.phone)
+        customers[key] = customers.get(key, 0) + 1
+    duplicates = [key for key, count in customers.items() if count > 1]
+    if duplicates:
+        problems.append(f"{len(duplicates)} customers added more than once: {duplicates[:5]}")
+
+    initial = read_initial_stock(data_dir)
+    taken = {}
+    for _, selected in booked:
+        for item_id, quantity in selected.items():
+            taken[item_id] = taken.get(item_id, 0) + quantity
+    for item in db.load_items():
+        expected = initial[item.item_id] - taken.get(item.item_id, 0)
+        if item.quantity != expected:
+            problems.append(f"item {item.item_id}: quantity {item.quantity}, expected {expected}")
+
+    print(f"Backend: {db.BACKEND}")
+    print(f"{len(booked)} bookings from {args.processes} processes in {elapsed:.2f}s "
+          f"({len(booked) / elapsed:.0f}/s), {conflicts} gave up after conflicts")
+    for problem in problems:
+        print("FAIL:", problem)
+    if not problems:
+        print("OK: no bookings lost")
+
+    if args.keep:
+        print(f"Data left in {data_dir}")
+    else:
+        shutil.rmtree(data_dir)
+    sys.exit(1 if problems else 0)
+
+def prepare(data_dir):
+    db = open_database(data_dir)
+    for item in db.load_items():
+        db.adjust_item_quantity(item.item_id, EXTRA_STOCK)
+    db.flush()
+    # Remember the starting stock for the final check
+    with open("initial_stock.txt", "w") as f:
+        for item in db.load_items():
+            f.write(f"{item.item_id} {item.quantity}\n")
+
+def read_initial_stock(data_dir):
+    stock = {}
+    with open(os.path.join(data_dir, "initial_stock.txt")) as f:
+        for line in f:
+            item_id, quantity = map(int, line.split())
+            stock[item_id] = quantity
+    return stock
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import argparse
+import csv
+import json
+import sys
+import time
+from datetime import date, datetime
+from functools import lru_cache
+import database_schema as db
+
+FORMATS = ("csv", "jsonl")
+
+CSV_COLUMNS = ["rental_id", "created", "start_date", "end_date", "customer_id", "customer",
+               "phone", "employee", "items", "total_price", "archived"]
+
+# Customers looked up by the exporter at once - enough to make repeat
+# customers free without holding the whole table
+CUSTOMER_CACHE_SIZE = 10000
+
+def format_time(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+def export_rows(start=None, end=None, include_archive=True):
+    """Yield one dict per rental - current ones, then archived ones -
+    with the customer and item names filled in. start/end (dates) keep
+    only rentals running on some day in that range."""
+    items = {item.item_id: item.name for item in db.load_items()}
+
+    @lru_cache(maxsize=CUSTOMER_CACHE_SIZE)
+    def customer(customer_id):
+        found = db.get_customer(customer_id)
+        if found is None:
+            return "", ""
+        return f"{found.firstname} {found.surname}", found.phone
+
+    def rows(rentals, archived):
+        for rental in rentals:
+            name, phone = customer(rental.customer_id)
+            yield {
+                "rental_id": rental.rental_id,
+                "created": format_time(rental.creation_date),
+                "start_date": format_time(rental.start_date),
+                "end_date": format_time(rental.end_date),
+                "customer_id": rental.customer_id,
+                "customer": name,
+                "phone": phone,
+                "employee": rental.employee,
+                "items": [{"item_id": item_id, "name": items.get(item_id, ""), "quantity": quantity}
+                          for item_id, quantity in rental.items.items()],
+                "total_price": round(rental.total_price, 2),
+                "archived": archived,
+            }
+
+    yield from rows(db.iter_rentals(start, end), False)
+    if include_archive:
+        yield from rows(db.rental_archive.iter_overlapping(start, end), True)
+
+def write_csv(rows, out):
+    writer = csv.writer(out)
+    writer.writerow(CSV_COLUMNS)
+    count = 0
+    for row in rows:
+        row["items"] = "; ".join(f"{item['name'] or item['item_id']} x{item['quantity']}"
+                                 for item in row["items"])
+        writer.writerow([row[column] for column in CSV_COLUMNS])
+        count += 1
+    return count
+
+def write_jsonl(rows, out):
+    count = 0
+    for row in rows:
+        out.write(json.dumps(row))
+        out.write("\n")
+        count += 1
+    return count
+
+def export_rentals(path, file_format=None, start=None, end=None, include_archive=True):
+    """Stream rentals to path as CSV or JSON Lines (picked from the file
+    extension if file_format is None). Returns the number written."""
+    if file_format is None:
+        file_format = "jsonl" if path.lower().endswith((".jsonl", ".json")) else "csv"
+    if file_format not in FORMATS:
+        raise ValueError(f"Unknown export format '{file_format}'")
+    write = write_csv if file_format == "csv" else write_jsonl
+    rows = export_rows(start, end, include_archive)
+    if path == "-":
+        return write(rows, sys.stdout)
+    with open(path, "w", newline="", encoding="utf-8") as out:
+        return write(rows, out)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export rentals to CSV or JSON Lines")
+    parser.add_argument("output", help="file to write, or - for standard output")
+    parser.add_argument("--format", choices=FORMATS,
+                        help="default: from the file extension, otherwise csv")
+    parser.add_argument("--start", type=date.fromisoformat,
+                        help="only rentals running on or after this date (YYYY-MM-DD)")
+    parser.add_argument("--end", type=date.fromisoformat,
+                        help="only rentals running on or before this date (YYYY-MM-DD)")
+    parser.add_argument("--no-archive", action="store_true", help="leave out archived rentals")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    count = export_rentals(args.output, args.format, args.start, args.end, not args.no_archive)
+    elapsed = time.perf_counter() - started
+    if args.output != "-":
+        print(f"Exported {count} rentals to {args.output} in {elapsed:.1f}s")
+    return 0
+
+# Run directly, e.g.
+#   python bulk_export.py rentals_2025.csv --start 2025-01-01 --end 2025-12-31
+if __name__ == "__main__":
+    sys.exit(main())
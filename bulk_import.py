@@ -0,0 +1,263 @@
+import argparse
+import csv
+import sys
+import time
+from datetime import datetime
+import database_schema as db
+
+# Rows validated and written together - one reserve_ids call and one
+# transaction (journal frame) per batch
+BATCH_SIZE = 1000
+
+# Columns each kind of file must have. Rentals name their items as
+# "item:quantity" pairs separated by ";", where item is an item ID or name;
+# a blank total_price is worked out from the item prices as in RentalCreate.
+COLUMNS = {
+    "customers": ["firstname", "surname", "phone"],
+    "items": ["name", "type", "quantity", "price"],
+    "rentals": ["firstname", "surname", "phone", "employee", "start_date", "end_date",
+                "items", "total_price"],
+}
+
+class RowError(Exception):
+    """A CSV row that can't be imported."""
+
+def parse_date(text):
+    text = text.strip()
+    for date_format in ("%Y-%m-%d", "%d/%m/%Y"):
+        try:
+            return datetime.strptime(text, date_format).date()
+        except ValueError:
+            pass
+    raise RowError(f"bad date '{text}' (use YYYY-MM-DD or DD/MM/YYYY)")
+
+def parse_number(text, kind, column):
+    try:
+        value = kind(text.strip())
+    except ValueError:
+        raise RowError(f"{column} must be a number, not '{text}'")
+    if value < 0:
+        raise RowError(f"{column} can't be negative")
+    return value
+
+def required(row, column):
+    value = (row.get(column) or "").strip()
+    if not value:
+        raise RowError(f"{column} is missing")
+    return value
+
+def customer_key(firstname, surname, phone):
+    # Same match as database_schema.find_customer
+    return (firstname.lower(), surname.lower(), phone)
+
+class Importer:
+    """Streams one CSV file into the database in batches, writing bad rows to
+    the error report."""
+
+    def __init__(self, kind, dry_run=False, batch_size=BATCH_SIZE, errors=None):
+        self.kind = kind
+        self.dry_run = dry_run
+        self.batch_size = batch_size
+        self.errors = errors
+        self.rows = 0
+        self.imported = 0
+        self.failed = 0
+
+        # Lookups for duplicate checks and for resolving rental references
+        self.customers = {customer_key(c.firstname, c.surname, c.phone): c.customer_id
+                          for c in db.load_customers()}
+        self.items = {}
+        self.item_prices = {}
+        for item in db.load_items():
+            self.items.setdefault(item.name.lower(), item.item_id)
+            self.item_prices[item.item_id] = item.price
+
+    def run(self, lines):
+        reader = csv.DictReader(lines)
+        missing = [column for column in COLUMNS[self.kind]
+                   if column not in (reader.fieldnames or [])]
+        if missing:
+            raise ValueError(f"{self.kind} file is missing columns: {', '.join(missing)}")
+
+        with db.bulk_load():
+            batch = []
+            for row in reader:
+                self.rows += 1
+                batch.append((reader.line_num, row))
+                if len(batch) >= self.batch_size:
+                    self.import_batch(batch)
+                    batch = []
+            if batch:
+                self.import_batch(batch)
+        db.flush()
+
+    def import_batch(self, batch):
+        parsed = []
+        for line, row in batch:
+            try:
+                parsed.append(getattr(self, "parse_" + self.kind[:-1])(row))
+            except RowError as e:
+                self.report(line, row, e)
+        if not parsed:
+            return
+
+        self.imported += len(parsed)
+        if self.dry_run:
+            return
+        records = getattr(self, "make_" + self.kind)(parsed)
+        with db.transaction() as tx:
+            for name, record in records:
+                tx.put(name, record)
+        # Keep the write-behind queue from growing with the file
+        db.flush()
+
+    def report(self, line, row, error):
+        self.failed += 1
+        if self.errors is not None:
+            self.errors.writerow([line, str(error)] + [row.get(c, "") for c in COLUMNS[self.kind]])
+
+    # Customers
+
+    def parse_customer(self, row):
+        firstname = required(row, "firstname")
+        surname = required(row, "surname")
+        phone = required(row, "phone")
+        key = customer_key(firstname, surname, phone)
+        if key in self.customers:
+            raise RowError("customer already exists")
+        self.customers[key] = None
+        return key, (firstname, surname, phone)
+
+    def make_customers(self, parsed):
+        ids = db.reserve_ids("customers", len(parsed))
+        records = []
+        for customer_id, (key, fields) in zip(ids, parsed):
+            self.customers[key] = customer_id
+            records.append(("customers", db.Customer(customer_id, *fields)))
+        return records
+
+    # Items
+
+    def parse_item(self, row):
+        name = required(row, "name")
+        if name.lower() in self.items:
+            raise RowError(f"an item named '{name}' already exists")
+        quantity = parse_number(required(row, "quantity"), int, "quantity")
+        price = parse_number(required(row, "price"), float, "price")
+        self.items[name.lower()] = None
+        return name, (row.get("type") or "").strip(), quantity, price
+
+    def make_items(self, parsed):
+        ids = db.reserve_ids("items", len(parsed))
+        records = []
+        for item_id, (name, item_type, quantity, price) in zip(ids, parsed):
+            self.items[name.lower()] = item_id
+            self.item_prices[item_id] = price
+            records.append(("items", db.Item(item_id, name, item_type, quantity, price)))
+        return records
+
+    # Rentals
+
+    def parse_item_list(self, text):
+        selected = {}
+        for entry in text.split(";"):
+            if not entry.strip():
+                continue
+            item, _, quantity = entry.rpartition(":")
+            item = item.strip()
+            if not item:
+                raise RowError(f"bad item entry '{entry}' (use item:quantity)")
+            if item.isdigit() and int(item) in self.item_prices:
+                item_id = int(item)
+            else:
+                item_id = self.items.get(item.lower())
+                if item_id is None:
+                    raise RowError(f"unknown item '{item}'")
+            quantity = parse_number(quantity, int, "item quantity")
+            if quantity == 0:
+                raise RowError(f"quantity of '{item}' must be at least 1")
+            selected[item_id] = selected.get(item_id, 0) + quantity
+        if not selected:
+            raise RowError("items is missing")
+        return selected
+
+    def parse_rental(self, row):
+        names = (required(row, "firstname"), required(row, "surname"), required(row, "phone"))
+        start_date = parse_date(required(row, "start_date"))
+        end_date = parse_date(required(row, "end_date"))
+        if end_date < start_date:
+            raise RowError("end_date is before start_date")
+        selected = self.parse_item_list(required(row, "items"))
+
+        total = (row.get("total_price") or "").strip()
+        if total:
+            total = parse_number(total, float, "total_price")
+        else:
+            days = (end_date - start_date).days + 1
+            total = sum(self.item_prices[item_id] * quantity * days
+                        for item_id, quantity in selected.items())
+
+        key = customer_key(*names)
+        if key not in self.customers:
+            # New customers are added along with their first rental
+            self.customers[key] = None
+        return key, names, (row.get("employee") or "").strip(), start_date, end_date, selected, total
+
+    def make_rentals(self, parsed):
+        # Imported rentals are a branch's booking history, so stock levels
+        # (which come from its items file) are left alone, and each gets a
+        # stock return entry so the return scheduler doesn't add it back
+        records = []
+        new_customers = {}
+        for key, names, *_ in parsed:
+            if self.customers[key] is None and key not in new_customers:
+                new_customers[key] = names
+        if new_customers:
+            ids = db.reserve_ids("customers", len(new_customers))
+            for customer_id, (key, names) in zip(ids, new_customers.items()):
+                self.customers[key] = customer_id
+                records.append(("customers", db.Customer(customer_id, *names)))
+
+        ids = db.reserve_ids("rentals", len(parsed))
+        now = datetime.now()
+        for rental_id, (key, _, employee, start_date, end_date, selected, total) in zip(ids, parsed):
+            records.append(("rentals", db.Rental(rental_id, self.customers[key], employee,
+                                                 start_date, end_date, selected, total, now)))
+            records.append(("stock_returns", db.StockReturn(rental_id, {}, now, "imported")))
+        return records
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import customers, items or rentals from a CSV file")
+    parser.add_argument("kind", choices=sorted(COLUMNS))
+    parser.add_argument("csv_file")
+    parser.add_argument("--dry-run", action="store_true", help="check the file without importing it")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--errors", help="where to write rejected rows "
+                                         "(default: CSV_FILE with .errors.csv on the end)")
+    args = parser.parse_args(argv)
+
+    errors_file = args.errors or args.csv_file + ".errors.csv"
+    started = time.perf_counter()
+    with open(args.csv_file, newline="", encoding="utf-8-sig") as lines, \
+         open(errors_file, "w", newline="", encoding="utf-8") as report:
+        errors = csv.writer(report)
+        errors.writerow(["line", "error"] + COLUMNS[args.kind])
+        importer = Importer(args.kind, args.dry_run, args.batch_size, errors)
+        try:
+            importer.run(lines)
+        except ValueError as e:
+            print(f"Error: {e}")
+            return 1
+    elapsed = time.perf_counter() - started
+
+    action = "would import" if args.dry_run else "imported"
+    print(f"{importer.rows} rows read, {importer.imported} {action}, {importer.failed} rejected "
+          f"in {elapsed:.1f}s ({importer.rows / max(elapsed, 1e-9):,.0f} rows/s)")
+    if importer.failed:
+        print(f"Rejected rows are listed in {errors_file}")
+    return 0
+
+# Run directly, e.g.
+#   python bulk_import.py customers new_branch_customers.csv --dry-run
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,70 @@
+from collections import deque
+
+# Milliseconds between checks for changes, including ones other terminals
+# have written
+POLL_INTERVAL = 500
+
+class ChangeFeed:
+    """Queues store changes from any thread and hands them to the open
+    screens' subscribers when poll() runs on the Tk thread."""
+
+    def __init__(self, refresh):
+        self.refresh = refresh
+        self.events = deque()
+        self.subscribers = []
+
+    def on_change(self, op, name, key, record):
+        if self.subscribers:
+            self.events.append((op, name, key, record))
+
+    def subscribe(self, callback, names=None):
+        # callback(op, name, key, record), for the collections in names
+        # (all of them if None)
+        self.subscribers.append((callback, names))
+
+    def unsubscribe(self, callback):
+        self.subscribers = [(c, names) for c, names in self.subscribers if c != callback]
+        if not self.subscribers:
+            self.events.clear()
+
+    def poll(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            print(f"Error checking for changes: {e}")
+
+        # Several changes to one record arrive as the last one, and a reset
+        # drops the events queued before it
+        pending = {}
+        while self.events:
+            op, name, key, record = self.events.popleft()
+            if op == "reset":
+                for event_name, event_key in list(pending):
+                    if name is None or event_name == name:
+                        del pending[(event_name, event_key)]
+            else:
+                # Re-insert so the events keep the order of their last change
+                pending.pop((name, key), None)
+            pending[(name, key)] = (op, name, key, record)
+
+        for op, name, key, record in pending.values():
+            for callback, names in list(self.subscribers):
+                if names is None or name is None or name in names:
+                    callback(op, name, key, record)
+
+    def watch(self, widget, callback, names=None):
+        """Deliver events to callback for as long as widget exists."""
+        self.subscribe(callback, names)
+
+        def tick():
+            if not widget.winfo_exists():
+                return
+            self.poll()
+            widget.after(POLL_INTERVAL, tick)
+
+        def on_destroy(event):
+            if event.widget is widget:
+                self.unsubscribe(callback)
+
+        widget.bind("<Destroy>", on_destroy, add="+")
+        widget.after(POLL_INTERVAL, tick)
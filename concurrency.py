@@ -0,0 +1,71 @@
+import hashlib
+import threading
+
+# Advisory file locks - fcntl on Linux/macOS, msvcrt on Windows
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    try:
+        import msvcrt
+    except ImportError:
+        msvcrt = None
+
+class ConflictError(Exception):
+    """A record changed in another terminal after this one read it."""
+
+def record_version(payload):
+    # Version of a record for optimistic checks - a short hash of its
+    # pickled form, so stores needn't keep a second copy of every record
+    return hashlib.blake2b(payload, digest_size=16).digest()
+
+class FileLock:
+    """Exclusive lock on a lock file, shared by every process using the data
+    directory. Re-entrant within a process."""
+
+    def __init__(self, lock_file):
+        self.lock_file = lock_file
+        self.thread_lock = threading.RLock()
+        self.depth = 0
+        self.handle = None
+
+    def acquire(self):
+        self.thread_lock.acquire()
+        self.depth += 1
+        if self.depth > 1:
+            return
+        try:
+            self.handle = open(self.lock_file, 'a+b')
+            if fcntl is not None:
+                fcntl.flock(self.handle.fileno(), fcntl.LOCK_EX)
+            elif msvcrt is not None:
+                # Retries for about 10 seconds before raising OSError
+                self.handle.seek(0)
+                msvcrt.locking(self.handle.fileno(), msvcrt.LK_LOCK, 1)
+        except:
+            self.depth -= 1
+            if self.handle is not None:
+                self.handle.close()
+                self.handle = None
+            self.thread_lock.release()
+            raise
+
+    def release(self):
+        self.depth -= 1
+        if self.depth == 0:
+            if fcntl is not None:
+                fcntl.flock(self.handle.fileno(), fcntl.LOCK_UN)
+            elif msvcrt is not None:
+                self.handle.seek(0)
+                msvcrt.locking(self.handle.fileno(), msvcrt.LK_UNLCK, 1)
+            self.handle.close()
+            self.handle = None
+        self.thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
@@ -1,19 +1,69 @@
-import pickle
 import os
-from datetime import datetime, timedelta
+import atexit
+import pickle
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from concurrency import ConflictError, FileLock
+from journal_store import JournalStore, file_signature
+from sqlite_backend import SQLiteBackend, migrate_from_journal_store
+from id_sequences import SequenceFile
+from rental_columns import RentalColumns
+from rental_archive import RentalArchive, archivable
+from paging import PAGE_SIZE, SortedIndex, page_cursor
+from migrations import SCHEMA_VERSION, LEDGER_VERSION, upgrade_record
+from rental_indexes import RentalIndexes
+from interval_index import IntervalIndex, day_number
+from availability import OccupancyCalendar
+from return_schedule import ReturnSchedule
+from change_feed import ChangeFeed
 
 # File paths
 CUSTOMERS_FILE = "customers.pkl"
 RENTALS_FILE = "rentals.pkl"
 ITEMS_FILE = "items.pkl"
+JOURNAL_FILE = "database.journal"
+DATABASE_FILE = "spotlight.db"
+SEQUENCES_FILE = "sequences.pkl"
+LOCK_FILE = "database.lock"
+CUSTOMER_LOCK_FILE = "customers.lock"
+ARCHIVE_FILE = "rentals.archive"
+INDEX_FILE = "rental_indexes.pkl"
+RETURNS_FILE = "stock_returns.pkl"
+
+# "pickle" or "sqlite" - defaults to SQLite once the database has been
+# migrated. Decided by bootstrap(); use backend() to read it.
+BACKEND = None
+
+class Record:
+    """Base for the slotted record classes; still unpickles the attribute
+    dicts written before __slots__."""
+    __slots__ = ()
+
+    def __reduce__(self):
+        return (self.__class__, tuple(getattr(self, slot) for slot in self.__slots__))
+
+    def __setstate__(self, state):
+        # Old pickles restore an attribute dict (e.g. with Customer.fullname)
+        if isinstance(state, tuple):
+            state = state[1] or {}
+        for slot in self.__slots__:
+            setattr(self, slot, state.get(slot))
+
+class Customer(Record):
+    __slots__ = ('customer_id', 'firstname', 'surname', 'phone')
 
-class Customer:
     def __init__(self, customer_id, firstname, surname, phone):
         self.customer_id = customer_id
         self.firstname = firstname
         self.surname = surname
         self.phone = phone
-        self.fullname = f"{firstname} {surname}"
+    
+    @property
+    def fullname(self):
+        return f"{self.firstname} {self.surname}"
     
     def to_dict(self):
         return {
@@ -28,7 +78,9 @@ class Customer:
     def from_dict(cls, data):
         return cls(data['customer_id'], data['firstname'], data['surname'], data['phone'])
 
-class Item:
+class Item(Record):
+    __slots__ = ('item_id', 'name', 'type', 'quantity', 'price')
+
     def __init__(self, item_id, name, item_type, quantity, price):
         self.item_id = item_id
         self.name = name
@@ -49,7 +101,10 @@ class Item:
     def from_dict(cls, data):
         return cls(data['item_id'], data['name'], data['type'], data['quantity'], data['price'])
 
-class Rental:
+class Rental(Record):
+    __slots__ = ('rental_id', 'customer_id', 'employee', 'start_date', 'end_date',
+                 'items', 'total_price', 'creation_date')
+
     def __init__(self, rental_id, customer_id, employee, start_date, end_date, items, total_price, creation_date=None):
         self.rental_id = rental_id
         self.customer_id = customer_id
@@ -83,70 +138,912 @@ class Rental:
             data['end_date'], 
             data['items'], 
             data['total_price'],
-            data.get('creation_date', data['start_date'])  # Fallback for old records
+            data['creation_date']
         )
 
+class StockReturn(Record):
+    """Ledger entry for a rental whose stock went back on the shelf.
+    items is what was added back to Item.quantity; reason is "returned"
+    (the rental ended), "cancelled" (deleted before it was returned),
+    "imported" (history from bulk_import, which never took any stock) or
+    "legacy" (ended before the ledger existed, restocked by hand)."""
+    __slots__ = ('rental_id', 'items', 'returned_at', 'reason')
+
+    def __init__(self, rental_id, items, returned_at, reason="returned"):
+        self.rental_id = rental_id
+        self.items = items
+        self.returned_at = returned_at
+        self.reason = reason
+
+# Storage engine - the .pkl files are snapshots and every change is
+# appended to the journal until it is compacted back into them
+journal_store = JournalStore({
+    "customers": (CUSTOMERS_FILE, "customer_id"),
+    "items": (ITEMS_FILE, "item_id"),
+    "rentals": (RENTALS_FILE, "rental_id"),
+    "stock_returns": (RETURNS_FILE, "rental_id"),
+}, JOURNAL_FILE, SCHEMA_VERSION, file_lock=FileLock(LOCK_FILE))
+
+def open_sqlite_backend():
+    return SQLiteBackend(DATABASE_FILE, {
+        "customers": Customer,
+        "items": Item,
+        "rentals": Rental,
+        "stock_returns": StockReturn,
+    }, SCHEMA_VERSION)
+
+class Deferred:
+    """Placeholder for a module global that bootstrap() sets up. The first
+    attribute access runs bootstrap, which replaces the global, so only
+    that first call goes through here."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __getattr__(self, attr):
+        bootstrap()
+        return getattr(globals()[self.name], attr)
+
+# The active storage engine and ID allocator
+store = Deferred("store")
+sequences = Deferred("sequences")
+
+class Repository:
+    """Process-wide in-memory copy of one collection, reloaded when a watched
+    file changes. The record objects are shared - save changes to keep them."""
+
+    def __init__(self, name, snapshot_file):
+        self.name = name
+        self.snapshot_file = snapshot_file
+        self.records = None
+        self.signature = None
+        self.hits = 0
+        self.misses = 0
+
+    def file_signature(self):
+        return tuple(file_signature(path) for path in [self.snapshot_file] + watched_files)
+
+    def load(self):
+        bootstrap()
+        signature = self.file_signature()
+        if self.records is not None and signature == self.signature:
+            self.hits += 1
+        else:
+            self.misses += 1
+            self.records = store.load(self.name)
+            self.signature = signature
+        return list(self.records)
+
+    def invalidate(self):
+        self.records = None
+
+# Files whose changes invalidate the repositories, set by bootstrap()
+watched_files = []
+
+repositories = {
+    "customers": Repository("customers", CUSTOMERS_FILE),
+    "items": Repository("items", ITEMS_FILE),
+    "rentals": Repository("rentals", RENTALS_FILE),
+    "stock_returns": Repository("stock_returns", RETURNS_FILE),
+}
+
+def cache_stats():
+    """Hit/miss counters for each repository."""
+    return {name: {"hits": repo.hits, "misses": repo.misses}
+            for name, repo in repositories.items()}
+
+def written(name):
+    # Local writes always invalidate, even if the mtime didn't move
+    repositories[name].invalidate()
+
+class UnitOfWork:
+    """Changes committed together in one durable write. Records read with
+    get() are checked at commit, which raises ConflictError if they changed."""
+
+    def __init__(self):
+        self.changes = []
+        self.expected = {}
+        # (name, key) -> record as put in this unit of work, None if deleted
+        self.staged = {}
+
+    def get(self, name, key):
+        """Read a private copy of a record and remember its version. A
+        record already put or deleted here comes back as staged, so several
+        changes to one record add up."""
+        if (name, key) in self.staged:
+            record = self.staged[(name, key)]
+            return None if record is None else pickle.loads(pickle.dumps(record))
+        record, self.expected[(name, key)] = store.read(name, key)
+        return record
+
+    def save(self, name, records):
+        records = list(records)
+        self.changes.append(("save", name, records))
+        for record in records:
+            self.staged[(name, journal_store.key_of(name, record))] = record
+
+    def put(self, name, record):
+        self.changes.append(("put", name, record))
+        self.staged[(name, journal_store.key_of(name, record))] = record
+
+    def delete(self, name, key):
+        self.changes.append(("delete", name, key))
+        self.staged[(name, key)] = None
+
+    def commit(self, wait=False):
+        # wait=True also blocks until the write is on disk
+        if self.changes:
+            # Checked commits are written straight away under the file lock
+            store.apply_changes(self.changes, self.expected or None)
+            for name in {change[1] for change in self.changes}:
+                written(name)
+            self.changes = []
+            self.expected = {}
+            self.staged = {}
+        if wait:
+            flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Nothing is written if the block raised
+        if exc_type is None:
+            self.commit()
+        else:
+            self.changes = []
+            self.staged = {}
+        return False
+
+def transaction():
+    return UnitOfWork()
+
+# Attempts made by run_transaction before giving up on a conflict
+TRANSACTION_ATTEMPTS = 10
+
+def run_transaction(work, attempts=TRANSACTION_ATTEMPTS):
+    """Call work(tx) and commit tx, starting again with fresh reads each
+    time another terminal wins a conflict. Returns what work returns."""
+    for attempt in range(1, attempts + 1):
+        tx = transaction()
+        result = work(tx)
+        try:
+            tx.commit()
+            return result
+        except ConflictError:
+            if attempt == attempts:
+                raise
+            # Back off a little so competing terminals spread out
+            time.sleep(random.uniform(0, 0.01 * attempt))
+
+# Saves on the pickle backend are written behind by a background thread
+def flush(timeout=None):
+    """Durability barrier - block until every save so far is on disk."""
+    if BACKEND != "pickle":
+        # SQLite commits synchronously, and nothing was written before
+        # bootstrap
+        return True
+    return journal_store.flush(timeout)
+
+def write_stats():
+    """Write-behind queue depth and flush latency, for tuning the window."""
+    if backend() == "sqlite":
+        return {}
+    return journal_store.writer.stats()
+
+# Don't lose queued writes when the program exits
+atexit.register(flush)
+
+# Change notifications - listeners are called as listener(op, name, key, record)
+# for every insert/update/delete; op "reset" means a collection (or all of
+# them when name is None) was reloaded and derived data should be rebuilt
+change_listeners = []
+
+def add_change_listener(listener):
+    change_listeners.append(listener)
+
+def remove_change_listener(listener):
+    if listener in change_listeners:
+        change_listeners.remove(listener)
+
+# Collections changed while notifications are held back by bulk_load
+held_changes = set()
+bulk_loads = []
+
+def notify_change(op, name, key, record):
+    if bulk_loads:
+        held_changes.add(name)
+        return
+    for listener in list(change_listeners):
+        listener(op, name, key, record)
+
+@contextmanager
+def bulk_load():
+    """Hold back change notifications during a large import. Listeners get
+    one reset per changed collection at the end, so derived structures are
+    rebuilt once instead of updated a million times."""
+    with store.lock:
+        bulk_loads.append(True)
+    try:
+        yield
+    finally:
+        with store.lock:
+            bulk_loads.pop()
+            if not bulk_loads:
+                names = sorted(held_changes, key=str)
+                held_changes.clear()
+                for name in names:
+                    notify_change("reset", name, None, None)
+
+def refresh(wait=True):
+    """Pick up changes written by other processes. With wait=False this
+    is skipped, rather than waiting, while a writer holds the store."""
+    if wait:
+        store.refresh()
+    elif store.lock.acquire(blocking=False):
+        try:
+            store.refresh()
+        finally:
+            store.lock.release()
+
+# Change events for the open screens, including changes made in other
+# terminals (see change_feed.ChangeFeed)
+change_feed = ChangeFeed(lambda: refresh(wait=False))
+add_change_listener(change_feed.on_change)
+
+def watch_changes(widget, callback, names=None):
+    """Call callback(op, name, key, record) on the Tk thread for every
+    change to the collections in names, until widget is destroyed."""
+    change_feed.watch(widget, callback, names)
+
+# Columnar copy of the rentals for analytics, kept in sync by notify_change
+rental_table = RentalColumns()
+add_change_listener(rental_table.on_change)
+
+def up_to_date(structure, *names):
+    # Rebuild a listener-maintained structure from the named collections
+    # if a reset marked it stale. Holds the store lock so no change can slip in
+    # between the load and the rebuild. A structure that isn't stale is
+    # used as it is while a writer holds the lock, rather than waiting.
+    if not structure.stale:
+        if not store.lock.acquire(blocking=False):
+            return structure
+        store.lock.release()
+    with store.lock:
+        refresh()
+        if structure.stale:
+            structure.rebuild(*(store.load(name) for name in names))
+    return structure
+
+def rental_columns():
+    """The rentals as typed columns (see rental_columns.RentalColumns)."""
+    return up_to_date(rental_table, "rentals")
+
+# Secondary indexes for the pickle backend (SQLite has its own), kept in
+# sync by notify_change and saved between runs
+rental_index = RentalIndexes(INDEX_FILE)
+add_change_listener(rental_index.on_change)
+
+def store_position():
+    # Identifies the data files on disk, to tell if saved indexes still match
+    return (journal_store.snapshot_signatures(), file_signature(JOURNAL_FILE))
+
+def rental_indexes():
+    """customer/item/employee -> rental ID indexes (pickle backend)."""
+    with store.lock:
+        refresh()
+        if rental_index.stale:
+            # Saved indexes can't include writes that are still queued
+            if journal_store.unflushed or not rental_index.load(store_position()):
+                rental_index.rebuild(store.load("rentals"))
+    return rental_index
+
+def rebuild_indexes():
+    """Rebuild the secondary indexes, the occupancy calendar and the return
+    schedule from scratch."""
+    with store.lock:
+        refresh()
+        occupancy_calendar.rebuild(store.load("rentals"), store.load("stock_returns"))
+        return_schedule.rebuild(store.load("rentals"), store.load("stock_returns"))
+    if backend() == "sqlite":
+        store.reindex()
+        return
+    with store.lock:
+        rental_index.rebuild(store.load("rentals"))
+    save_indexes()
+
+def check_indexes():
+    """Check the secondary indexes and the occupancy calendar against the
+    rentals; returns a list of problems, empty if everything matches."""
+    with store.lock:
+        problems = occupancy().check(load_rentals(), load_stock_returns())
+    if backend() == "sqlite":
+        return problems + store.check_indexes()
+    with store.lock:
+        return problems + rental_indexes().check(store.load("rentals"))
+
+def save_indexes():
+    if BACKEND != "pickle":
+        return
+    flush()
+    with store.lock:
+        if not journal_store.unflushed:
+            rental_index.save(store_position())
+
+# Runs before the flush registered above, so it flushes first itself
+atexit.register(save_indexes)
+
+# Rentals by date range, for the pickle backend's date queries
+rental_intervals = IntervalIndex()
+add_change_listener(rental_intervals.on_change)
+
+# Units of each item booked per day, for date-aware stock checks (both
+# backends)
+occupancy_calendar = OccupancyCalendar()
+add_change_listener(occupancy_calendar.on_change)
+
+def occupancy():
+    """The per-item daily booking calendar (see availability.OccupancyCalendar)."""
+    refresh()
+    return up_to_date(occupancy_calendar, "rentals", "stock_returns")
+
+def item_availability(items, start, end, exclude_rental=None):
+    """{item_id: units free on every day from start to end} for the given
+    Items: their current quantity plus the units out with rentals that
+    haven't been returned, less the most booked on any of those days.
+    exclude_rental leaves one rental's booking out, for checking an edit
+    to it."""
+    calendar = occupancy()
+    return {item.item_id: calendar.free_units(item.item_id, item.quantity, as_date(start),
+                                              as_date(end), exclude_rental)
+            for item in items}
+
+def available_today(items):
+    """{item_id: units free today} for the given Items, for the stock
+    screens. Item.quantity can be below zero when bookings for later
+    dates have taken more than is free today, so it isn't shown as is."""
+    today = date.today()
+    return {item_id: max(units, 0)
+            for item_id, units in item_availability(items, today, today).items()}
+
+def item_bookings(item_id, start, end):
+    """Units of an item booked on each day from start to end, as a list."""
+    return occupancy().booked(item_id, as_date(start), as_date(end))
+
+# Rentals still to come back, by end date (both backends)
+return_schedule = ReturnSchedule()
+add_change_listener(return_schedule.on_change)
+
+def stock_return_schedule():
+    """The return schedule (see return_schedule.ReturnSchedule)."""
+    return up_to_date(return_schedule, "rentals", "stock_returns")
+
+# Paging - list screens fetch one page at a time instead of everything
+sorted_indexes = {}
+
+def sorted_index(name, order):
+    # Sorted copy of a collection for paging the pickle backend
+    index = sorted_indexes.get((name, order))
+    if index is None:
+        index = SortedIndex(name, order, journal_store.collections[name][1])
+        sorted_indexes[(name, order)] = index
+        add_change_listener(index.on_change)
+    return up_to_date(index, name)
+
+def load_page(name, order, offset=0, limit=PAGE_SIZE, after=None, descending=False):
+    if backend() == "sqlite":
+        # Ask for one extra row to find out whether there is another page
+        records = store.load_page(name, order, offset, limit + 1, after, descending)
+        if len(records) <= limit:
+            return records, None
+        records = records[:limit]
+        key_attr = journal_store.collections[name][1]
+        return records, page_cursor(name, order, key_attr, records[-1])
+    return sorted_index(name, order).page(offset, limit, after, descending)
+
+def page_sort_key(name, order):
+    """The order load_page returns name in, as a key function (for
+    tree_pager.TreePager)."""
+    key_attr = journal_store.collections[name][1]
+    return lambda record: page_cursor(name, order, key_attr, record)
+
+def load_rentals_page(offset=0, limit=PAGE_SIZE, after=None, order="date", descending=False):
+    """One page of rentals plus the cursor for the next page (None on the
+    last page). Pass the cursor back as after to continue from there; order
+    is "date" (start date) or "id"."""
+    return load_page("rentals", order, offset, limit, after, descending)
+
+def load_customers_page(offset=0, limit=PAGE_SIZE, after=None, order="name", descending=False):
+    """Like load_rentals_page, ordered by "name" (surname, first name) or "id"."""
+    return load_page("customers", order, offset, limit, after, descending)
+
+def load_items_page(offset=0, limit=PAGE_SIZE, after=None, order="name", descending=False):
+    """Like load_rentals_page, ordered by "name" or "id"."""
+    return load_page("items", order, offset, limit, after, descending)
+
 # Database functions
 def load_customers():
-    if os.path.exists(CUSTOMERS_FILE):
-        try:
-            with open(CUSTOMERS_FILE, 'rb') as f:
-                return pickle.load(f)
-        except:
-            return []
-    return []
+    return repositories["customers"].load()
 
 def save_customers(customers):
-    with open(CUSTOMERS_FILE, 'wb') as f:
-        pickle.dump(customers, f)
+    store.save("customers", customers)
+    written("customers")
+
+def add_customer(customer):
+    store.put("customers", customer)
+    written("customers")
+
+def delete_customer(customer_id):
+    store.delete("customers", customer_id)
+    written("customers")
 
 def load_rentals():
-    if os.path.exists(RENTALS_FILE):
-        try:
-            with open(RENTALS_FILE, 'rb') as f:
-                return pickle.load(f)
-        except:
-            return []
-    return []
+    return repositories["rentals"].load()
 
 def save_rentals(rentals):
-    with open(RENTALS_FILE, 'wb') as f:
-        pickle.dump(rentals, f)
+    store.save("rentals", rentals)
+    written("rentals")
+
+def add_rental(rental):
+    store.put("rentals", rental)
+    written("rentals")
+
+def delete_rental(rental_id):
+    store.delete("rentals", rental_id)
+    written("rentals")
 
 def load_items():
-    if os.path.exists(ITEMS_FILE):
-        try:
-            with open(ITEMS_FILE, 'rb') as f:
-                return pickle.load(f)
-        except:
-            return []
-    return []
+    return repositories["items"].load()
 
 def save_items(items):
-    with open(ITEMS_FILE, 'wb') as f:
-        pickle.dump(items, f)
+    store.save("items", items)
+    written("items")
+
+def add_item(item):
+    store.put("items", item)
+    written("items")
+
+def delete_item(item_id):
+    store.delete("items", item_id)
+    written("items")
+
+def load_stock_returns():
+    return repositories["stock_returns"].load()
+
+# Lookups by ID - a dict lookup on the pickle backend, an indexed query on SQLite
+def get_customer(customer_id):
+    return store.get("customers", customer_id)
+
+def get_item(item_id):
+    return store.get("items", item_id)
+
+def get_rental(rental_id):
+    rental = store.get("rentals", rental_id)
+    if rental is None:
+        rental = rental_archive.get(rental_id)
+    return rental
+
+def find_rentals(customer_id=None, employee=None, item_id=None, start=None, end=None):
+    """Rentals matching every given filter; start/end select rentals that
+    overlap that date range."""
+    if backend() == "sqlite":
+        return store.find_rentals(customer_id, employee, item_id, start, end)
+
+    # Intersect the matching secondary/interval index entries before
+    # touching any rental
+    if customer_id is None and employee is None and item_id is None and start is None and end is None:
+        return load_rentals()
+
+    candidates = []
+    if customer_id is not None or employee is not None or item_id is not None:
+        index = rental_indexes()
+        if customer_id is not None:
+            candidates.append(index.customer_rentals(customer_id))
+        if employee is not None:
+            candidates.append(index.employee_rentals(employee))
+        if item_id is not None:
+            candidates.append(index.item_rentals(item_id))
+    if start is not None or end is not None:
+        candidates.append(up_to_date(rental_intervals, "rentals").overlapping(start, end))
+    return rentals_by_id(set.intersection(*candidates))
+
+def iter_rentals(start=None, end=None):
+    """Yield current rentals, optionally only those overlapping start..end,
+    without building a list - for exports over the whole table."""
+    if backend() == "sqlite":
+        yield from store.iter_rentals(start, end)
+        return
+
+    # The published snapshot never changes, so it can be walked directly
+    rentals = journal_store.snapshot()["rentals"]
+    if start is None and end is None:
+        yield from rentals.values()
+        return
+    for rental_id in sorted(up_to_date(rental_intervals, "rentals").overlapping(start, end)):
+        rental = rentals.get(rental_id)
+        if rental is not None:
+            yield rental
+
+def rentals_active_on(day):
+    """Rentals running on the given date."""
+    return find_rentals(start=day, end=day)
+
+def rentals_overlapping(start, end):
+    """Rentals running on any day from start to end inclusive."""
+    return find_rentals(start=start, end=end)
+
+def rentals_by_id(rental_ids):
+    rentals = (store.get("rentals", rental_id) for rental_id in sorted(rental_ids))
+    return [rental for rental in rentals if rental is not None]
+
+def item_has_rentals(item_id):
+    """True if any current or archived rental includes the item."""
+    return bool(find_rentals(item_id=item_id)) or rental_archive.has_item(item_id)
+
+def search_rentals(firstname="", surname="", employee=""):
+    """Rentals whose customer name and employee contain the given text."""
+    if backend() == "sqlite":
+        return store.search_rentals(firstname, surname, employee)
+
+    firstname = firstname.lower()
+    surname = surname.lower()
+    employee = employee.lower()
+    if not (firstname or surname or employee):
+        return load_rentals()
+
+    # Match the (few) customers and employees, then follow the indexes
+    index = rental_indexes()
+    rental_ids = None
+    if firstname or surname:
+        rental_ids = set()
+        for customer in load_customers():
+            if firstname in customer.firstname.lower() and surname in customer.surname.lower():
+                rental_ids |= index.customer_rentals(customer.customer_id)
+    if employee:
+        employee_ids = set()
+        for name in index.employees():
+            if employee in str(name).lower():
+                employee_ids |= index.employee_rentals(name)
+        rental_ids = employee_ids if rental_ids is None else rental_ids & employee_ids
+    return rentals_by_id(rental_ids)
+
+def as_date(value):
+    # Rentals may hold either date or datetime objects
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
+# Closed rentals from past years live in a read-only mmap archive
+rental_archive = RentalArchive(ARCHIVE_FILE, Rental)
+
+def archive_rentals(before=None):
+    """Move rentals that ended before the given date (default: the start of
+    this year) out of the hot store into ARCHIVE_FILE. Returns how many moved.
+    """
+    if before is None:
+        before = date(date.today().year, 1, 1)
+    # Only rentals whose stock is back on the shelf can leave the store
+    return_stock()
+    returned = {entry.rental_id for entry in load_stock_returns()}
+    closed = [rental for rental in load_rentals()
+              if as_date(rental.end_date) < before and archivable(rental)
+              and rental.rental_id in returned]
+    if not closed:
+        return 0
+
+    # Archive first - if we crash before the delete the rental is just in
+    # both places, and the hot copy wins on reads
+    rental_archive.add(closed)
+    with transaction() as tx:
+        for rental in closed:
+            tx.delete("rentals", rental.rental_id)
+    flush()
+    return len(closed)
+
+def customer_history(customer_id):
+    """Every rental for a customer, current and archived, newest first."""
+    rentals = find_rentals(customer_id=customer_id)
+    current = {rental.rental_id for rental in rentals}
+    rentals.extend(rental for rental in rental_archive.customer_history(customer_id)
+                   if rental.rental_id not in current)
+    rentals.sort(key=lambda r: as_date(r.start_date), reverse=True)
+    return rentals
+
+def revenue_by_year(year):
+    """(revenue, rental count) for rentals created in the given year."""
+    archived_revenue, archived_count = rental_archive.revenue_by_year(year)
+    revenue, count = rental_columns().revenue_between(date(year, 1, 1), date(year, 12, 31))
+    return archived_revenue + revenue, archived_count + count
+
+def migrate_schema():
+    """Upgrade data written by an older schema version (see migrations.py)."""
+    if backend() == "sqlite":
+        return store.upgrade()
+    return upgrade_pickle_files()
+
+def upgrade_pickle_files():
+    # Oldest schema version among the files on disk, None on a new install
+    versions = [journal_store.snapshot_version(snapshot_file)
+                for snapshot_file, _ in journal_store.collections.values()]
+    versions.append(journal_store.journal_version())
+    versions = [version for version in versions if version is not None]
+    if versions and min(versions) < LEDGER_VERSION:
+        # Written before the files are stamped with the new version, so a
+        # crash in between just repeats it
+        record_legacy_returns()
+    return journal_store.upgrade(upgrade_record)
+
+def record_legacy_returns():
+    # Rentals that ended before the stock_returns ledger existed had their
+    # stock put back by hand; mark them returned so return_stock skips them
+    today = date.today()
+    now = datetime.now()
+    changes = [("put", "stock_returns", StockReturn(rental.rental_id, {}, now, "legacy"))
+               for rental in journal_store.load("rentals")
+               if as_date(rental.end_date) < today
+               and journal_store.get("stock_returns", rental.rental_id) is None]
+    if changes:
+        journal_store.apply_changes(changes)
+        journal_store.flush()
+
+def migrate_to_sqlite():
+    """One-shot copy of the pickle snapshots and journal into DATABASE_FILE."""
+    bootstrap()
+    journal_store.flush()
+    upgrade_pickle_files()
+    backend = open_sqlite_backend()
+    try:
+        counts = migrate_from_journal_store(journal_store, backend)
+        # The pickle files are already upgraded, so the SQL migrations
+        # mustn't run over the copy
+        backend.mark_current()
+        backend.restore_sequences(SequenceFile(SEQUENCES_FILE).read())
+        return counts
+    finally:
+        backend.close()
+
+# ID allocation - constant time, and IDs are never reused after a delete
+def reserve_ids(name, count=1):
+    """Reserve a block of count IDs for a collection (e.g. for bulk imports)."""
+    def first_free_id():
+        # Only runs the first time a sequence is used
+        key_attr = journal_store.collections[name][1]
+        records = repositories[name].load()
+        highest = max((getattr(r, key_attr) for r in records), default=0)
+        if name == "rentals":
+            highest = max(highest, rental_archive.max_id())
+        return highest + 1
+
+    return sequences.allocate(name, count, first_free_id)
 
 def get_next_customer_id():
-    customers = load_customers()
-    if not customers:
-        return 1
-    return max(c.customer_id for c in customers) + 1
+    return reserve_ids("customers")[0]
 
 def get_next_rental_id():
-    rentals = load_rentals()
-    if not rentals:
-        return 1
-    return max(r.rental_id for r in rentals) + 1
+    return reserve_ids("rentals")[0]
 
 def get_next_item_id():
-    items = load_items()
-    if not items:
-        return 1
-    return max(i.item_id for i in items) + 1
+    return reserve_ids("items")[0]
+
+# Bookings - safe to run from several terminals at once
+
+# Held by create_rental_record from the customer lookup to the commit, so
+# two terminals booking for the same new customer don't both add them
+customer_lock = FileLock(CUSTOMER_LOCK_FILE)
+def find_customer(firstname, surname, phone):
+    for customer in load_customers():
+        if (customer.firstname.lower() == firstname.lower() and
+            customer.surname.lower() == surname.lower() and
+            customer.phone == phone):
+            return customer
+    return None
+
+def check_availability(items, selected_items, start_date, end_date, exclude_rental=None):
+    # items maps each selected item ID to its Item (None if deleted).
+    # Raises ValueError unless every selected quantity is free on every
+    # day of the booking
+    for item_id, item in items.items():
+        if item is None:
+            raise ValueError(f"Item {item_id} no longer exists!")
+    free = item_availability(items.values(), start_date, end_date, exclude_rental)
+    for item_id, quantity in selected_items.items():
+        if free[item_id] < quantity:
+            # Name the busiest day, so staff know which date to move
+            booked = item_bookings(item_id, start_date, end_date)
+            busiest = as_date(start_date) + timedelta(days=booked.index(max(booked)))
+            raise ValueError(f"Not enough {items[item_id].name} available for those dates "
+                             f"({max(free[item_id], 0)} free, busiest day "
+                             f"{busiest.strftime('%d/%m/%Y')})!")
+
+def create_rental_record(firstname, surname, phone, employee, start_date, end_date, selected_items):
+    """Book selected_items ({item_id: quantity}) for a customer, adding the
+    customer if they are new. Stock comes off the current quantities, so
+    bookings from other terminals are never overwritten. Raises ValueError
+    if the items aren't free for those dates. Returns the new Rental."""
+    days = (as_date(end_date) - as_date(start_date)).days + 1
+    rental_id = get_next_rental_id()
+    new_customer_ids = []
+
+    def work(tx):
+        # Looked up on every attempt, after any booking that held the
+        # customer lock first has been read in, so a customer another
+        # terminal has just added is found rather than added again
+        refresh()
+        customer = find_customer(firstname, surname, phone)
+        if customer is None:
+            if not new_customer_ids:
+                new_customer_ids.append(get_next_customer_id())
+            customer = Customer(new_customer_ids[0], firstname, surname, phone)
+            tx.put("customers", customer)
+        else:
+            # Checked at commit, in case it is changed or deleted meanwhile
+            tx.get("customers", customer.customer_id)
+
+        items = {item_id: tx.get("items", item_id) for item_id in selected_items}
+        check_availability(items, selected_items, start_date, end_date)
+        total = 0.0
+        for item_id, quantity in selected_items.items():
+            item = items[item_id]
+            item.quantity -= quantity
+            total += item.price * quantity * days
+            tx.put("items", item)
+
+        rental = Rental(rental_id, customer.customer_id, employee, start_date, end_date,
+                        dict(selected_items), total, datetime.now())
+        tx.put("rentals", rental)
+        return rental
+
+    with customer_lock:
+        return run_transaction(work)
+
+def update_rental_record(rental_id, customer_id, firstname, surname, phone,
+                         start_date, end_date, selected_items):
+    """Change a rental's customer details, dates and items, moving stock
+    between the old and new items. Raises ValueError if the items aren't
+    free for the new dates. Returns the updated Rental."""
+    days = (as_date(end_date) - as_date(start_date)).days + 1
+
+    def work(tx):
+        rental = tx.get("rentals", rental_id)
+        if rental is None:
+            raise ValueError("Rental not found!")
+
+        items = {}
+        for item_id in set(rental.items) | set(selected_items):
+            item = tx.get("items", item_id)
+            if item is not None:
+                items[item_id] = item
+
+        check_availability({item_id: items.get(item_id) for item_id in selected_items},
+                           selected_items, start_date, end_date, rental_id)
+
+        # Return the old booking to stock, then take the new one. If the
+        # rental was already returned its stock is back on the shelf, and
+        # the new booking goes out again until the rental is returned anew.
+        returned = tx.get("stock_returns", rental_id)
+        if returned is None:
+            for item_id, quantity in rental.items.items():
+                if item_id in items:
+                    items[item_id].quantity += quantity
+        else:
+            tx.delete("stock_returns", rental_id)
+        total = 0.0
+        for item_id, quantity in selected_items.items():
+            item = items[item_id]
+            item.quantity -= quantity
+            total += item.price * quantity * days
+        for item in items.values():
+            tx.put("items", item)
+
+        customer = tx.get("customers", customer_id)
+        if customer and (customer.firstname, customer.surname, customer.phone) != (firstname, surname, phone):
+            customer.firstname = firstname
+            customer.surname = surname
+            customer.phone = phone
+            tx.put("customers", customer)
+
+        rental.customer_id = customer_id
+        rental.start_date = start_date
+        rental.end_date = end_date
+        rental.items = dict(selected_items)
+        rental.total_price = total
+        tx.put("rentals", rental)
+        return rental
+
+    return run_transaction(work)
+
+def adjust_item_quantity(item_id, amount):
+    """Add amount (which may be negative) to an item's stock. A restock
+    adds exactly amount, even to an item whose quantity is below zero from
+    bookings for later dates. Stock can only be taken away while no
+    booking from today on needs it - otherwise this raises ValueError.
+    Returns the updated Item, or None if it doesn't exist."""
+    def work(tx):
+        item = tx.get("items", item_id)
+        if item is None:
+            return None
+        if amount < 0:
+            spare = item_availability([item], date.today(), None)[item_id]
+            if -amount > spare:
+                raise ValueError(f"Only {max(spare, 0)} {item.name} can be removed - "
+                                 "the rest are needed for bookings!")
+        item.quantity += amount
+        tx.put("items", item)
+        return item
+
+    return run_transaction(work)
+
+def cancel_in(tx, rental_id):
+    """cancel_rental as part of a larger unit of work - every rental
+    deleted from the screens goes through here so its stock comes back."""
+    rental = tx.get("rentals", rental_id)
+    if rental is None:
+        return False
+    if tx.get("stock_returns", rental_id) is None:
+        returned = {}
+        for item_id, quantity in rental.items.items():
+            item = tx.get("items", item_id)
+            if item is not None:
+                item.quantity += quantity
+                returned[item_id] = quantity
+                tx.put("items", item)
+        tx.put("stock_returns", StockReturn(rental_id, returned, datetime.now(), "cancelled"))
+    tx.delete("rentals", rental_id)
+    return True
+
+def cancel_rental(rental_id):
+    """Delete a rental, putting its stock back on the shelf unless it has
+    already been returned. Returns False if the rental doesn't exist."""
+    return run_transaction(lambda tx: cancel_in(tx, rental_id))
+
+def return_stock(today=None):
+    """Put the stock of every rental that ended before today back on the
+    shelf, with a StockReturn ledger entry each. However many are overdue,
+    it is one transaction (one journal frame, or one SQLite commit), and a
+    rental another terminal returned first is skipped. Returns the
+    StockReturns written."""
+    today = today or date.today()
+    rental_ids = stock_return_schedule().due(day_number(today))
+    if not rental_ids:
+        return []
+
+    def work(tx):
+        returns = []
+        units = {}
+        for rental_id in rental_ids:
+            rental = tx.get("rentals", rental_id)
+            if (rental is None or as_date(rental.end_date) >= today or
+                    tx.get("stock_returns", rental_id) is not None):
+                # Deleted, moved or returned since the schedule was read
+                continue
+            returns.append(rental)
+            for item_id, quantity in rental.items.items():
+                units[item_id] = units.get(item_id, 0) + quantity
+
+        items = {}
+        for item_id, quantity in units.items():
+            item = tx.get("items", item_id)
+            if item is not None:
+                item.quantity += quantity
+                items[item_id] = item
+                tx.put("items", item)
+
+        now = datetime.now()
+        entries = []
+        for rental in returns:
+            # Items deleted since the booking have nothing to go back to
+            returned = {item_id: quantity for item_id, quantity in rental.items.items()
+                        if item_id in items}
+            entry = StockReturn(rental.rental_id, returned, now)
+            tx.put("stock_returns", entry)
+            entries.append(entry)
+        return entries
+
+    return run_transaction(work)
 
 def init_sample_data():
     """Initialize sample data if files don't exist"""
-    if not os.path.exists(CUSTOMERS_FILE):
+    if not store.exists("customers"):
         customers = [
             Customer(1, "John", "Tucker", "555-0101"),
             Customer(2, "Mike", "Howell", "555-0102"),
@@ -156,7 +1053,7 @@ def init_sample_data():
         ]
         save_customers(customers)
     
-    if not os.path.exists(ITEMS_FILE):
+    if not store.exists("items"):
         items = [
             Item(1, "Stage (size 1)", "Stage", 5, 100.00),
             Item(2, "Stage (size 2)", "Stage", 3, 150.00),
@@ -169,14 +1066,53 @@ def init_sample_data():
         ]
         save_items(items)
     
-    if not os.path.exists(RENTALS_FILE):
+    if not store.exists("rentals") and not len(rental_archive):
         rentals = [
             Rental(1, 1, "admin", datetime(2025, 12, 31), datetime(2026, 1, 2), 
                   {1: 1, 3: 2, 6: 4}, 300.00),
             Rental(2, 2, "admin", datetime(2025, 1, 7), datetime(2026, 1, 8), 
                   {2: 1, 4: 2, 5: 1}, 285.00),
         ]
-        save_rentals(rentals)
+        # The sample stock levels don't have these taken off, so there is
+        # nothing for them to give back
+        with transaction() as tx:
+            for rental in rentals:
+                tx.put("rentals", rental)
+                tx.put("stock_returns", StockReturn(rental.rental_id, {}, datetime.now(), "imported"))
+
+# Start-up - runs on first use rather than at import, so importing this
+# module (e.g. from a screen that is never opened) touches no files
+bootstrapped = False
+bootstrap_lock = threading.RLock()
+
+def bootstrap():
+    """Open the database, upgrade old data files and add the sample data
+    if there is none. Runs once per process; every database function calls
+    it, so it only needs calling directly to do the work up front."""
+    global BACKEND, store, sequences, watched_files, bootstrapped
+    if bootstrapped:
+        return
+    with bootstrap_lock:
+        # Calls made by the start-up work itself see the store already set
+        if bootstrapped or not isinstance(store, Deferred):
+            return
+        BACKEND = os.environ.get("SPOTLIGHT_BACKEND",
+                                 "sqlite" if os.path.exists(DATABASE_FILE) else "pickle")
+        if BACKEND == "sqlite":
+            store = open_sqlite_backend()
+            sequences = store
+            watched_files = [DATABASE_FILE, DATABASE_FILE + "-wal"]
+        else:
+            store = journal_store
+            sequences = SequenceFile(SEQUENCES_FILE, journal_store.file_lock)
+            watched_files = [JOURNAL_FILE]
+        store.listeners.append(notify_change)
+
+        migrate_schema()
+        init_sample_data()
+        bootstrapped = True
 
-# Initialize sample data on import
-init_sample_data()
\ No newline at end of file
+def backend():
+    """The storage engine in use, "pickle" or "sqlite"."""
+    bootstrap()
+    return BACKEND
\ No newline at end of file
@@ -0,0 +1,70 @@
+import os
+import pickle
+from concurrency import FileLock
+
+# What pickle.load raises for a truncated or corrupt file
+UNREADABLE = (EOFError, pickle.UnpicklingError, ValueError, TypeError, AttributeError, IndexError)
+
+class SequenceFile:
+    """Next free ID of each collection, kept in one small pickle file so IDs
+    are never reused after a delete."""
+
+    def __init__(self, sequences_file, file_lock=None):
+        self.sequences_file = sequences_file
+        # Held across read-increment-write so two processes never get the
+        # same IDs
+        self.lock = file_lock or FileLock(sequences_file + ".lock")
+
+    def read(self):
+        """{name: next free ID}, empty if no sequence has been used yet.
+
+        A damaged file raises ValueError rather than letting the sequences
+        start again from the highest current ID, which would hand out the
+        IDs of deleted records. If a write was interrupted after its temp
+        file was complete, the temp file is used instead - it is never
+        behind the file it was replacing.
+        """
+        if not os.path.exists(self.sequences_file):
+            return {}
+        try:
+            return self.load(self.sequences_file)
+        except UNREADABLE as e:
+            error = e
+        try:
+            return self.load(self.sequences_file + ".tmp")
+        except (OSError,) + UNREADABLE:
+            raise ValueError(f"{self.sequences_file} is damaged ({error!r}) - restore it "
+                             "from a backup so deleted records' IDs aren't reused") from error
+
+    def load(self, path):
+        with open(path, 'rb') as f:
+            sequences = pickle.load(f)
+        if not isinstance(sequences, dict):
+            raise ValueError(f"{path} doesn't hold a sequences dict")
+        return sequences
+
+    def write(self, sequences):
+        temp_file = self.sequences_file + ".tmp"
+        with open(temp_file, 'wb') as f:
+            pickle.dump(sequences, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_file, self.sequences_file)
+
+    def allocate(self, name, count=1, seed=None):
+        """Reserve count consecutive IDs and return them as a range.
+
+        seed is called once, the first time a sequence is used, to find the
+        first free ID for data created before sequences existed.
+        """
+        if count < 1:
+            raise ValueError("count must be at least 1")
+
+        with self.lock:
+            sequences = self.read()
+            if name not in sequences:
+                sequences[name] = seed() if seed else 1
+            first_id = sequences[name]
+            sequences[name] = first_id + count
+            self.write(sequences)
+        return range(first_id, first_id + count)
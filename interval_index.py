@@ -0,0 +1,72 @@
+import threading
+from bisect import bisect_left, bisect_right, insort
+from datetime import date, datetime
+
+FIRST_DAY = date.min.toordinal()
+LAST_DAY = date.max.toordinal()
+
+def day_number(value):
+    # Ordinal day of a date or datetime
+    if isinstance(value, datetime):
+        value = value.date()
+    return value.toordinal()
+
+class IntervalIndex:
+    """Rentals as (start day, end day, rental_id) entries sorted by start,
+    for finding the rentals running on given days."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stale = True
+        self.entries = []
+        self.entry_of = {}
+        # Longest rental in days. Nothing overlapping a range starts more
+        # than this before it; it only grows between rebuilds, so it stays
+        # a safe bound after deletes
+        self.max_length = 0
+
+    def entry(self, rental):
+        return (day_number(rental.start_date), day_number(rental.end_date), rental.rental_id)
+
+    def add(self, rental):
+        entry = self.entry(rental)
+        insort(self.entries, entry)
+        self.entry_of[rental.rental_id] = entry
+        self.max_length = max(self.max_length, entry[1] - entry[0])
+
+    def remove(self, rental_id):
+        entry = self.entry_of.pop(rental_id, None)
+        if entry is not None:
+            del self.entries[bisect_left(self.entries, entry)]
+
+    def rebuild(self, rentals):
+        with self.lock:
+            self.entry_of = {rental.rental_id: self.entry(rental) for rental in rentals}
+            self.entries = sorted(self.entry_of.values())
+            self.max_length = max((end - start for start, end, _ in self.entries), default=0)
+            self.stale = False
+
+    def on_change(self, op, name, key, record):
+        if op == "reset":
+            if name in (None, "rentals"):
+                self.stale = True
+            return
+        if name != "rentals" or self.stale:
+            return
+        with self.lock:
+            self.remove(key)
+            if op != "delete":
+                self.add(record)
+
+    def overlapping(self, first, last):
+        """IDs of rentals running on any day from first to last (dates)."""
+        first = FIRST_DAY if first is None else day_number(first)
+        last = LAST_DAY if last is None else day_number(last)
+        with self.lock:
+            low = bisect_left(self.entries, (max(first - self.max_length, FIRST_DAY),))
+            high = bisect_right(self.entries, (last, LAST_DAY + 1))
+            return {rental_id for start, end, rental_id in self.entries[low:high] if end >= first}
+
+    def active_on(self, day):
+        """IDs of rentals running on day."""
+        return self.overlapping(day, day)
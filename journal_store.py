@@ -0,0 +1,508 @@
+import os
+import pickle
+import threading
+from write_behind import WriteBehindQueue
+from concurrency import ConflictError, FileLock, record_version
+
+# Number of journal frames written before a background compaction starts
+COMPACT_THRESHOLD = 200
+
+# Snapshots are written as a header followed by frames of this many records,
+# so they can be read and rewritten without holding the whole file in memory
+SNAPSHOT_FRAME = 1000
+SNAPSHOT_FORMAT = "spotlight-snapshot"
+JOURNAL_FORMAT = "spotlight-journal"
+
+def file_signature(path):
+    # (mtime, size) of a file, or None if it doesn't exist
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+class JournalStore:
+    """Pickle snapshots plus a shared append-only journal of every change,
+    compacted back into the snapshots once it grows."""
+
+    def __init__(self, collections, journal_file, schema_version=1,
+                 compact_threshold=COMPACT_THRESHOLD, file_lock=None):
+        # collections maps a name to (snapshot file, id attribute)
+        self.collections = collections
+        self.journal_file = journal_file
+        # Serializes writes from every process sharing the data directory
+        self.file_lock = file_lock or FileLock(journal_file + ".lock")
+        # Stamped into every snapshot and journal this store writes
+        self.schema_version = schema_version
+        self.compact_threshold = compact_threshold
+        self.lock = threading.RLock()
+        self.records = {name: {} for name in collections}
+        # Version of every record as last written or read from disk, for
+        # diffing saves and checking transactions
+        self.versions = {name: {} for name in collections}
+
+        # Read-only copy of every collection, republished after each change.
+        # Readers use it without taking the lock, so they never wait for a
+        # writer; published dicts are replaced, never modified.
+        self.published = {name: {} for name in collections}
+        self.dirty = set()
+        self.journal_offset = 0
+        self.frames = 0
+        self.loaded = False
+        self.snapshot_signature = None
+        self.compacting = False
+
+        # Called as listener(op, name, key, record) for every change applied
+        # in memory; op "reset" means everything was reloaded
+        self.listeners = []
+
+        # Ops applied in memory but still waiting in the write-behind queue
+        self.unflushed = []
+        self.writer = WriteBehindQueue(self.write_batches)
+
+    def key_of(self, name, record):
+        return getattr(record, self.collections[name][1])
+
+    def iter_snapshot(self, snapshot_file):
+        # Yield the records of a snapshot one frame (list) at a time. Files
+        # from before versioning are a single pickled list. A file that
+        # can't be read raises rather than looking like an empty collection.
+        if not os.path.exists(snapshot_file):
+            return
+        with open(snapshot_file, 'rb') as f:
+            first = pickle.load(f)
+            if isinstance(first, list):
+                yield first
+                return
+            while True:
+                try:
+                    frame = pickle.load(f)
+                except EOFError:
+                    break
+                yield frame
+
+    def read_snapshot(self, snapshot_file):
+        return [record for frame in self.iter_snapshot(snapshot_file) for record in frame]
+
+    def snapshot_version(self, snapshot_file):
+        # Schema version of a snapshot, 0 before versioning, None if missing
+        if not os.path.exists(snapshot_file):
+            return None
+        with open(snapshot_file, 'rb') as f:
+            try:
+                header = pickle.load(f)
+            except:
+                return None
+        return header["version"] if isinstance(header, dict) else 0
+
+    def write_snapshot(self, snapshot_file, records):
+        # Write to a temp file first so a crash never leaves half a snapshot.
+        # records can be any iterable, e.g. a generator streaming an upgrade.
+        temp_file = snapshot_file + ".tmp"
+        with open(temp_file, 'wb') as f:
+            pickle.dump({"format": SNAPSHOT_FORMAT, "version": self.schema_version}, f)
+            frame = []
+            for record in records:
+                frame.append(record)
+                if len(frame) >= SNAPSHOT_FRAME:
+                    pickle.dump(frame, f)
+                    frame = []
+            if frame:
+                pickle.dump(frame, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_file, snapshot_file)
+
+    def journal_header(self):
+        return {"format": JOURNAL_FORMAT, "version": self.schema_version}
+
+    def iter_journal(self, offset=0):
+        # Yield (ops, offset after frame) one frame at a time; the header
+        # frame comes through as an empty list of ops
+        if not os.path.exists(self.journal_file):
+            return
+
+        with open(self.journal_file, 'rb') as f:
+            f.seek(offset)
+            while True:
+                try:
+                    frame = pickle.load(f)
+                except EOFError:
+                    break
+                except Exception:
+                    # Torn frame from a crash mid-append - ignore the tail
+                    break
+                if isinstance(frame, dict):
+                    frame = []
+                yield frame, f.tell()
+
+    def journal_version(self):
+        # Schema version of the journal, 0 before versioning, None if empty
+        signature = file_signature(self.journal_file)
+        if signature is None or signature[1] == 0:
+            return None
+        with open(self.journal_file, 'rb') as f:
+            try:
+                header = pickle.load(f)
+            except:
+                return None
+        return header["version"] if isinstance(header, dict) else 0
+
+    def read_journal(self, offset=0):
+        frames = []
+        good_offset = offset if os.path.exists(self.journal_file) else 0
+        for frame, good_offset in self.iter_journal(offset):
+            frames.append(frame)
+        return frames, good_offset
+
+    def snapshot_signatures(self):
+        return tuple(file_signature(snapshot_file)
+                     for snapshot_file, _ in self.collections.values())
+
+    def replay(self):
+        # Rebuild every collection from its snapshot, then apply the journal.
+        # Everything is read before any state changes, so a file that can't
+        # be read leaves the last good version in place.
+        with self.lock:
+            signature = self.snapshot_signatures()
+            loaded = {}
+            for name, (snapshot_file, key_attr) in self.collections.items():
+                loaded[name] = {getattr(record, key_attr): record
+                                for frame in self.iter_snapshot(snapshot_file)
+                                for record in frame}
+            frames, journal_offset = self.read_journal()
+
+            # Listeners hear about the first load as a reset, and about a
+            # reload (another terminal compacted the journal, say) as the
+            # records that actually differ, so they can update in place
+            previous = self.versions if self.loaded else None
+            self.snapshot_signature = signature
+            self.records = loaded
+            self.versions = {name: {key: record_version(pickle.dumps(record))
+                                    for key, record in records.items()}
+                             for name, records in loaded.items()}
+            self.journal_offset = journal_offset
+            for ops in frames:
+                self.apply(ops, notify=False)
+            self.frames = len(frames)
+            self.loaded = True
+            self.reapply_unflushed(notify=False)
+            if previous is None:
+                self.notify("reset", None, None, None)
+            else:
+                self.notify_differences(previous)
+            self.dirty.update(self.collections)
+            self.publish()
+
+    def notify_differences(self, previous):
+        # previous is the record versions before a reload
+        if not self.listeners:
+            return
+        for name, versions in self.versions.items():
+            old = previous[name]
+            for key, version in versions.items():
+                old_version = old.get(key)
+                if old_version != version:
+                    op = "insert" if old_version is None else "update"
+                    self.notify(op, name, key, self.records[name][key])
+            for key in old.keys() - versions.keys():
+                self.notify("delete", name, key, None)
+
+    def reapply_unflushed(self, notify=True):
+        # Queued writes will land after anything read from disk, so they
+        # have to win in memory too
+        for ops in self.unflushed:
+            self.apply(ops, notify)
+
+    def notify(self, op, name, key, record):
+        for listener in self.listeners:
+            listener(op, name, key, record)
+
+    def apply(self, ops, notify=True):
+        for op, name, key, payload in ops:
+            if op == "delete":
+                self.records[name].pop(key, None)
+                self.versions[name].pop(key, None)
+                record = None
+            else:
+                record = pickle.loads(payload)
+                self.records[name][key] = record
+                self.versions[name][key] = record_version(payload)
+            self.dirty.add(name)
+            if notify and self.listeners:
+                self.notify(op, name, key, record)
+
+    def publish(self):
+        # Swap in fresh read-only copies of the collections changed since
+        # the last publish; readers holding the old ones keep them
+        if not self.dirty:
+            return
+        published = dict(self.published)
+        for name in self.dirty:
+            published[name] = dict(self.records[name])
+        self.dirty.clear()
+        self.published = published
+
+    def refresh(self):
+        # Bring the in-memory state up to date with the files on disk,
+        # reading only journal frames appended since the last refresh
+        with self.lock:
+            if not self.loaded or self.snapshot_signatures() != self.snapshot_signature:
+                self.replay()
+                return
+
+            journal_signature = file_signature(self.journal_file)
+            journal_size = journal_signature[1] if journal_signature else 0
+            if journal_size < self.journal_offset:
+                # Journal was compacted or replaced underneath us
+                self.replay()
+            elif journal_size > self.journal_offset:
+                for ops, offset in self.iter_journal(self.journal_offset):
+                    self.apply(ops)
+                    self.journal_offset = offset
+                    self.frames += 1
+                self.reapply_unflushed()
+                self.publish()
+
+    def snapshot(self):
+        """The latest published version of every collection, as
+        {name: {key: record}}. Treat it as read-only.
+
+        Never waits for a writer: while one holds the store this returns
+        the version from before its change, and if the files can't be read
+        the last good version is kept.
+        """
+        if not self.loaded:
+            with self.lock:
+                self.refresh()
+        elif self.lock.acquire(blocking=False):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Error reading data files, showing last good version: {e}")
+            finally:
+                self.lock.release()
+        return self.published
+
+    def load(self, name):
+        return list(self.snapshot()[name].values())
+
+    def get(self, name, key):
+        return self.snapshot()[name].get(key)
+
+    def exists(self, name):
+        # True once a collection has a snapshot or any journalled records
+        return os.path.exists(self.collections[name][0]) or bool(self.snapshot()[name])
+
+    def diff(self, name, records):
+        # Work out the journal ops that turn the persisted state into records
+        self.refresh()
+        versions = self.versions[name]
+        ops = []
+        seen = set()
+        for record in records:
+            key = self.key_of(name, record)
+            seen.add(key)
+            payload = pickle.dumps(record)
+            old_version = versions.get(key)
+            if old_version is None:
+                ops.append(("insert", name, key, payload))
+            elif old_version != record_version(payload):
+                ops.append(("update", name, key, payload))
+
+        for key in versions:
+            if key not in seen:
+                ops.append(("delete", name, key, None))
+        return ops
+
+    def save(self, name, records):
+        self.apply_changes([("save", name, records)])
+
+    def put(self, name, record):
+        self.apply_changes([("put", name, record)])
+
+    def delete(self, name, key):
+        self.apply_changes([("delete", name, key)])
+
+    def version(self, name, key):
+        # Version of a record for optimistic checks, None if absent
+        with self.lock:
+            self.refresh()
+            return self.versions[name].get(key)
+
+    def read(self, name, key):
+        # A private copy of a record and its version, (None, None) if absent
+        with self.lock:
+            self.refresh()
+            record = self.records[name].get(key)
+            if record is None:
+                return None, None
+            return pickle.loads(pickle.dumps(record)), self.versions[name][key]
+
+    def changes_to_ops(self, changes):
+        ops = []
+        for kind, name, value in changes:
+            if kind == "save":
+                ops.extend(self.diff(name, value))
+            elif kind == "put":
+                key = self.key_of(name, value)
+                op = "update" if key in self.versions[name] else "insert"
+                ops.append((op, name, key, pickle.dumps(value)))
+            elif value in self.versions[name]:
+                ops.append(("delete", name, value, None))
+        return ops
+
+    def check_versions(self, expected):
+        # expected maps (name, key) to the version the caller read
+        for (name, key), version in expected.items():
+            if self.versions[name].get(key) != version:
+                raise ConflictError(f"{name} {key} was changed by someone else")
+
+    def apply_changes(self, changes, expected=None):
+        """Stage a batch of ("save", name, records), ("put", name, record)
+        and ("delete", name, key) changes.
+
+        The batch is applied in memory straight away and handed to the
+        write-behind queue, which appends it to the journal inside a single
+        frame, so it is replayed all together or not at all. Call flush()
+        to wait for it to reach the disk.
+
+        With expected ({(name, key): version}) the batch is instead checked
+        and written straight away under the file lock, raising ConflictError
+        if another process changed one of those records first.
+        """
+        if expected is not None:
+            self.apply_checked(changes, expected)
+            return
+
+        with self.lock:
+            self.refresh()
+            ops = self.changes_to_ops(changes)
+            if not ops:
+                return
+
+            self.apply(ops)
+            self.publish()
+            self.unflushed.append(ops)
+            self.writer.submit(ops)
+
+    def apply_checked(self, changes, expected):
+        # Queued writes go first so this one can't overtake them
+        self.flush()
+        with self.lock, self.file_lock:
+            self.refresh()
+            self.check_versions(expected)
+            ops = self.changes_to_ops(changes)
+            if not ops:
+                return
+            # Nothing else is queued, so the journal can take it directly
+            self.append_frame(ops)
+            self.apply(ops)
+            self.publish()
+            start_compaction = self.frames >= self.compact_threshold
+
+        if start_compaction:
+            self.compact_async()
+
+    def append_frame(self, ops):
+        # Call with both locks held, after refresh()
+        with open(self.journal_file, 'ab') as f:
+            # Drop any torn tail left behind by a crash before appending
+            if f.tell() != self.journal_offset:
+                f.truncate(self.journal_offset)
+            if self.journal_offset == 0:
+                pickle.dump(self.journal_header(), f)
+            pickle.dump(ops, f)
+            f.flush()
+            os.fsync(f.fileno())
+            self.journal_offset = f.tell()
+        self.frames += 1
+
+    def write_batches(self, batches):
+        # Group commit - every queued batch goes into one fsynced frame.
+        # The file lock keeps other processes from appending in between.
+        with self.lock, self.file_lock:
+            self.refresh()
+            self.append_frame([op for batch in batches for op in batch])
+            del self.unflushed[:len(batches)]
+            start_compaction = self.frames >= self.compact_threshold
+
+        if start_compaction:
+            self.compact_async()
+
+    def flush(self, timeout=None):
+        """Durability barrier - wait until every queued write is on disk."""
+        return self.writer.barrier(timeout)
+
+    def compact(self):
+        # Fold the journal into fresh snapshots and start an empty journal
+        with self.lock, self.file_lock:
+            self.refresh()
+            for name, (snapshot_file, _) in self.collections.items():
+                self.write_snapshot(snapshot_file, list(self.records[name].values()))
+            self.snapshot_signature = self.snapshot_signatures()
+
+            # Snapshots are in place, so the journal can safely be emptied.
+            # Replaying it again after a crash here is harmless.
+            with open(self.journal_file, 'wb') as f:
+                f.flush()
+                os.fsync(f.fileno())
+            self.journal_offset = 0
+            self.frames = 0
+
+    def upgrade(self, upgrade_record):
+        """Rewrite snapshots and journal left by an older schema version.
+
+        upgrade_record(name, record, version) returns the record upgraded
+        from version to self.schema_version. Files are streamed a frame at
+        a time into a temp file and swapped in, so there is never a second
+        full copy in memory. Returns the names of the files upgraded.
+        """
+        upgraded = []
+        with self.lock, self.file_lock:
+            for name, (snapshot_file, _) in self.collections.items():
+                version = self.snapshot_version(snapshot_file)
+                if version is None or version >= self.schema_version:
+                    continue
+                self.write_snapshot(snapshot_file,
+                                    (upgrade_record(name, record, version)
+                                     for frame in self.iter_snapshot(snapshot_file)
+                                     for record in frame))
+                upgraded.append(snapshot_file)
+
+            version = self.journal_version()
+            if version is not None and version < self.schema_version:
+                temp_file = self.journal_file + ".tmp"
+                with open(temp_file, 'wb') as f:
+                    pickle.dump(self.journal_header(), f)
+                    for ops, _ in self.iter_journal():
+                        if not ops:
+                            continue
+                        pickle.dump([(op, name, key, payload if payload is None else
+                                      pickle.dumps(upgrade_record(name, pickle.loads(payload), version)))
+                                     for op, name, key, payload in ops], f)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_file, self.journal_file)
+                upgraded.append(self.journal_file)
+
+            if upgraded:
+                # Everything in memory came from the old files
+                self.loaded = False
+        return upgraded
+
+    def compact_async(self):
+        with self.lock:
+            if self.compacting:
+                return
+            self.compacting = True
+
+        def worker():
+            try:
+                self.compact()
+            except Exception as e:
+                print(f"Error compacting journal: {e}")
+            finally:
+                self.compacting = False
+
+        threading.Thread(target=worker, daemon=True).start()
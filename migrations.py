@@ -0,0 +1,34 @@
+# Schema versions of the stored records and the upgrades between them.
+#
+# Bump SCHEMA_VERSION whenever the shape of a stored record changes, and add
+# the upgrade here (pickle store) and to sqlite_backend.SQL_MIGRATIONS. Old
+# files are upgraded once at startup, so the record classes and screens only
+# ever see records in the current shape.
+
+SCHEMA_VERSION = 2
+
+# Version 2 added the stock_returns ledger. Rentals that had ended by then
+# were restocked by hand (the sample rentals never took stock at all), so
+# the upgrade marks them "legacy" rather than have return_stock add their
+# units back a second time - see database_schema.record_legacy_returns and
+# sqlite_backend.SQL_MIGRATIONS.
+LEDGER_VERSION = 2
+
+def add_creation_date(rental):
+    # Rentals saved before creation_date existed count from their start date
+    if rental.creation_date is None:
+        rental.creation_date = rental.start_date
+    return rental
+
+# version -> {collection: upgrade from the previous version}
+MIGRATIONS = {
+    1: {"rentals": add_creation_date},
+}
+
+def upgrade_record(name, record, version):
+    """Bring one record from version up to SCHEMA_VERSION."""
+    for target in range(version + 1, SCHEMA_VERSION + 1):
+        upgrade = MIGRATIONS.get(target, {}).get(name)
+        if upgrade:
+            record = upgrade(record)
+    return record
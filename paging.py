@@ -0,0 +1,83 @@
+import threading
+from bisect import bisect_left, bisect_right
+from sqlite_backend import date_to_text
+
+# Default number of rows fetched per page by the list screens
+PAGE_SIZE = 100
+
+# Sort orders available to the load_*_page functions. Each maps a record
+# to the values it is ordered by; the record ID is always the tie-breaker.
+SORT_KEYS = {
+    ("rentals", "date"): lambda r: (date_to_text(r.start_date),),
+    ("rentals", "id"): lambda r: (),
+    ("customers", "name"): lambda r: (r.surname.lower(), r.firstname.lower()),
+    ("customers", "id"): lambda r: (),
+    ("items", "name"): lambda r: (r.name.lower(),),
+    ("items", "id"): lambda r: (),
+}
+
+def page_cursor(name, order, key_attr, record):
+    """Keyset cursor for the row after record - pass it back as after."""
+    return SORT_KEYS[(name, order)](record) + (getattr(record, key_attr),)
+
+class SortedIndex:
+    """One collection kept in a SORT_KEYS order, for keyset paging on the
+    pickle backend."""
+
+    def __init__(self, name, order, key_attr):
+        self.name = name
+        self.order = order
+        self.key_attr = key_attr
+        self.lock = threading.Lock()
+        self.stale = True
+        self.entries = []
+        self.entry_of = {}
+        self.records = {}
+
+    def entry(self, record):
+        return page_cursor(self.name, self.order, self.key_attr, record)
+
+    def rebuild(self, records):
+        with self.lock:
+            self.records = {getattr(r, self.key_attr): r for r in records}
+            self.entry_of = {key: self.entry(r) for key, r in self.records.items()}
+            self.entries = sorted(self.entry_of.values())
+            self.stale = False
+
+    def remove(self, key):
+        entry = self.entry_of.pop(key, None)
+        if entry is not None:
+            del self.entries[bisect_left(self.entries, entry)]
+        self.records.pop(key, None)
+
+    def on_change(self, op, name, key, record):
+        if op == "reset":
+            if name in (None, self.name):
+                self.stale = True
+            return
+        if name != self.name or self.stale:
+            return
+        with self.lock:
+            self.remove(key)
+            if op != "delete":
+                entry = self.entry(record)
+                self.entries.insert(bisect_right(self.entries, entry), entry)
+                self.entry_of[key] = entry
+                self.records[key] = record
+
+    def page(self, offset=0, limit=PAGE_SIZE, after=None, descending=False):
+        """(records, next cursor) - the cursor is None on the last page."""
+        with self.lock:
+            entries = self.entries
+            if descending:
+                end = len(entries) if after is None else bisect_left(entries, tuple(after))
+                start = max(end - offset - limit, 0)
+                chunk = entries[start:max(end - offset, 0)][::-1]
+                more = start > 0
+            else:
+                start = 0 if after is None else bisect_right(entries, tuple(after))
+                start += offset
+                chunk = entries[start:start + limit]
+                more = start + limit < len(entries)
+            records = [self.records[entry[-1]] for entry in chunk]
+        return records, (chunk[-1] if chunk and more else None)
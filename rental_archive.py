@@ -0,0 +1,327 @@
+import heapq
+import mmap
+import os
+import struct
+import threading
+from datetime import date, datetime
+from journal_store import file_signature
+
+MAGIC = b"SPRA"
+VERSION = 1
+
+# Rentals with more items than this stay in the hot store
+MAX_ITEMS = 8
+EMPLOYEE_BYTES = 32
+
+HEADER = struct.Struct("<4sHHI4x")
+# rental_id, customer_id, start, end, created, total_price, employee,
+# date flags, item count, then MAX_ITEMS (item_id, quantity) pairs
+RECORD = struct.Struct("<qqqqqd%dsBB6x%s" % (EMPLOYEE_BYTES, "ii" * MAX_ITEMS))
+
+# Byte offsets of the fields that queries read without decoding a record
+INT_FIELD = struct.Struct("<q")
+CUSTOMER_OFFSET = 8
+START_OFFSET = 16
+END_OFFSET = 24
+CREATED_OFFSET = 32
+FLOAT_FIELD = struct.Struct("<d")
+PRICE_OFFSET = 40
+COUNT_OFFSET = 81
+ITEM_PAIRS = struct.Struct("<" + "ii" * MAX_ITEMS)
+ITEMS_OFFSET = 88
+
+START_IS_DATETIME = 1
+END_IS_DATETIME = 2
+CREATED_IS_DATETIME = 4
+
+MICROS_PER_DAY = 86400 * 1000000
+
+def encode_time(value):
+    # Microseconds since day 1 of the proleptic calendar, exact for both
+    # dates and naive datetimes
+    if isinstance(value, datetime):
+        seconds = value.hour * 3600 + value.minute * 60 + value.second
+        return value.toordinal() * MICROS_PER_DAY + seconds * 1000000 + value.microsecond
+    return value.toordinal() * MICROS_PER_DAY
+
+def decode_time(micros, is_datetime):
+    day, rest = divmod(micros, MICROS_PER_DAY)
+    value = date.fromordinal(day)
+    if not is_datetime:
+        return value
+    seconds, microsecond = divmod(rest, 1000000)
+    return datetime(value.year, value.month, value.day,
+                    seconds // 3600, seconds // 60 % 60, seconds % 60, microsecond)
+
+def creation_key(rental):
+    # The order records are kept in
+    return (encode_time(rental.creation_date), rental.rental_id)
+
+def archivable(rental):
+    # Only rentals that fit the fixed-width record can be archived
+    return (len(rental.items) <= MAX_ITEMS and
+            len(str(rental.employee or "").encode("utf-8")) <= EMPLOYEE_BYTES)
+
+class RentalArchive:
+    """Closed rentals in a fixed-width binary file, sorted by creation time
+    and read through mmap."""
+
+    def __init__(self, archive_file, rental_class):
+        self.archive_file = archive_file
+        self.rental_class = rental_class
+        self.lock = threading.RLock()
+        self.map = None
+        self.signature = None
+        self.id_index = None
+        self.customer_index = None
+
+    # Reading
+
+    def open(self):
+        # (Re)map the file if it was replaced since it was last opened
+        signature = file_signature(self.archive_file)
+        if signature == self.signature:
+            return self.map
+        self.close()
+        self.signature = signature
+        if signature is None:
+            return None
+
+        with open(self.archive_file, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, max_items, record_size = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+            self.close()
+            raise ValueError(f"{self.archive_file} is not a version {VERSION} rental archive")
+        return self.map
+
+    def close(self):
+        with self.lock:
+            if self.map is not None:
+                self.map.close()
+            self.map = None
+            self.signature = None
+            self.id_index = None
+            self.customer_index = None
+
+    def __len__(self):
+        with self.lock:
+            archive = self.open()
+            if archive is None:
+                return 0
+            return (len(archive) - HEADER.size) // RECORD.size
+
+    def offset(self, slot):
+        return HEADER.size + slot * RECORD.size
+
+    def rental_at(self, slot):
+        fields = RECORD.unpack_from(self.map, self.offset(slot))
+        (rental_id, customer_id, start, end, created, total_price,
+         employee, flags, item_count) = fields[:9]
+        pairs = fields[9:9 + item_count * 2]
+        items = dict(zip(pairs[0::2], pairs[1::2]))
+        return self.rental_class(
+            rental_id, customer_id, employee.rstrip(b"\0").decode("utf-8"),
+            decode_time(start, flags & START_IS_DATETIME),
+            decode_time(end, flags & END_IS_DATETIME),
+            items, total_price,
+            decode_time(created, flags & CREATED_IS_DATETIME))
+
+    def field_at(self, field, slot, field_offset):
+        return field.unpack_from(self.map, self.offset(slot) + field_offset)[0]
+
+    def __iter__(self):
+        with self.lock:
+            return iter([self.rental_at(slot) for slot in range(len(self))])
+
+    def key_at(self, slot):
+        return (self.field_at(INT_FIELD, slot, CREATED_OFFSET), self.field_at(INT_FIELD, slot, 0))
+
+    def ids(self):
+        # rental_id -> slot, built once per file from the id column alone
+        count = len(self)
+        if self.id_index is None:
+            self.id_index = {self.field_at(INT_FIELD, slot, 0): slot for slot in range(count)}
+        return self.id_index
+
+    def customers(self):
+        # customer_id -> slots in creation order, from the customer column
+        count = len(self)
+        if self.customer_index is None:
+            self.customer_index = {}
+            for slot in range(count):
+                customer_id = self.field_at(INT_FIELD, slot, CUSTOMER_OFFSET)
+                self.customer_index.setdefault(customer_id, []).append(slot)
+        return self.customer_index
+
+    def get(self, rental_id):
+        with self.lock:
+            slot = self.ids().get(rental_id)
+            return None if slot is None else self.rental_at(slot)
+
+    def max_id(self):
+        with self.lock:
+            return max((self.field_at(INT_FIELD, slot, 0) for slot in range(len(self))),
+                       default=0)
+
+    def first_slot_created(self, micros):
+        # First record created at or after micros
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if self.field_at(INT_FIELD, middle, CREATED_OFFSET) < micros:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def created_slots(self, start, end):
+        # Slots of rentals created on days start..end inclusive
+        first = self.first_slot_created(encode_time(start))
+        last = self.first_slot_created(encode_time(date.fromordinal(end.toordinal() + 1)))
+        return range(first, last)
+
+    def rentals_created_between(self, start, end):
+        with self.lock:
+            return [self.rental_at(slot) for slot in self.created_slots(start, end)]
+
+    def revenue_between(self, start, end):
+        """(revenue, rental count) for archived rentals created start..end."""
+        with self.lock:
+            slots = self.created_slots(start, end)
+            revenue = sum(self.field_at(FLOAT_FIELD, slot, PRICE_OFFSET) for slot in slots)
+            return revenue, len(slots)
+
+    def iter_overlapping(self, first=None, last=None):
+        """Yield the archived rentals running on any day from first to last
+        (dates, None for no limit) one at a time, for exports. Records that
+        don't match only have their start and end read."""
+        low = None if first is None else encode_time(first)
+        high = None if last is None else encode_time(date.fromordinal(last.toordinal() + 1))
+        slot = 0
+        while True:
+            with self.lock:
+                if slot >= len(self):
+                    return
+                rental = None
+                if ((low is None or self.field_at(INT_FIELD, slot, END_OFFSET) >= low) and
+                        (high is None or self.field_at(INT_FIELD, slot, START_OFFSET) < high)):
+                    rental = self.rental_at(slot)
+            slot += 1
+            if rental is not None:
+                yield rental
+
+    def revenue_by_year(self, year):
+        return self.revenue_between(date(year, 1, 1), date(year, 12, 31))
+
+    def customer_history(self, customer_id):
+        with self.lock:
+            return [self.rental_at(slot) for slot in self.customers().get(customer_id, [])]
+
+    def has_item(self, item_id):
+        # Reads only the item pairs of each record
+        with self.lock:
+            for slot in range(len(self)):
+                base = self.offset(slot)
+                count = self.map[base + COUNT_OFFSET]
+                pairs = ITEM_PAIRS.unpack_from(self.map, base + ITEMS_OFFSET)
+                if item_id in pairs[0:count * 2:2]:
+                    return True
+        return False
+
+    # Writing
+
+    def pack(self, rental):
+        flags = 0
+        if isinstance(rental.start_date, datetime):
+            flags |= START_IS_DATETIME
+        if isinstance(rental.end_date, datetime):
+            flags |= END_IS_DATETIME
+        if isinstance(rental.creation_date, datetime):
+            flags |= CREATED_IS_DATETIME
+
+        pairs = []
+        for item_id, quantity in rental.items.items():
+            pairs.extend((item_id, quantity))
+        pairs.extend([0] * (MAX_ITEMS * 2 - len(pairs)))
+
+        return RECORD.pack(rental.rental_id, rental.customer_id,
+                           encode_time(rental.start_date), encode_time(rental.end_date),
+                           encode_time(rental.creation_date), rental.total_price,
+                           str(rental.employee or "").encode("utf-8"), flags,
+                           len(rental.items), *pairs)
+
+    def add(self, rentals):
+        """Add rentals to the archive; returns how many it then holds.
+
+        Rentals created after everything already archived (each year's
+        closed rentals, usually) are appended as they are. Otherwise, or
+        when a rental is archived again, the existing records are merged
+        with the new ones into a replacement file, copied as raw bytes
+        rather than decoded.
+        """
+        rentals = sorted(rentals, key=creation_key)
+        for rental in rentals:
+            if not archivable(rental):
+                raise ValueError(f"Rental {rental.rental_id} doesn't fit an archive record")
+        with self.lock:
+            count = len(self)
+            if not rentals:
+                return count
+            if count == 0:
+                self.write_file([self.pack(rental) for rental in rentals])
+            elif (creation_key(rentals[0]) > self.key_at(count - 1) and
+                    not any(rental.rental_id in self.ids() for rental in rentals)):
+                self.append(count, rentals)
+            else:
+                self.merge(count, rentals)
+            return len(self)
+
+    def append(self, count, rentals):
+        # Keep the indexes, extended with the new slots, across the remap
+        id_index = self.ids()
+        customer_index = self.customer_index
+        self.close()
+        with open(self.archive_file, 'r+b') as f:
+            # Drop a torn record left by a crash mid-append
+            f.truncate(self.offset(count))
+            f.seek(self.offset(count))
+            for rental in rentals:
+                f.write(self.pack(rental))
+            f.flush()
+            os.fsync(f.fileno())
+        self.open()
+        for slot, rental in enumerate(rentals, count):
+            id_index[rental.rental_id] = slot
+            if customer_index is not None:
+                customer_index.setdefault(rental.customer_id, []).append(slot)
+        self.id_index = id_index
+        self.customer_index = customer_index
+
+    def merge(self, count, rentals):
+        replaced = {rental.rental_id for rental in rentals}
+        existing = ((self.key_at(slot), self.map[self.offset(slot):self.offset(slot + 1)])
+                    for slot in range(count)
+                    if self.field_at(INT_FIELD, slot, 0) not in replaced)
+        added = ((creation_key(rental), self.pack(rental)) for rental in rentals)
+        self.write_file(record for _, record in
+                        heapq.merge(existing, added, key=lambda entry: entry[0]))
+
+    def write_file(self, records):
+        # Replace the file atomically with a header and the packed records
+        temp_file = self.archive_file + ".tmp"
+        with open(temp_file, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, MAX_ITEMS, RECORD.size))
+            for record in records:
+                f.write(record)
+            f.flush()
+            os.fsync(f.fileno())
+        self.close()
+        os.replace(temp_file, self.archive_file)
+
+# Run this file directly to move rentals that ended before this year
+# out of the hot store
+if __name__ == "__main__":
+    import database_schema as db
+    moved = db.archive_rentals()
+    print(f"Archived {moved} rentals into {db.ARCHIVE_FILE}")
@@ -0,0 +1,127 @@
+import threading
+from array import array
+from datetime import datetime
+from itertools import compress
+from interval_index import day_number
+
+# NumPy is optional - without it aggregations fall back to itertools
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+def timestamp(value):
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return datetime(value.year, value.month, value.day).timestamp()
+
+class RentalColumns:
+    """Rentals stored column by column in typed arrays, for revenue sums."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stale = True
+        self.clear()
+
+    def clear(self):
+        self.rental_id = array('q')
+        self.customer_id = array('q')
+        self.start_day = array('q')
+        self.end_day = array('q')
+        self.created_day = array('q')
+        self.created_at = array('d')
+        self.total_price = array('d')
+        self.employee = array('q')
+        self.row_of = {}
+        # Employee usernames are stored as small integer codes
+        self.employee_codes = {}
+        self.employee_names = []
+
+    def columns(self):
+        return (self.rental_id, self.customer_id, self.start_day, self.end_day,
+                self.created_day, self.created_at, self.total_price, self.employee)
+
+    def __len__(self):
+        return len(self.rental_id)
+
+    def employee_code(self, employee):
+        code = self.employee_codes.get(employee)
+        if code is None:
+            code = len(self.employee_names)
+            self.employee_codes[employee] = code
+            self.employee_names.append(employee)
+        return code
+
+    def row_values(self, rental):
+        return (rental.rental_id, rental.customer_id,
+                day_number(rental.start_date), day_number(rental.end_date),
+                day_number(rental.creation_date), timestamp(rental.creation_date),
+                rental.total_price, self.employee_code(rental.employee))
+
+    def rebuild(self, rentals):
+        with self.lock:
+            self.clear()
+            for rental in rentals:
+                self.upsert(rental)
+            self.stale = False
+
+    def upsert(self, rental):
+        values = self.row_values(rental)
+        row = self.row_of.get(rental.rental_id)
+        if row is None:
+            self.row_of[rental.rental_id] = len(self.rental_id)
+            for column, value in zip(self.columns(), values):
+                column.append(value)
+        else:
+            for column, value in zip(self.columns(), values):
+                column[row] = value
+
+    def remove(self, rental_id):
+        row = self.row_of.pop(rental_id, None)
+        if row is None:
+            return
+        last = len(self.rental_id) - 1
+        if row != last:
+            for column in self.columns():
+                column[row] = column[last]
+            self.row_of[self.rental_id[row]] = row
+        for column in self.columns():
+            column.pop()
+
+    def on_change(self, op, name, key, record):
+        # Change listener - keeps the columns in step with every write
+        if op == "reset":
+            if name in (None, "rentals"):
+                self.stale = True
+            return
+        if name != "rentals":
+            return
+        with self.lock:
+            if op == "delete":
+                self.remove(key)
+            else:
+                self.upsert(record)
+
+    def day_totals(self, start_day, end_day):
+        # Revenue and rental count for rentals created in [start_day, end_day]
+        with self.lock:
+            if numpy is not None and len(self.rental_id):
+                created = numpy.frombuffer(self.created_day, dtype=numpy.int64)
+                prices = numpy.frombuffer(self.total_price, dtype=numpy.float64)
+                mask = (created >= start_day) & (created <= end_day)
+                result = float(prices[mask].sum()), int(mask.sum())
+                # Release the buffer views so the arrays can grow again
+                del created, prices, mask
+                return result
+
+            mask = [start_day <= day <= end_day for day in self.created_day]
+            return float(sum(compress(self.total_price, mask))), sum(mask)
+
+    def daily_revenue(self, day):
+        """(revenue, rental count) for rentals created on day."""
+        number = day_number(day)
+        return self.day_totals(number, number)
+
+    def revenue_between(self, start, end):
+        """(revenue, rental count) for rentals created between start and end."""
+        return self.day_totals(day_number(start), day_number(end))
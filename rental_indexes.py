@@ -0,0 +1,144 @@
+import os
+import pickle
+import threading
+
+def add_to(index, key, rental_id):
+    index.setdefault(key, set()).add(rental_id)
+
+def discard_from(index, key, rental_id):
+    rental_ids = index.get(key)
+    if rental_ids is not None:
+        rental_ids.discard(rental_id)
+        if not rental_ids:
+            del index[key]
+
+class RentalIndexes:
+    """Secondary indexes from customer, item and employee to rental IDs,
+    saved to index_file between runs."""
+
+    def __init__(self, index_file):
+        self.index_file = index_file
+        self.lock = threading.Lock()
+        self.stale = True
+        self.clear()
+
+    def clear(self):
+        self.by_customer = {}
+        self.by_item = {}
+        self.by_employee = {}
+        # rental_id -> the keys it is filed under, to unfile it on update
+        self.keys_of = {}
+
+    def add(self, rental):
+        keys = (rental.customer_id, tuple(rental.items), rental.employee)
+        self.keys_of[rental.rental_id] = keys
+        add_to(self.by_customer, keys[0], rental.rental_id)
+        for item_id in keys[1]:
+            add_to(self.by_item, item_id, rental.rental_id)
+        add_to(self.by_employee, keys[2], rental.rental_id)
+
+    def remove(self, rental_id):
+        keys = self.keys_of.pop(rental_id, None)
+        if keys is None:
+            return
+        discard_from(self.by_customer, keys[0], rental_id)
+        for item_id in keys[1]:
+            discard_from(self.by_item, item_id, rental_id)
+        discard_from(self.by_employee, keys[2], rental_id)
+
+    def rebuild(self, rentals):
+        with self.lock:
+            self.clear()
+            for rental in rentals:
+                self.add(rental)
+            self.stale = False
+
+    def on_change(self, op, name, key, record):
+        if op == "reset":
+            if name in (None, "rentals"):
+                self.stale = True
+            return
+        if name != "rentals" or self.stale:
+            return
+        with self.lock:
+            self.remove(key)
+            if op != "delete":
+                self.add(record)
+
+    # Lookups - each returns a new set of rental IDs
+
+    def customer_rentals(self, customer_id):
+        with self.lock:
+            return set(self.by_customer.get(customer_id, ()))
+
+    def item_rentals(self, item_id):
+        with self.lock:
+            return set(self.by_item.get(item_id, ()))
+
+    def employee_rentals(self, employee):
+        with self.lock:
+            return set(self.by_employee.get(employee, ()))
+
+    def employees(self):
+        with self.lock:
+            return list(self.by_employee)
+
+    # Persistence
+
+    def save(self, position):
+        # position identifies the data files the indexes were built from
+        with self.lock:
+            if self.stale:
+                return
+            state = (position, self.by_customer, self.by_item, self.by_employee, self.keys_of)
+            temp_file = self.index_file + ".tmp"
+            with open(temp_file, 'wb') as f:
+                pickle.dump(state, f)
+            os.replace(temp_file, self.index_file)
+
+    def load(self, position):
+        # Use the saved indexes only if they were built from these files
+        if not os.path.exists(self.index_file):
+            return False
+        try:
+            with open(self.index_file, 'rb') as f:
+                state = pickle.load(f)
+        except:
+            return False
+        if state[0] != position:
+            return False
+        with self.lock:
+            _, self.by_customer, self.by_item, self.by_employee, self.keys_of = state
+            self.stale = False
+        return True
+
+    def check(self, rentals):
+        """Compare the indexes with a fresh build from rentals and return a
+        list of problems (empty when they agree)."""
+        expected = RentalIndexes(self.index_file)
+        expected.rebuild(rentals)
+        problems = []
+        with self.lock:
+            for label, actual, wanted in (("customer", self.by_customer, expected.by_customer),
+                                          ("item", self.by_item, expected.by_item),
+                                          ("employee", self.by_employee, expected.by_employee)):
+                for key in set(actual) | set(wanted):
+                    missing = wanted.get(key, set()) - actual.get(key, set())
+                    extra = actual.get(key, set()) - wanted.get(key, set())
+                    if missing:
+                        problems.append(f"{label} {key!r}: missing rentals {sorted(missing)}")
+                    if extra:
+                        problems.append(f"{label} {key!r}: extra rentals {sorted(extra)}")
+        return problems
+
+# Run this file directly to check the indexes, or with --rebuild to rebuild them
+if __name__ == "__main__":
+    import sys
+    import database_schema as db
+    if "--rebuild" in sys.argv:
+        db.rebuild_indexes()
+        print("Indexes rebuilt")
+    problems = db.check_indexes()
+    for problem in problems:
+        print(problem)
+    print("Indexes OK" if not problems else f"{len(problems)} problems found")
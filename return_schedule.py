@@ -0,0 +1,93 @@
+import heapq
+import threading
+from interval_index import day_number
+
+class ReturnSchedule:
+    """Rentals whose stock hasn't gone back on the shelf yet, as a min-heap of
+    (end day, rental_id) with out-of-date entries dropped as they surface."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stale = True
+        self.clear()
+
+    def clear(self):
+        self.heap = []
+        # rental_id -> end day of every rental on file
+        self.end_of = {}
+        # rental_ids with a stock_returns entry
+        self.returned = set()
+
+    def add(self, rental):
+        end = day_number(rental.end_date)
+        if self.end_of.get(rental.rental_id) == end:
+            return
+        self.end_of[rental.rental_id] = end
+        if rental.rental_id not in self.returned:
+            heapq.heappush(self.heap, (end, rental.rental_id))
+
+    def rebuild(self, rentals, returns):
+        """Build the schedule from scratch."""
+        with self.lock:
+            self.clear()
+            self.returned = {entry.rental_id for entry in returns}
+            self.end_of = {rental.rental_id: day_number(rental.end_date) for rental in rentals}
+            self.heap = [(end, rental_id) for rental_id, end in self.end_of.items()
+                         if rental_id not in self.returned]
+            heapq.heapify(self.heap)
+            self.stale = False
+
+    def on_change(self, op, name, key, record):
+        if op == "reset":
+            if name in (None, "rentals", "stock_returns"):
+                self.stale = True
+            return
+        if name not in ("rentals", "stock_returns") or self.stale:
+            return
+        with self.lock:
+            if name == "rentals":
+                if op == "delete":
+                    self.end_of.pop(key, None)
+                else:
+                    self.add(record)
+            elif op == "delete":
+                # The rental has stock out again (see update_rental_record)
+                self.returned.discard(key)
+                if key in self.end_of:
+                    heapq.heappush(self.heap, (self.end_of[key], key))
+            else:
+                self.returned.add(key)
+
+    def current(self, entry):
+        end, rental_id = entry
+        return self.end_of.get(rental_id) == end and rental_id not in self.returned
+
+    def next_due(self):
+        """End day of the next rental to come back, or None."""
+        with self.lock:
+            heap = self.heap
+            while heap and not self.current(heap[0]):
+                heapq.heappop(heap)
+            return heap[0][0] if heap else None
+
+    def due(self, today):
+        """IDs of the rentals that ended before day number today and
+        haven't been returned, earliest first. They stay scheduled until
+        their stock_returns entry arrives."""
+        with self.lock:
+            heap = self.heap
+            due = []
+            while heap and heap[0][0] < today:
+                entry = heapq.heappop(heap)
+                if self.current(entry):
+                    due.append(entry)
+            for entry in due:
+                heapq.heappush(heap, entry)
+            # A rental taken out again after its return can have its old
+            # entry still in the heap next to the new one
+            return list(dict.fromkeys(rental_id for _, rental_id in due))
+
+    def outstanding(self):
+        # Number of rentals still to come back
+        with self.lock:
+            return len(self.end_of.keys() - self.returned)
@@ -0,0 +1,46 @@
+import threading
+from datetime import date
+import database_schema as db
+from interval_index import day_number
+
+# Milliseconds between checks for rentals that have ended
+CHECK_INTERVAL = 60000
+
+class ReturnScheduler:
+    """Puts stock back on the shelf as rentals end, checking on a worker
+    thread every CHECK_INTERVAL."""
+
+    def __init__(self):
+        self.widget = None
+        self.worker = None
+
+    def start(self, widget):
+        """Check for as long as widget exists. Starting again from another
+        window (the menus are recreated after each login) moves the checks
+        there."""
+        self.widget = widget
+        # Catch up on anything that ended while the program was closed
+        widget.after_idle(lambda: self.tick(widget))
+
+    def tick(self, widget):
+        if widget is not self.widget or not widget.winfo_exists():
+            return
+        if self.worker is None or not self.worker.is_alive():
+            self.worker = threading.Thread(target=self.run, name="stock-returns", daemon=True)
+            self.worker.start()
+        widget.after(CHECK_INTERVAL, lambda: self.tick(widget))
+
+    def run(self):
+        try:
+            next_due = db.stock_return_schedule().next_due()
+            if next_due is not None and next_due < day_number(date.today()):
+                db.return_stock()
+        except Exception as e:
+            # Tried again on the next check
+            print(f"Error returning stock: {e}")
+
+# Driven by whichever menu window started it last
+scheduler = ReturnScheduler()
+
+def start(widget):
+    scheduler.start(widget)
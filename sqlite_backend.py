@@ -0,0 +1,568 @@
+import json
+import pickle
+import sqlite3
+import threading
+from datetime import date, datetime
+from concurrency import ConflictError, record_version
+
+# Number of rows sent to SQLite per executemany call when migrating
+BATCH_SIZE = 1000
+
+# Seconds to wait for another process's write transaction to finish
+BUSY_TIMEOUT = 30
+
+# Entries kept in change_log, the record of writes other processes read to
+# update their screens. A process that falls further behind reloads instead.
+CHANGE_LOG_SIZE = 10000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS customers (
+    customer_id INTEGER PRIMARY KEY,
+    firstname TEXT NOT NULL,
+    surname TEXT NOT NULL,
+    phone TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS items (
+    item_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    type TEXT,
+    quantity INTEGER NOT NULL,
+    price REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rentals (
+    rental_id INTEGER PRIMARY KEY,
+    customer_id INTEGER NOT NULL,
+    employee TEXT,
+    start_date TEXT NOT NULL,
+    end_date TEXT NOT NULL,
+    total_price REAL NOT NULL,
+    creation_date TEXT
+);
+CREATE TABLE IF NOT EXISTS rental_items (
+    rental_id INTEGER NOT NULL,
+    item_id INTEGER NOT NULL,
+    quantity INTEGER NOT NULL,
+    PRIMARY KEY (rental_id, item_id)
+);
+CREATE TABLE IF NOT EXISTS stock_returns (
+    rental_id INTEGER PRIMARY KEY,
+    items TEXT NOT NULL,
+    returned_at TEXT NOT NULL,
+    reason TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sequences (
+    name TEXT PRIMARY KEY,
+    next_id INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS change_log (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    op TEXT NOT NULL,
+    name TEXT NOT NULL,
+    key INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_rentals_customer ON rentals (customer_id);
+CREATE INDEX IF NOT EXISTS idx_rentals_start ON rentals (start_date);
+CREATE INDEX IF NOT EXISTS idx_rentals_end ON rentals (end_date);
+CREATE INDEX IF NOT EXISTS idx_rentals_employee ON rentals (employee);
+CREATE INDEX IF NOT EXISTS idx_rental_items_item ON rental_items (item_id);
+CREATE INDEX IF NOT EXISTS idx_customers_name
+    ON customers (surname COLLATE NOCASE, firstname COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_items_name ON items (name COLLATE NOCASE);
+"""
+
+KEY_COLUMNS = {
+    "customers": "customer_id",
+    "items": "item_id",
+    "rentals": "rental_id",
+    "stock_returns": "rental_id",
+}
+
+# version -> statements upgrading the database from the previous version
+# (see migrations.py); the current version is kept in PRAGMA user_version
+SQL_MIGRATIONS = {
+    1: ["UPDATE rentals SET creation_date = start_date WHERE creation_date IS NULL"],
+    2: ["INSERT OR IGNORE INTO stock_returns (rental_id, items, returned_at, reason) "
+        "SELECT rental_id, '{}', strftime('%Y-%m-%dT%H:%M:%S', 'now', 'localtime'), 'legacy' "
+        "FROM rentals WHERE substr(end_date, 1, 10) < date('now', 'localtime')"],
+}
+
+# Columns behind each paging.SORT_KEYS order
+PAGE_ORDERS = {
+    ("rentals", "date"): ["start_date"],
+    ("rentals", "id"): [],
+    ("customers", "name"): ["surname COLLATE NOCASE", "firstname COLLATE NOCASE"],
+    ("customers", "id"): [],
+    ("items", "name"): ["name COLLATE NOCASE"],
+    ("items", "id"): [],
+}
+
+def date_to_text(value):
+    if value is None:
+        return None
+    return value.isoformat()
+
+def text_to_date(text):
+    # Plain dates are stored as YYYY-MM-DD, datetimes keep their time part
+    if text is None:
+        return None
+    if len(text) > 10:
+        return datetime.fromisoformat(text)
+    return date.fromisoformat(text)
+
+def day_after(value):
+    # Upper bound for "starts on or before value" that works for both
+    # stored dates and stored datetimes
+    if isinstance(value, datetime):
+        value = value.date()
+    return date.fromordinal(value.toordinal() + 1).isoformat()
+
+class SQLiteBackend:
+    """Customers, items, rentals and the stock return ledger stored in a
+    single SQLite database."""
+
+    def __init__(self, database_file, record_classes, schema_version=1):
+        # record_classes maps a collection name to its record class
+        self.database_file = database_file
+        self.record_classes = record_classes
+        self.schema_version = schema_version
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(database_file, timeout=BUSY_TIMEOUT,
+                                          check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+        self.connection.commit()
+
+        # Same change notifications as JournalStore.listeners. Every write
+        # is also logged in change_log, so refresh() can pass on exactly
+        # what other processes changed.
+        self.listeners = []
+        self.data_version = self.read_data_version()
+        self.change_seq = self.last_change()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    # Row conversion
+
+    def customer_row(self, customer):
+        return (customer.customer_id, customer.firstname, customer.surname, customer.phone)
+
+    def item_row(self, item):
+        return (item.item_id, item.name, item.type, item.quantity, item.price)
+
+    def rental_row(self, rental):
+        return (rental.rental_id, rental.customer_id, rental.employee,
+                date_to_text(rental.start_date), date_to_text(rental.end_date),
+                rental.total_price, date_to_text(rental.creation_date))
+
+    def stock_return_row(self, entry):
+        # items as a JSON object; its keys come back as strings
+        return (entry.rental_id, json.dumps(entry.items), date_to_text(entry.returned_at),
+                entry.reason)
+
+    def make_customer(self, row):
+        return self.record_classes["customers"](*row)
+
+    def make_item(self, row):
+        return self.record_classes["items"](*row)
+
+    def make_stock_return(self, row):
+        rental_id, items, returned_at, reason = row
+        items = {int(item_id): quantity for item_id, quantity in json.loads(items).items()}
+        return self.record_classes["stock_returns"](rental_id, items, text_to_date(returned_at),
+                                                    reason)
+
+    def make_rentals(self, rows, item_rows):
+        items_by_rental = {}
+        for rental_id, item_id, quantity in item_rows:
+            items_by_rental.setdefault(rental_id, {})[item_id] = quantity
+
+        rental_class = self.record_classes["rentals"]
+        rentals = []
+        for rental_id, customer_id, employee, start, end, total, created in rows:
+            rentals.append(rental_class(rental_id, customer_id, employee,
+                                        text_to_date(start), text_to_date(end),
+                                        items_by_rental.get(rental_id, {}), total,
+                                        text_to_date(created)))
+        return rentals
+
+    # Writes
+
+    def insert_rows(self, name, records):
+        cursor = self.connection.cursor()
+        if name == "customers":
+            cursor.executemany("INSERT OR REPLACE INTO customers VALUES (?, ?, ?, ?)",
+                               (self.customer_row(c) for c in records))
+        elif name == "items":
+            cursor.executemany("INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?, ?)",
+                               (self.item_row(i) for i in records))
+        elif name == "stock_returns":
+            cursor.executemany("INSERT OR REPLACE INTO stock_returns VALUES (?, ?, ?, ?)",
+                               (self.stock_return_row(r) for r in records))
+        else:
+            records = list(records)
+            cursor.executemany("INSERT OR REPLACE INTO rentals VALUES (?, ?, ?, ?, ?, ?, ?)",
+                               (self.rental_row(r) for r in records))
+            cursor.executemany("DELETE FROM rental_items WHERE rental_id = ?",
+                               ((r.rental_id,) for r in records))
+            cursor.executemany("INSERT INTO rental_items VALUES (?, ?, ?)",
+                               ((r.rental_id, item_id, quantity)
+                                for r in records for item_id, quantity in r.items.items()))
+
+    def delete_rows(self, name, keys):
+        cursor = self.connection.cursor()
+        keys = [(key,) for key in keys]
+        cursor.executemany(f"DELETE FROM {name} WHERE {KEY_COLUMNS[name]} = ?", keys)
+        if name == "rentals":
+            cursor.executemany("DELETE FROM rental_items WHERE rental_id = ?", keys)
+
+    def clear(self, name):
+        self.connection.execute(f"DELETE FROM {name}")
+        if name == "rentals":
+            self.connection.execute("DELETE FROM rental_items")
+
+    def sync_rows(self, name, records):
+        # Make the table match records exactly
+        key_column = KEY_COLUMNS[name]
+        existing = {row[0] for row in
+                    self.connection.execute(f"SELECT {key_column} FROM {name}")}
+        keep = {getattr(record, key_column) for record in records}
+        self.delete_rows(name, existing - keep)
+        self.insert_rows(name, records)
+
+    def save(self, name, records):
+        self.apply_changes([("save", name, records)])
+
+    def put(self, name, record):
+        self.apply_changes([("put", name, record)])
+
+    def delete(self, name, key):
+        self.apply_changes([("delete", name, key)])
+
+    def version(self, name, key):
+        # Same contract as JournalStore.version
+        return self.read(name, key)[1]
+
+    def read(self, name, key):
+        # Same contract as JournalStore.read - get() builds a fresh record
+        with self.lock:
+            record = self.get(name, key)
+        if record is None:
+            return None, None
+        return record, record_version(pickle.dumps(record))
+
+    def apply_changes(self, changes, expected=None):
+        # Same contract as JournalStore.apply_changes - one SQLite transaction
+        with self.lock:
+            with self.connection:
+                if expected is not None:
+                    # Take the write lock before reading the versions, so
+                    # nobody can change them between the check and the write
+                    self.connection.execute("BEGIN IMMEDIATE")
+                    for (name, key), version in expected.items():
+                        if self.version(name, key) != version:
+                            raise ConflictError(f"{name} {key} was changed by someone else")
+                log = []
+                for kind, name, value in changes:
+                    if kind == "save":
+                        self.sync_rows(name, value)
+                        log.append(("reset", name, None))
+                    elif kind == "put":
+                        key = getattr(value, KEY_COLUMNS[name])
+                        log.append(("update" if self.exists_row(name, key) else "insert", name, key))
+                        self.insert_rows(name, [value])
+                    else:
+                        self.delete_rows(name, [value])
+                        log.append(("delete", name, value))
+                self.connection.executemany(
+                    "INSERT INTO change_log (op, name, key) VALUES (?, ?, ?)", log)
+                self.connection.execute("DELETE FROM change_log WHERE seq <= "
+                                        "(SELECT MAX(seq) FROM change_log) - ?", (CHANGE_LOG_SIZE,))
+            # Passes on this batch, and anything other processes committed
+            # just before it
+            self.read_changes()
+
+    def exists_row(self, name, key):
+        return self.connection.execute(
+            f"SELECT 1 FROM {name} WHERE {KEY_COLUMNS[name]} = ?", (key,)).fetchone() is not None
+
+    def last_change(self):
+        return self.connection.execute("SELECT MAX(seq) FROM change_log").fetchone()[0] or 0
+
+    def read_changes(self):
+        # Notify listeners of the change_log entries since the last call
+        first = self.connection.execute("SELECT MIN(seq) FROM change_log").fetchone()[0]
+        if first is not None and first > self.change_seq + 1:
+            # Entries we haven't seen were already trimmed
+            self.change_seq = self.last_change()
+            self.notify("reset", None, None, None)
+            return
+        entries = self.connection.execute(
+            "SELECT seq, op, name, key FROM change_log WHERE seq > ? ORDER BY seq",
+            (self.change_seq,)).fetchall()
+        for seq, op, name, key in entries:
+            self.change_seq = seq
+            if op == "reset" or op == "delete":
+                self.notify(op, name, key, None)
+                continue
+            record = self.get(name, key)
+            if record is None:
+                # Deleted again by a later entry
+                continue
+            self.notify(op, name, key, record)
+
+    def notify(self, op, name, key, record):
+        for listener in self.listeners:
+            listener(op, name, key, record)
+
+    def read_data_version(self):
+        # Changes whenever another connection commits to the database
+        return self.connection.execute("PRAGMA data_version").fetchone()[0]
+
+    def refresh(self):
+        with self.lock:
+            data_version = self.read_data_version()
+            if data_version != self.data_version:
+                self.data_version = data_version
+                self.read_changes()
+
+    def upgrade(self):
+        """Run the SQL_MIGRATIONS newer than the database's user_version.
+        Returns the versions applied."""
+        with self.lock:
+            version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+            applied = list(range(version + 1, self.schema_version + 1))
+            if not applied:
+                return []
+            with self.connection:
+                for target in applied:
+                    for statement in SQL_MIGRATIONS.get(target, []):
+                        self.connection.execute(statement)
+                self.connection.execute(f"PRAGMA user_version = {self.schema_version}")
+            self.notify("reset", None, None, None)
+            return applied
+
+    def mark_current(self):
+        # For data copied from pickle files that were upgraded first
+        with self.lock, self.connection:
+            self.connection.execute(f"PRAGMA user_version = {self.schema_version}")
+
+    def reindex(self):
+        with self.lock, self.connection:
+            self.connection.execute("REINDEX")
+
+    def check_indexes(self):
+        # integrity_check verifies every index against its table
+        with self.lock:
+            rows = self.connection.execute("PRAGMA integrity_check").fetchall()
+        return [row[0] for row in rows if row[0] != "ok"]
+
+    def allocate(self, name, count=1, seed=None):
+        # Same contract as id_sequences.SequenceFile.allocate
+        if count < 1:
+            raise ValueError("count must be at least 1")
+
+        with self.lock, self.connection:
+            # Write lock first, so two processes can't read the same next_id
+            self.connection.execute("BEGIN IMMEDIATE")
+            row = self.connection.execute(
+                "SELECT next_id FROM sequences WHERE name = ?", (name,)).fetchone()
+            first_id = row[0] if row else (seed() if seed else 1)
+            self.connection.execute("INSERT OR REPLACE INTO sequences VALUES (?, ?)",
+                                    (name, first_id + count))
+        return range(first_id, first_id + count)
+
+    def restore_sequences(self, sequences):
+        # Carry over high-water marks so migrated IDs are never reused
+        with self.lock, self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO sequences VALUES (?, ?)",
+                                        sequences.items())
+
+    # Reads
+
+    def load(self, name):
+        with self.lock:
+            self.refresh()
+            if name == "customers":
+                rows = self.connection.execute("SELECT * FROM customers ORDER BY customer_id")
+                return [self.make_customer(row) for row in rows]
+            if name == "items":
+                rows = self.connection.execute("SELECT * FROM items ORDER BY item_id")
+                return [self.make_item(row) for row in rows]
+            if name == "stock_returns":
+                rows = self.connection.execute("SELECT * FROM stock_returns ORDER BY rental_id")
+                return [self.make_stock_return(row) for row in rows]
+            return self.query_rentals("", ())
+
+    def exists(self, name):
+        with self.lock:
+            return self.connection.execute(f"SELECT 1 FROM {name} LIMIT 1").fetchone() is not None
+
+    def query_rentals(self, where, params):
+        # Both SELECTs read inside one transaction so they see the same
+        # version of the database, even if another terminal commits between
+        # them. (Writers only block readers for the length of their commit;
+        # WAL would avoid even that, but doesn't work on network folders.)
+        started = not self.connection.in_transaction
+        if started:
+            self.connection.execute("BEGIN")
+        try:
+            rows = self.connection.execute(
+                f"SELECT * FROM rentals {where} ORDER BY rental_id", params).fetchall()
+            item_rows = self.connection.execute(
+                f"SELECT * FROM rental_items WHERE rental_id IN "
+                f"(SELECT rental_id FROM rentals {where})", params).fetchall()
+        finally:
+            if started:
+                self.connection.commit()
+        return self.make_rentals(rows, item_rows)
+
+    def load_page(self, name, order, offset, limit, after, descending):
+        # Keyset paging - "after" is compared as a row value against the
+        # same columns the page is ordered by, so the index does the seek
+        columns = PAGE_ORDERS[(name, order)] + [KEY_COLUMNS[name]]
+        direction = " DESC" if descending else ""
+        where = ""
+        params = []
+        if after is not None:
+            where = "WHERE ({}) {} ({})".format(", ".join(columns), "<" if descending else ">",
+                                                ", ".join("?" * len(columns)))
+            params.extend(after)
+        order_by = ", ".join(column + direction for column in columns)
+        tail = f"ORDER BY {order_by} LIMIT ? OFFSET ?"
+        params.extend([limit, offset])
+
+        with self.lock:
+            self.refresh()
+            rows = self.connection.execute(
+                f"SELECT * FROM {name} {where} {tail}", params).fetchall()
+            if name == "customers":
+                return [self.make_customer(row) for row in rows]
+            if name == "items":
+                return [self.make_item(row) for row in rows]
+
+            rental_ids = [row[0] for row in rows]
+            item_rows = self.connection.execute(
+                "SELECT * FROM rental_items WHERE rental_id IN ({})".format(
+                    ", ".join("?" * len(rental_ids))), rental_ids).fetchall()
+            return self.make_rentals(rows, item_rows)
+
+    def get(self, name, key):
+        with self.lock:
+            key_column = KEY_COLUMNS[name]
+            if name == "rentals":
+                rentals = self.query_rentals(f"WHERE {key_column} = ?", (key,))
+                return rentals[0] if rentals else None
+            row = self.connection.execute(
+                f"SELECT * FROM {name} WHERE {key_column} = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if name == "stock_returns":
+                return self.make_stock_return(row)
+            return self.make_customer(row) if name == "customers" else self.make_item(row)
+
+    def rental_conditions(self, customer_id=None, employee=None, item_id=None, start=None, end=None):
+        # Every filter maps onto an indexed column
+        conditions = []
+        params = []
+        if customer_id is not None:
+            conditions.append("customer_id = ?")
+            params.append(customer_id)
+        if employee is not None:
+            conditions.append("employee = ?")
+            params.append(employee)
+        if item_id is not None:
+            conditions.append("rental_id IN (SELECT rental_id FROM rental_items WHERE item_id = ?)")
+            params.append(item_id)
+        if start is not None:
+            conditions.append("end_date >= ?")
+            params.append(date_to_text(start))
+        if end is not None:
+            conditions.append("start_date < ?")
+            params.append(day_after(end))
+        return conditions, params
+
+    def find_rentals(self, customer_id=None, employee=None, item_id=None, start=None, end=None):
+        conditions, params = self.rental_conditions(customer_id, employee, item_id, start, end)
+        where = "WHERE " + " AND ".join(conditions) if conditions else ""
+        with self.lock:
+            return self.query_rentals(where, tuple(params))
+
+    def iter_rentals(self, start=None, end=None, batch_size=BATCH_SIZE):
+        # Rentals overlapping start..end in ID order, fetched batch_size at
+        # a time by seeking past the last ID, so memory stays flat
+        conditions, params = self.rental_conditions(start=start, end=end)
+        conditions.append("rental_id > ?")
+        where = "WHERE " + " AND ".join(conditions)
+        last_id = -1
+        while True:
+            with self.lock:
+                ids = self.connection.execute(
+                    f"SELECT rental_id FROM rentals {where} ORDER BY rental_id LIMIT ?",
+                    params + [last_id, batch_size]).fetchall()
+                if not ids:
+                    return
+                rentals = self.query_rentals(where + " AND rental_id <= ?",
+                                             tuple(params + [last_id, ids[-1][0]]))
+            last_id = ids[-1][0]
+            yield from rentals
+
+    def search_rentals(self, firstname="", surname="", employee=""):
+        # Partial, case-insensitive matches on customer name and employee
+        conditions = []
+        params = []
+        if firstname or surname:
+            conditions.append("customer_id IN (SELECT customer_id FROM customers "
+                              "WHERE firstname LIKE ? AND surname LIKE ?)")
+            params.extend([f"%{firstname}%", f"%{surname}%"])
+        if employee:
+            conditions.append("employee LIKE ?")
+            params.append(f"%{employee}%")
+
+        where = "WHERE " + " AND ".join(conditions) if conditions else ""
+        with self.lock:
+            return self.query_rentals(where, tuple(params))
+
+def batched(records, size=BATCH_SIZE):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def migrate_from_journal_store(journal_store, backend):
+    """Copy every snapshot and journalled change into the SQLite backend.
+
+    Snapshots and the journal are streamed frame by frame, so only one
+    frame is held in memory at a time.
+    Returns the number of rows written per collection.
+    """
+    counts = {}
+    for name, (snapshot_file, _) in journal_store.collections.items():
+        counts[name] = 0
+        with backend.lock, backend.connection:
+            backend.clear(name)
+            for frame in journal_store.iter_snapshot(snapshot_file):
+                for batch in batched(frame):
+                    backend.insert_rows(name, batch)
+                counts[name] += len(frame)
+
+    for ops, _ in journal_store.iter_journal():
+        with backend.lock, backend.connection:
+            for op, name, key, payload in ops:
+                if op == "delete":
+                    backend.delete_rows(name, [key])
+                else:
+                    backend.insert_rows(name, [pickle.loads(payload)])
+                counts[name] = counts.get(name, 0) + 1
+    return counts
+
+# Run this file directly to migrate the pickle data into SQLite
+if __name__ == "__main__":
+    import database_schema as db
+    counts = db.migrate_to_sqlite()
+    for name, count in counts.items():
+        print(f"Migrated {count} {name} records into {db.DATABASE_FILE}")
@@ -0,0 +1,134 @@
+from paging import PAGE_SIZE
+
+# Fetch the next page once the view is scrolled this far down
+PREFETCH_AT = 0.9
+
+class TreePager:
+    """Fills a Treeview one page at a time as the user scrolls down, and
+    keeps changed rows in page order until the rows are sorted on screen."""
+
+    # fetch_page(after, limit) returns (records, cursor) like the
+    # database_schema.load_*_page functions, insert_row(record, index) adds
+    # a row with the record's ID as its iid, and sort_key(record) is the
+    # order the pages come in. Takes over the tree's yscrollcommand.
+    def __init__(self, tree, scrollbar, fetch_page, insert_row, page_size=PAGE_SIZE,
+                 sort_key=None, descending=False):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.fetch_page = fetch_page
+        self.insert_row = insert_row
+        self.page_size = page_size
+        self.sort_key = sort_key
+        self.descending = descending
+        self.cursor = None
+        self.finished = True
+        self.scheduled = False
+        self.paging = False
+        # False once the rows were reordered on screen (see load_all)
+        self.in_order = True
+        # Sort keys of the paged rows in display order, and by iid
+        self.keys = []
+        self.key_of = {}
+        tree.configure(yscrollcommand=self.on_scroll)
+
+    def on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        if float(last) >= PREFETCH_AT and not self.finished and not self.scheduled:
+            self.scheduled = True
+            self.tree.after_idle(self.load_more)
+
+    def clear(self):
+        # Empty the tree and stop paging (e.g. to show search results)
+        for item in self.tree.get_children():
+            self.tree.delete(item)
+        self.cursor = None
+        self.finished = True
+        self.paging = False
+        self.in_order = True
+        self.keys = []
+        self.key_of = {}
+
+    def load_all(self):
+        # Load the remaining pages so the rows can be sorted on screen;
+        # after that changed rows stay where they are and new ones go last
+        while not self.finished:
+            self.load_more()
+        self.in_order = False
+        self.keys = []
+        self.key_of = {}
+
+    def reset(self):
+        # Start again from the first page
+        self.clear()
+        self.finished = False
+        self.paging = True
+        self.load_more()
+
+    def load_more(self):
+        self.scheduled = False
+        if self.finished:
+            return
+        records, self.cursor = self.fetch_page(self.cursor, self.page_size)
+        for record in records:
+            self.insert_row(record, "end")
+            if self.sort_key is not None:
+                key = self.sort_key(record)
+                self.key_of[str(key[-1])] = key
+                self.keys.append(key)
+        self.finished = self.cursor is None
+
+    def apply_change(self, op, key, record):
+        """Update the rows for a change event: op is "insert", "update",
+        "delete" or "reset" (reload the pages). Search results only have
+        their existing rows updated or removed."""
+        if op == "reset":
+            if self.paging:
+                self.reset()
+            return
+
+        iid = str(key)
+        children = self.tree.get_children()
+        index = children.index(iid) if iid in children else None
+        selected = iid in self.tree.selection()
+        if self.tree.exists(iid):
+            self.tree.delete(iid)
+        old_key = self.key_of.pop(iid, None)
+        if old_key is not None:
+            del self.keys[self.position(old_key)]
+        if op == "delete" or record is None:
+            return
+
+        if self.paging and self.in_order and self.sort_key is not None:
+            if not self.place(iid, record):
+                return
+        elif index is not None:
+            self.insert_row(record, index)
+        elif self.paging:
+            self.insert_row(record, "end")
+        else:
+            return
+        if selected:
+            self.tree.selection_add(iid)
+
+    def position(self, key):
+        # Binary search for key's place among the paged rows
+        low, high = 0, len(self.keys)
+        while low < high:
+            middle = (low + high) // 2
+            if (self.keys[middle] > key) if self.descending else (self.keys[middle] < key):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def place(self, iid, record):
+        # Insert a row at its sorted position. Rows sorting after the last
+        # loaded page are left for load_more to fetch.
+        key = self.sort_key(record)
+        index = self.position(key)
+        if index == len(self.keys) and not self.finished:
+            return False
+        self.keys.insert(index, key)
+        self.key_of[iid] = key
+        self.insert_row(record, index)
+        return True
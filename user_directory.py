@@ -0,0 +1,220 @@
+import os
+import pickle
+import threading
+import auth_service
+from auth_service import hash_password
+from concurrency import FileLock
+from journal_store import file_signature
+
+# User data file - {username: {"password_hash", "role", "firstname", "surname"}}
+PASS_HASHED = "passHash.pkl"
+
+DEFAULT_ACCOUNTS = {
+    "admin": ("admin123", "admin"),
+    "employee": ("emp123", "employee"),
+}
+
+class UserDirectory:
+    """The login accounts, cached in memory and read again only when another
+    terminal changes the file."""
+
+    def __init__(self, users_file):
+        self.users_file = users_file
+        self.file_lock = FileLock(users_file + ".lock")
+        self.lock = threading.RLock()
+        self.users = {}
+        self.signature = None
+        self.loaded = False
+        self.by_role = {}
+        self.sorted = {}
+
+    def refresh(self):
+        with self.lock:
+            signature = file_signature(self.users_file)
+            if self.loaded and signature == self.signature:
+                return
+            users = {}
+            if signature is not None:
+                try:
+                    with open(self.users_file, 'rb') as f:
+                        users = pickle.load(f)
+                except:
+                    users = {}
+            self.set_users(users, signature)
+
+    def set_users(self, users, signature):
+        self.users = users
+        self.signature = signature
+        self.loaded = True
+        self.by_role = {}
+        for username, data in users.items():
+            self.by_role.setdefault(data.get("role"), {})[username] = data
+        self.sorted = {}
+
+    def save(self, users):
+        # Call with file_lock held
+        temp_file = self.users_file + ".tmp"
+        with open(temp_file, 'wb') as f:
+            pickle.dump(users, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_file, self.users_file)
+        self.set_users(users, file_signature(self.users_file))
+
+    def change(self, update):
+        """Apply update(users) to a fresh copy of the accounts and save it,
+        unless update returns False. Returns what update returned."""
+        with self.lock, self.file_lock:
+            self.loaded = False
+            self.refresh()
+            users = {username: dict(data) for username, data in self.users.items()}
+            result = update(users)
+            if result is not False:
+                self.save(users)
+            return result
+
+    # Reading
+
+    def get(self, username):
+        with self.lock:
+            self.refresh()
+            data = self.users.get(username)
+            return None if data is None else dict(data)
+
+    def exists(self, username):
+        with self.lock:
+            self.refresh()
+            return username in self.users
+
+    def all_users(self):
+        with self.lock:
+            self.refresh()
+            return {username: dict(data) for username, data in self.users.items()}
+
+    def with_role(self, role, sort_by="username", descending=False):
+        """[(username, record)] for every account with role, ordered by
+        "username" or a record field such as "firstname" (ignoring case)."""
+        with self.lock:
+            self.refresh()
+            entries = self.sorted.get((role, sort_by))
+            if entries is None:
+                def key(entry):
+                    username, data = entry
+                    value = username if sort_by == "username" else data.get(sort_by, "")
+                    return str(value).lower()
+                entries = sorted(self.by_role.get(role, {}).items(), key=key)
+                self.sorted[(role, sort_by)] = entries
+            if descending:
+                entries = entries[::-1]
+            return [(username, dict(data)) for username, data in entries]
+
+    # Writing
+
+    def add(self, username, password, role, **fields):
+        """Add an account; returns False if the username is taken."""
+        # Hashing is slow, so it's done before taking the locks
+        password_hash = hash_password(password)
+        def update(users):
+            if username in users:
+                return False
+            users[username] = dict(fields, password_hash=password_hash, role=role)
+            return True
+        return self.change(update)
+
+    def delete(self, username):
+        """Remove an account; returns False if it doesn't exist."""
+        def update(users):
+            if username not in users:
+                return False
+            del users[username]
+            return True
+        return self.change(update)
+
+    def rename(self, username, new_username):
+        """Move an account to a new username. Returns False if it doesn't
+        exist or the new username is taken."""
+        def update(users):
+            if username not in users or new_username in users:
+                return False
+            users[new_username] = users.pop(username)
+            return True
+        return self.change(update)
+
+    def set_password(self, username, password):
+        """Returns False if the account doesn't exist."""
+        password_hash = hash_password(password)
+        def update(users):
+            if username not in users:
+                return False
+            users[username]["password_hash"] = password_hash
+            return True
+        return self.change(update)
+
+    def upgrade_hash(self, username, old_hash, password):
+        """Re-hash an account's password with the current settings, unless
+        the password was changed since old_hash was read."""
+        password_hash = hash_password(password)
+        def update(users):
+            if users.get(username, {}).get("password_hash") != old_hash:
+                return False
+            users[username]["password_hash"] = password_hash
+            return True
+        return self.change(update)
+
+# The login and employee screens all read the accounts through this copy
+directory = UserDirectory(PASS_HASHED)
+
+def load_users():
+    """Every account, as {username: record} copies."""
+    return directory.all_users()
+
+def get_user(username):
+    return directory.get(username)
+
+def user_exists(username):
+    return directory.exists(username)
+
+def users_with_role(role, sort_by="username", descending=False):
+    return directory.with_role(role, sort_by, descending)
+
+def add_user(username, password, role, **fields):
+    return directory.add(username, password, role, **fields)
+
+def delete_user(username):
+    return directory.delete(username)
+
+def rename_user(username, new_username):
+    return directory.rename(username, new_username)
+
+def set_password(username, password):
+    return directory.set_password(username, password)
+
+def create_default_accounts():
+    # Always ensure the admin and employee accounts exist
+    updated = False
+    for username, (password, role) in DEFAULT_ACCOUNTS.items():
+        if not directory.exists(username) and directory.add(username, password, role):
+            updated = True
+            print(f"{username.capitalize()} account created/updated")
+
+    if updated:
+        print("Default accounts:")
+        print("- Admin: admin / admin123")
+        print("- Employee: employee / emp123")
+    else:
+        print("Default accounts already exist")
+
+def authenticate_user(username, password):
+    """(True, role) if the password matches, else (False, message).
+    Slow - from the Tk thread, run it through auth_service.submit()."""
+    user = directory.get(username)
+    if user is None or not auth_service.verify_password(password, user["password_hash"]):
+        return False, "Invalid username or password"
+    if auth_service.needs_rehash(user["password_hash"]):
+        # Legacy SHA-256 or an older cost setting. The password was right,
+        # so a failed write only means it's upgraded on a later login
+        try:
+            directory.upgrade_hash(username, user["password_hash"], password)
+        except Exception as e:
+            print(f"Error upgrading password hash for {username}: {e}")
+    return True, user["role"]
@@ -0,0 +1,110 @@
+import threading
+import time
+
+# Saves submitted within this many seconds of each other share one flush
+FLUSH_WINDOW = 0.05
+
+class WriteBehindQueue:
+    """Background writer that coalesces queued batches into group commits."""
+
+    def __init__(self, flush, window=FLUSH_WINDOW):
+        # flush is called on the worker thread with a list of batches
+        self.flush = flush
+        self.window = window
+        self.condition = threading.Condition()
+        self.pending = []
+        self.submitted = 0
+        self.flushed = 0
+        self.urgent = False
+        self.paused = False
+        self.error = None
+        self.thread = None
+
+        # Tuning statistics
+        self.flush_count = 0
+        self.max_queue_depth = 0
+        self.last_flush_latency = 0.0
+        self.total_flush_latency = 0.0
+
+    def submit(self, batch):
+        with self.condition:
+            self.pending.append(batch)
+            self.submitted += 1
+            self.max_queue_depth = max(self.max_queue_depth, len(self.pending))
+            self.paused = False
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+            self.condition.notify_all()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.pending or self.paused:
+                    self.condition.wait()
+
+                # Give other saves a short window to join this flush
+                deadline = time.monotonic() + self.window
+                while not self.urgent:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+
+                batches = self.pending
+                self.pending = []
+                self.urgent = False
+
+            started = time.perf_counter()
+            try:
+                self.flush(batches)
+                error = None
+            except Exception as e:
+                print(f"Error flushing writes: {e}")
+                error = e
+            latency = time.perf_counter() - started
+
+            with self.condition:
+                if error:
+                    # Keep the batches and wait for the next submit/barrier
+                    self.pending = batches + self.pending
+                    self.paused = True
+                    self.error = error
+                else:
+                    self.flushed += len(batches)
+                    self.flush_count += 1
+                    self.last_flush_latency = latency
+                    self.total_flush_latency += latency
+                self.condition.notify_all()
+
+    def barrier(self, timeout=None):
+        """Wait until every batch submitted so far has been flushed.
+
+        Returns False on timeout and re-raises the error of a failed flush.
+        """
+        with self.condition:
+            target = self.submitted
+            if self.flushed >= target:
+                return True
+
+            self.urgent = True
+            self.paused = False
+            self.error = None
+            self.condition.notify_all()
+            done = self.condition.wait_for(
+                lambda: self.flushed >= target or self.error is not None, timeout)
+            if self.error is not None:
+                raise self.error
+            return done
+
+    def stats(self):
+        with self.condition:
+            return {
+                "queue_depth": len(self.pending),
+                "unflushed": self.submitted - self.flushed,
+                "max_queue_depth": self.max_queue_depth,
+                "flushes": self.flush_count,
+                "last_flush_ms": self.last_flush_latency * 1000,
+                "avg_flush_ms": (self.total_flush_latency / self.flush_count * 1000
+                                 if self.flush_count else 0.0),
+            }